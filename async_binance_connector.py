@@ -0,0 +1,475 @@
+import asyncio
+import datetime
+import json
+import time
+import uuid
+from configparser import ConfigParser
+from decimal import Decimal
+
+import general_logger
+from async_rest import AsyncRestClient
+from async_streams import AsyncUserDataStream
+from binance_connector import Binance, read_api_keys
+from binance_rest import error_message
+from latency_metrics import latency
+from objects.order import Order
+from trade_reconciler import TradeReconciler
+from user_data_stream import OrderFillTracker
+
+
+class AsyncBinance:
+    """
+    Asyncio variant of the Binance connector. Orders, fills and cancels are coroutines on one event loop, so a slow
+    request of one ticker doesn't hold the messages of the others. Redis calls run in the default executor,
+    exchangeInfo, the trade journal, the Redis client and the rate-limit scheduler are shared with the synchronous
+    connector and created on first use
+    """
+    __orders_side = {
+        "LONG": {"open": "BUY", "close": "SELL"},
+        "SHORT": {"open": "SELL", "close": "BUY"}
+    }
+
+    MARKET_ORDER = "MARKET"
+    STOP_MARKET_ORDER = "STOP_MARKET"
+    TAKE_PROFIT_MARKET_ORDER = "TAKE_PROFIT_MARKET"
+    RETRY_COUNT = 3
+    RECV_WINDOW = 5000
+    FILL_TIMEOUT = 10
+    FILL_STREAM_WAIT = 1
+    FILL_POLL_INTERVAL = 0.5
+
+    config = ConfigParser()
+    config.read("config.ini")
+
+    __rest_client = None
+    __user_data_stream = None
+    __trade_reconciler = None
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.logger = general_logger.get_logger("Binance Connector", self.ticker)
+        self.has_position = False
+        self.leverage = None
+        self.symbol_filters = None
+        self.__fills = None
+        self.__tasks = set()
+
+    @classmethod
+    async def create(cls, ticker: str) -> "AsyncBinance":
+        """
+        Creates the connector and prepares the ticker for trading
+        """
+        bot = cls(ticker)
+        await bot.setup()
+        return bot
+
+    async def setup(self) -> None:
+        user_data_stream = self.get_user_data_stream()
+        user_data_stream.register(self.ticker, self.__profile_info_stream_handler)
+        await user_data_stream.start()
+        self.__fills = user_data_stream.fills
+        await self.__change_margin_type()
+        self.leverage = await self.__set_leverage()
+        self.has_position = await asyncio.to_thread(Binance.get_redis_client().check_open_position, self.ticker)
+        exchange_info = await asyncio.to_thread(Binance.get_exchange_info)
+        self.symbol_filters = await asyncio.to_thread(exchange_info.get, self.ticker)
+        self.get_rest_client().scheduler.configure(exchange_info.rate_limits)
+
+    @classmethod
+    def get_rest_client(cls) -> AsyncRestClient:
+        """
+        Returns the client shared by all connectors, its rate-limit scheduler is the one of the synchronous client
+        """
+        if cls.__rest_client is None:
+            api_key, api_secret = read_api_keys()
+            cls.__rest_client = AsyncRestClient(cls.config['main']['base_url'], api_key, api_secret,
+                                                recv_window=cls.RECV_WINDOW, retry_count=cls.RETRY_COUNT,
+                                                scheduler=Binance.get_rest_client().scheduler)
+        return cls.__rest_client
+
+    @classmethod
+    def get_user_data_stream(cls) -> AsyncUserDataStream:
+        if cls.__user_data_stream is None:
+            cls.__user_data_stream = AsyncUserDataStream(cls.get_rest_client(), cls.config['main']['wss_url'])
+        return cls.__user_data_stream
+
+    @classmethod
+    def get_trade_reconciler(cls) -> TradeReconciler:
+        """
+        Returns the trade reconciler shared by all connectors. It works in its own thread with the synchronous client
+        """
+        if cls.__trade_reconciler is None:
+            cls.__trade_reconciler = TradeReconciler(Binance.get_rest_client(), Binance.get_journal(),
+                                                     cls.get_user_data_stream().trades)
+        return cls.__trade_reconciler
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls.__user_data_stream is not None:
+            await cls.__user_data_stream.stop()
+        if cls.__rest_client is not None:
+            await cls.__rest_client.close()
+
+    async def open_position(self, position: str, quantity: Decimal, take_profit: Decimal, stop_loss: Decimal,
+                            reference_price: Decimal | None = None) -> bool:
+        """
+        Opens a position on the exchange and places Stop-loss and Take-profit orders.
+        :param position: LONG or SHORT
+        :param quantity: The quantity of the asset to be bought or sold
+        :param take_profit: Percentage of price change at which the bot will close the position with a profit
+        :param stop_loss: Percentage of price change at which the bot will close the position and record losses
+        :param reference_price: Expected entry price used to check the minimal notional value of the order
+        :return: True if the position has been opened and protected by Take-profit and Stop-loss orders
+        """
+        quantity = self.symbol_filters.round_quantity(quantity, market=True)
+        if reference_price is not None and not self.symbol_filters.check_notional(reference_price, quantity,
+                                                                                  market=True):
+            self.logger.warning(f"Order of {quantity} {self.ticker} at {reference_price} doesn't pass "
+                                f"the quantity or notional filters. Position won't be opened.")
+            return False
+        open_result = await self.place_order(self.__orders_side[position]['open'], quantity, self.MARKET_ORDER)
+        filled_entry_result, status = await self.__order_handler(open_result)
+        if not status:
+            self.logger.warning("Position haven't been opened.")
+            return False
+        self.has_position = True
+        entry_order = Order(self.ticker, filled_entry_result['orderId'], self.MARKET_ORDER,
+                            position, filled_entry_result['avgPrice'], filled_entry_result['status'],
+                            filled_entry_result['updateTime'])
+
+        if position == "LONG":
+            take_profit_price = Decimal(entry_order.price) * (1 + (take_profit / 100))
+            stop_loss_price = Decimal(entry_order.price) * (1 - (stop_loss / 100))
+        else:
+            take_profit_price = Decimal(entry_order.price) * (1 - (take_profit / 100))
+            stop_loss_price = Decimal(entry_order.price) * (1 + (stop_loss / 100))
+        filtered_take_profit_price = self.symbol_filters.round_price(take_profit_price)
+        filtered_stop_loss_price = self.symbol_filters.round_price(stop_loss_price)
+
+        started = time.perf_counter()
+        tp_result, sl_result = await self.place_protection_orders(self.__orders_side[position]['close'],
+                                                                  filtered_take_profit_price,
+                                                                  filtered_stop_loss_price)
+        latency.since(self.ticker, "protection_orders", started)
+        tp_order = Order(self.ticker, tp_result['orderId'], self.TAKE_PROFIT_MARKET_ORDER,
+                         position, filtered_take_profit_price, tp_result['status'], tp_result['updateTime'])
+        sl_order = Order(self.ticker, sl_result['orderId'], self.STOP_MARKET_ORDER,
+                         position, filtered_stop_loss_price, sl_result['status'], sl_result['updateTime'])
+        started = time.perf_counter()
+        await asyncio.to_thread(self.__save_orders_in_cache, entry_order, tp_order, sl_order)
+        latency.since(self.ticker, "redis_save", started)
+        return True
+
+    async def close_position(self, quantity: Decimal) -> None:
+        """
+        Closes the position partially or completely
+        :param quantity: The amount of asset for which the position should be closed
+        """
+        self.logger.info("Closing position")
+        open_position = await asyncio.to_thread(Binance.get_redis_client().get_order, self.ticker)
+        entry_order = self.__entry_order(open_position)
+        await self.cancel_orders()
+        close_result = await self.place_order(self.__orders_side[entry_order.position]['close'],
+                                              order_type=self.MARKET_ORDER, amount=quantity)
+        filled_close_order, close_status = await self.__order_handler(close_result)
+        if not close_status:
+            self.logger.warning("Position isn't closed.")
+            return None
+        close_order = Order(self.ticker, filled_close_order['orderId'], self.MARKET_ORDER, entry_order.position,
+                            filled_close_order['avgPrice'], filled_close_order['status'],
+                            filled_close_order['updateTime'])
+        await self.__finish_position(open_position, close_order)
+
+    def insert_trade(self, open_position: dict, close_order: Order) -> None:
+        """
+        Puts position information into the journal. Fee and profit are filled in later by the trade reconciler
+        :param open_position: Orders of the position from Redis
+        :param close_order: Position closing order
+        """
+        open_order = self.__entry_order(open_position)
+        data = {
+            "ticker": self.ticker,
+            "open_order_id": open_order.order_id,
+            "position": open_order.position,
+            "open_price": open_order.price,
+            "take_profit_price": open_position['tp_order']['price'],
+            "stop_loss_price": open_position['sl_order']['price'],
+            "close_order_id": close_order.order_id,
+            "close_price": close_order.price,
+            "close_reason": close_order.close_reason if close_order.close_reason is not None else "Change MACD",
+            "fee_amount": None,
+            "profit": None,
+            "open_position_time": datetime.datetime.fromtimestamp(open_order.order_time / 1000),
+            # The journal writes the row later, the column default would take the time of the write
+            "close_position_time": datetime.datetime.fromtimestamp(close_order.order_time / 1000)
+        }
+        started = time.perf_counter()
+        Binance.get_journal().write(data)
+        latency.since(self.ticker, "db_enqueue", started)
+        self.logger.info(f"{data}. Journal queue depth: {Binance.get_journal().depth}")
+        self.get_trade_reconciler().submit(self.ticker, open_order.order_id, open_order.order_time,
+                                           close_order.order_id, close_order.order_time)
+
+    async def __finish_position(self, open_position: dict, close_order: Order) -> None:
+        self.insert_trade(open_position, close_order)
+        self.has_position = False
+        try:
+            await asyncio.to_thread(Binance.get_redis_client().delete_key, self.ticker)
+            self.logger.info(f"Deleting key {self.ticker} from Redis. Status: SUCCESS")
+        except Exception as redis_exception:
+            self.logger.error(f"Deleting key {self.ticker} from Redis. Status: FAILED", exc_info=redis_exception)
+
+    def __entry_order(self, open_position: dict) -> Order:
+        return Order(self.ticker, open_position['entry_order']['order_id'], self.MARKET_ORDER,
+                     open_position['entry_order']['position'], open_position['entry_order']['price'],
+                     open_position['entry_order']['status'], open_position['entry_order']['order_time'])
+
+    def __save_orders_in_cache(self, open_order: Order, tp_order: Order, sl_order: Order) -> None:
+        """
+        Saves open positions to temporary storage (cache), runs in the executor
+        """
+        orders = {}
+        for name, order in (("entry_order", open_order), ("tp_order", tp_order), ("sl_order", sl_order)):
+            orders[name] = {
+                "order_id": order.order_id,
+                "price": str(order.price),
+                "position": order.position,
+                "status": order.status,
+                "order_time": open_order.order_time
+            }
+        try:
+            Binance.get_redis_client().insert_into_db(self.ticker, orders)
+            self.logger.info("Info about orders has been saved in Redis")
+        except Exception as redis_exception:
+            self.logger.warning("Can't save data about orders in Redis. Status: FAILED", exc_info=redis_exception)
+
+    async def __order_handler(self, order: dict) -> tuple[dict | None, bool]:
+        """
+        Waits until the order is filled. The fill is taken from the User Data Stream, order status requests are
+        used only as a fallback until the deadline
+        :param order: Order's info returned on placement
+        :return: Filled order's info and True or None and False if the order hasn't been filled
+        """
+        started = time.perf_counter()
+        deadline = started + self.FILL_TIMEOUT
+        filled_order = order if order.get('status') == "FILLED" else None
+        if filled_order is None:
+            filled_order = await self.__fills.wait_async(order['orderId'], self.FILL_STREAM_WAIT)
+        counter = 0
+        while filled_order is None and time.perf_counter() < deadline:
+            counter += 1
+            self.logger.info(f"Fill hasn't come from the stream. Get order status. Try #{counter}")
+            try:
+                status_result = await self.get_order_status(order['orderId'])
+                if status_result['status'] in OrderFillTracker.FINAL_STATUSES:
+                    filled_order = status_result
+                    break
+            except Exception as binance_exception:
+                self.logger.error("Some error during request order status", exc_info=binance_exception)
+            filled_order = await self.__fills.wait_async(order['orderId'], self.FILL_POLL_INTERVAL)
+        self.__fills.forget(order['orderId'])
+        elapsed = time.perf_counter() - started
+        latency.record(self.ticker, "fill_confirmation", elapsed)
+        if filled_order is not None and filled_order['status'] == "FILLED":
+            self.logger.info(f"Order {order['orderId']} is filled. Confirmation time: {elapsed:.3f} s. "
+                             f"Status requests: {counter}")
+            return filled_order, True
+        self.logger.warning(f"Order {order['orderId']} isn't filled after {elapsed:.3f} s. "
+                            f"Status: {None if filled_order is None else filled_order['status']}")
+        return None, False
+
+    async def __set_leverage(self) -> str:
+        response = await self.get_rest_client().request("POST", "/fapi/v1/leverage",
+                                                        {"symbol": self.ticker, "leverage": 1})
+        if response.status_code != 200:
+            raise ConnectionError(response.text)
+        return response.json()['leverage']
+
+    async def __change_margin_type(self) -> bool | None:
+        response = await self.get_rest_client().request("GET", "/fapi/v2/positionRisk", {"symbol": self.ticker})
+        if response.status_code != 200:
+            raise ConnectionError(response.text)
+        if response.json()[0]['marginType'].upper() != "ISOLATED":
+            response = await self.get_rest_client().request("POST", "/fapi/v1/marginType",
+                                                            {"symbol": self.ticker, "marginType": "ISOLATED"})
+            if response.status_code != 200:
+                raise ConnectionError(response.text)
+            return True
+
+    async def place_protection_orders(self, route: str, take_profit_price: Decimal,
+                                      stop_loss_price: Decimal) -> tuple[dict, dict]:
+        """
+        Places Take-profit and Stop-loss orders with one batch request. Legs rejected by the batch (or all legs if
+        the batch request failed) are placed concurrently one by one
+        :return: Take-profit and Stop-loss orders' info
+        """
+        legs = [(self.TAKE_PROFIT_MARKET_ORDER, take_profit_price), (self.STOP_MARKET_ORDER, stop_loss_price)]
+        batch = [{
+            "symbol": self.ticker,
+            "side": route,
+            "type": order_type,
+            "stopPrice": str(stop_price),
+            "closePosition": "true",
+            "newClientOrderId": self.new_client_order_id()
+        } for order_type, stop_price in legs]
+        try:
+            batch_result = await self.place_batch_orders(batch)
+        except Exception as binance_exception:
+            self.logger.error("Batch of protection orders hasn't been placed", exc_info=binance_exception)
+            # The batch may have reached the exchange before the connection failed
+            batch_result = await asyncio.gather(*(self.__lookup_order(leg["newClientOrderId"]) for leg in batch))
+
+        results = list(batch_result)
+        retries = {}
+        for position, ((order_type, stop_price), leg, leg_result) in enumerate(zip(legs, batch, batch_result)):
+            if 'orderId' not in leg_result:
+                self.logger.warning(f"{order_type} order hasn't been placed by the batch: {leg_result.get('msg')}. "
+                                    f"Placing it separately")
+                retries[position] = self.place_order(route, order_type=order_type, stop_price=stop_price,
+                                                     client_order_id=leg["newClientOrderId"])
+        for position, result in zip(retries, await asyncio.gather(*retries.values())):
+            results[position] = result
+        return results[0], results[1]
+
+    async def place_batch_orders(self, orders: list[dict]) -> list[dict]:
+        response = await self.get_rest_client().request("POST", "/fapi/v1/batchOrders",
+                                                        {"batchOrders": json.dumps(orders, separators=(",", ":"))},
+                                                        orders=len(orders))
+        if response.status_code != 200:
+            self.logger.warning(f"Binance return status code {response.status_code}")
+            self.logger.warning(response.text)
+            raise ConnectionError(error_message(response))
+        response = response.json()
+        self.logger.info("Batch of orders has been handled")
+        self.logger.debug(response)
+        return response
+
+    async def place_order(self, route: str, amount: Decimal | None = None, order_type: str = MARKET_ORDER,
+                          stop_price: Decimal | None = None, client_order_id: str | None = None) -> dict:
+        """
+        Places an order on the exchange with the specified parameters. If the connection fails after the order may
+        have been sent or the exchange replies with 5xx (unknown execution status), the order is looked up by its
+        client order ID and sent again only if the exchange doesn't know it
+        :param route: BUY or SELL
+        :param amount: The quantity of the asset to be bought or sold
+        :param order_type: MARKET_ORDER or STOP_MARKET_ORDER or TAKE_PROFIT_MARKET_ORDER
+        :param stop_price: Trigger price of STOP_MARKET_ORDER or TAKE_PROFIT_MARKET_ORDER, which closes the position
+        :param client_order_id: Client order ID, a new one by default
+        :return: Order's info
+        """
+        params = {
+            "symbol": self.ticker,
+            "side": route,
+            "type": order_type,
+            "newClientOrderId": client_order_id or self.new_client_order_id()
+        }
+        if amount is not None:
+            params['quantity'] = float(Decimal(amount))
+        if stop_price is not None:
+            params['stopPrice'] = str(stop_price)
+            params['closePosition'] = "true"
+        if order_type == self.MARKET_ORDER:
+            params['newOrderRespType'] = "RESULT"
+        started = time.perf_counter()
+        try:
+            response = await self.get_rest_client().request("POST", "/fapi/v1/order", params)
+            if response.status_code >= 500:
+                # The execution status is unknown, the order may have been placed
+                raise ConnectionError(f"Status code {response.status_code}: {error_message(response)}")
+        except ConnectionError as connection_exception:
+            self.logger.warning(f"Order {params['newClientOrderId']} may have been placed. Looking it up",
+                                exc_info=connection_exception)
+            placed_order = await self.find_order(params['newClientOrderId'])
+            if placed_order is not None:
+                self.logger.info(f"Order {placed_order['orderId']} has been placed before the request failed")
+                return placed_order
+            response = await self.get_rest_client().request("POST", "/fapi/v1/order", params)
+        latency.since(self.ticker, "order_request", started)
+        if response.status_code != 200:
+            self.logger.warning(f"Binance return status code {response.status_code}")
+            self.logger.warning(response.text)
+            raise ConnectionError(error_message(response))
+        response = response.json()
+        self.logger.info(f"Order {response.get('orderId')} has been created: {response.get('status')}")
+        self.logger.debug(response)
+        return response
+
+    async def get_order_status(self, order_id: str) -> dict:
+        response = await self.get_rest_client().request("GET", "/fapi/v1/order",
+                                                        {"symbol": self.ticker, "orderId": order_id})
+        if response.status_code != 200:
+            self.logger.warning(f"Binance return status code {response.status_code}")
+            self.logger.warning(response.text)
+            raise ConnectionError(response.text)
+        self.logger.info("Order status was get successfully.")
+        return response.json()
+
+    async def find_order(self, client_order_id: str) -> dict | None:
+        """
+        Request for an order by its client order ID
+        :return: Order's info or None if the exchange doesn't know the order
+        """
+        response = await self.get_rest_client().request("GET", "/fapi/v1/order",
+                                                        {"symbol": self.ticker, "origClientOrderId": client_order_id})
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 400 and response.json().get("code") == -2013:
+            return None
+        raise ConnectionError(response.text)
+
+    async def __lookup_order(self, client_order_id: str) -> dict:
+        """
+        :return: Order's info or an empty dictionary if the order isn't found or the request failed
+        """
+        try:
+            return await self.find_order(client_order_id) or {}
+        except Exception as binance_exception:
+            self.logger.error(f"Order {client_order_id} hasn't been looked up", exc_info=binance_exception)
+            return {}
+
+    @staticmethod
+    def new_client_order_id() -> str:
+        return uuid.uuid4().hex
+
+    async def cancel_orders(self) -> bool:
+        self.logger.info(f"Trying cancel open orders for ticker {self.ticker}")
+        response = await self.get_rest_client().request("DELETE", "/fapi/v1/allOpenOrders", {"symbol": self.ticker})
+        if response.status_code != 200:
+            raise ConnectionError(response.text)
+        self.logger.debug(response.json())
+        return True
+
+    async def __order_update(self, message: dict) -> None:
+        """
+        Closes the position after its Take-profit or Stop-loss order has been filled
+        :param message: ORDER_TRADE_UPDATE event of the ticker
+        """
+        try:
+            open_orders = await asyncio.to_thread(Binance.get_redis_client().get_order, self.ticker)
+            if open_orders is None:
+                return None
+            for name, order_type, reason in (("tp_order", self.TAKE_PROFIT_MARKET_ORDER, "TP"),
+                                             ("sl_order", self.STOP_MARKET_ORDER, "SL")):
+                if message['o']['i'] != open_orders[name]["order_id"]:
+                    continue
+                self.logger.info(f"Close by {'Take profit' if reason == 'TP' else 'Stop loss'}")
+                await self.cancel_orders()
+                close_order = Order(self.ticker, open_orders[name]["order_id"], order_type,
+                                    open_orders[name]["position"], Decimal(message['o']['ap']), "FILLED",
+                                    message['o']['T'], reason)
+                await self.__finish_position(open_orders, close_order)
+        except Exception as binance_exception:
+            self.logger.error("Some error during closing the position by its order", exc_info=binance_exception)
+
+    def __profile_info_stream_handler(self, message: dict) -> None:
+        """
+        Callback function for the User Data Stream, runs on the event loop
+        :param message: Message from the exchange
+        """
+        self.logger.info(f"Order {message['o']['i']} {message['o']['o']} {message['o']['S']}: {message['o']['X']}")
+        self.logger.debug(message)
+        if self.has_position and message['o']['X'] == "FILLED" and \
+                message['o']['o'] in (self.TAKE_PROFIT_MARKET_ORDER, self.STOP_MARKET_ORDER):
+            task = asyncio.get_running_loop().create_task(self.__order_update(message))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
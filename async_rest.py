@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+
+from binance_rest import RequestScheduler, request_cost
+
+
+class RestResponse:
+    """
+    Response read completely by the async client, with the same attributes as requests.Response used by the bot
+    """
+
+    def __init__(self, status_code: int, headers, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncRestClient:
+    """
+    Asyncio client for Binance REST API with the behaviour of SignedRestClient: one session with a pool of keep-alive
+    connections, signing with the prepared HMAC key, server clock offset, retries with backoff and the rate-limit
+    scheduler. The scheduler may be shared with synchronous clients of the process, waiting for it doesn't block
+    the event loop
+    """
+    CLOCK_SYNC_INTERVAL = 600
+
+    def __init__(self, base_url: str, api_key: str | None, api_secret: str | None, recv_window: int = 5000,
+                 retry_count: int = 3, connect_timeout: float = 3.05, read_timeout: float = 10,
+                 pool_size: int = 32, backoff: float = 0.1, max_backoff: float = 2,
+                 scheduler: RequestScheduler | None = None, time_path: str = "/fapi/v1/time"):
+        self.base_url = base_url
+        self.recv_window = recv_window
+        self.retry_count = retry_count
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.headers = {"User-Agent": "futures/1.0"}
+        if api_key:
+            self.headers["X-MBX-APIKEY"] = api_key
+        self.__timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.__pool_size = pool_size
+        self.__session = None
+        self.__hmac = hmac.new(bytes(api_secret or "", "UTF-8"), digestmod=hashlib.sha256)
+        self.__time_path = time_path
+        self.__clock_task = None
+        self.time_offset = 0
+        self.time_rtt = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Session of the running event loop, created on first use
+        """
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.__pool_size, ttl_dns_cache=300)
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=self.__timeout, headers=self.headers)
+        return self.__session
+
+    async def close(self) -> None:
+        if self.__clock_task is not None:
+            self.__clock_task.cancel()
+            self.__clock_task = None
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def sign(self, params: dict) -> str:
+        query = urlencode(params)
+        signature = self.__hmac.copy()
+        signature.update(bytes(query, "UTF-8"))
+        return f"{query}&signature={signature.hexdigest()}"
+
+    async def timestamp(self) -> int:
+        """
+        Current server time in ms estimated with the local clock and the measured offset
+        """
+        if self.__clock_task is None:
+            self.__clock_task = asyncio.get_running_loop().create_task(self.__clock_sync_loop())
+            try:
+                await self.sync_clock()
+            except ConnectionError:
+                pass
+        return int(time.time() * 1000 + self.time_offset)
+
+    async def sync_clock(self, samples: int = 3) -> None:
+        """
+        Measures the offset between the server and the local clock, the sample with the smallest round trip wins
+        """
+        best_rtt = None
+        best_offset = None
+        for _ in range(samples):
+            local_before = time.time() * 1000
+            response = await self.request("GET", self.__time_path, signed=False)
+            local_after = time.time() * 1000
+            if response.status_code != 200:
+                continue
+            rtt = local_after - local_before
+            if best_rtt is None or rtt < best_rtt:
+                best_rtt = rtt
+                best_offset = response.json()["serverTime"] - (local_before + local_after) / 2
+        if best_offset is not None:
+            self.time_offset = best_offset
+            self.time_rtt = best_rtt
+
+    async def __clock_sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.CLOCK_SYNC_INTERVAL)
+            try:
+                await self.sync_clock()
+            except ConnectionError:
+                pass
+
+    async def acquire(self, weight: int, orders: int, priority: int) -> float:
+        """
+        Waits until the scheduler lets the request go
+        :return: Waiting time in seconds
+        """
+        started = time.monotonic()
+        waited = 0
+        while True:
+            wait = self.scheduler.try_acquire(weight, orders, priority, waited)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited = time.monotonic() - started
+
+    async def request(self, method: str, path: str, params: dict | None = None, signed: bool = True,
+                      orders: int | None = None, priority: int | None = None,
+                      headers: dict | None = None) -> RestResponse:
+        """
+        Sends the request, the same parameters and retry rules as SignedRestClient.request
+        :return: Response of the exchange
+        """
+        params = dict(params or {})
+        weight, orders, priority = request_cost(method, path, orders, priority)
+        last_exception = None
+        clock_synced = False
+        for attempt in range(self.retry_count):
+            if attempt > 0:
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            await self.acquire(weight, orders, priority)
+            if signed:
+                params["timestamp"] = await self.timestamp()
+                params["recvWindow"] = self.recv_window
+                query = self.sign(params)
+            else:
+                query = urlencode(params)
+            try:
+                response = await self._send(method, path, query, headers)
+            except aiohttp.ClientConnectorError as connection_exception:
+                # The connection hasn't been established, the request hasn't been sent
+                last_exception = connection_exception
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as connection_exception:
+                last_exception = connection_exception
+                if method == "POST":
+                    break
+                continue
+            self.scheduler.update(response.headers)
+            if response.status_code in (418, 429):
+                self.scheduler.block(float(response.headers.get("Retry-After", 60)))
+                return response
+            if response.status_code == 400 and signed and not clock_synced and '"code":-1021' in response.text:
+                # Timestamp is outside of recvWindow, the clock offset must be measured again
+                clock_synced = True
+                await self.sync_clock()
+                continue
+            if response.status_code >= 500 and method != "POST" and attempt < self.retry_count - 1:
+                continue
+            return response
+        raise ConnectionError(f"Connection error to Binance: {last_exception}")
+
+    async def _send(self, method: str, path: str, query: str, headers: dict | None = None) -> RestResponse:
+        url = f"{self.base_url}{path}"
+        if method in ("POST", "PUT"):
+            headers = {**(headers or {}), "Content-Type": "application/x-www-form-urlencoded"}
+            request = self.session.request(method, url, data=query, headers=headers)
+        else:
+            request = self.session.request(method, f"{url}?{query}" if query else url, headers=headers)
+        async with request as response:
+            return RestResponse(response.status, response.headers, await response.text())
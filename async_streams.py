@@ -0,0 +1,168 @@
+import asyncio
+import json
+
+import aiohttp
+
+import general_logger
+from async_rest import AsyncRestClient
+from user_data_stream import OrderFillTracker, OrderTradesTracker
+
+
+class WebsocketStream:
+    """
+    WebSockets connection which is opened again with exponential backoff after every disconnect, e.g. the daily
+    disconnect of Binance. Messages are decoded and passed to the handler on the event loop, so the handler must
+    not block, longer work is scheduled as tasks
+    """
+
+    def __init__(self, url: str, handler, name: str, max_backoff: float = 30):
+        self.logger = general_logger.get_logger(name, "streams")
+        self.url = url
+        self.name = name
+        self.__handler = handler
+        self.__max_backoff = max_backoff
+        self.__websocket = None
+        self.__stopped = False
+
+    async def run(self) -> None:
+        backoff = 1
+        async with aiohttp.ClientSession() as session:
+            while not self.__stopped:
+                try:
+                    async with session.ws_connect(self.url, autoping=True, max_msg_size=0) as websocket:
+                        self.__websocket = websocket
+                        backoff = 1
+                        self.logger.info(f"{self.name} has been connected")
+                        async for message in websocket:
+                            if message.type == aiohttp.WSMsgType.TEXT:
+                                self.__handle(message.data)
+                            elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                                break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as connection_exception:
+                    self.logger.warning(f"{self.name} connection has failed", exc_info=connection_exception)
+                finally:
+                    self.__websocket = None
+                if self.__stopped:
+                    break
+                self.logger.warning(f"{self.name} has been disconnected. Reconnecting in {backoff} s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.__max_backoff)
+
+    async def reconnect(self, url: str | None = None) -> None:
+        """
+        Closes the current connection, the stream connects again to the new URL
+        """
+        if url is not None:
+            self.url = url
+        if self.__websocket is not None:
+            await self.__websocket.close()
+
+    async def close(self) -> None:
+        self.__stopped = True
+        if self.__websocket is not None:
+            await self.__websocket.close()
+
+    def __handle(self, data: str) -> None:
+        try:
+            self.__handler(json.loads(data))
+        except Exception as handler_exception:
+            self.logger.error(f"Error during handling a message of {self.name}", exc_info=handler_exception)
+
+
+class AsyncUserDataStream:
+    """
+    Asyncio variant of UserDataStream: one listen key, one renewal task and one connection shared by all connectors
+    of the event loop, order events are routed to the connector of their symbol
+    """
+
+    def __init__(self, rest_client: AsyncRestClient, stream_url: str, renew_interval: int = 35 * 60):
+        self.logger = general_logger.get_logger("User Data Stream", "user_data_stream")
+        self.__rest_client = rest_client
+        self.__stream_url = stream_url
+        self.__renew_interval = renew_interval
+        self.__handlers = {}
+        self.__start_lock = asyncio.Lock()
+        self.__stream = None
+        self.__tasks = []
+        self.listen_key = None
+        self.fills = OrderFillTracker()
+        self.trades = OrderTradesTracker()
+        self.__account_updates = general_logger.MessageSampler(self.logger)
+
+    def register(self, symbol: str, handler) -> None:
+        """
+        Routes order events of the symbol to the handler
+        :param symbol: Ticker name
+        :param handler: Callback function for ORDER_TRADE_UPDATE events of the symbol, called on the event loop
+        """
+        self.__handlers[symbol] = handler
+
+    def unregister(self, symbol: str) -> None:
+        self.__handlers.pop(symbol, None)
+
+    async def start(self) -> None:
+        async with self.__start_lock:
+            if self.listen_key is not None:
+                return None
+            self.listen_key = await self.__new_listen_key()
+            self.__stream = WebsocketStream(f"{self.__stream_url}/ws/{self.listen_key}", self.message_handler,
+                                            "User Data Stream")
+            loop = asyncio.get_running_loop()
+            self.__tasks = [loop.create_task(self.__stream.run()), loop.create_task(self.__renew_listen_key())]
+            self.logger.info("User Data Stream have been started")
+
+    async def stop(self) -> None:
+        """
+        Stops the renewal task and the connection and closes the listen key
+        """
+        if self.listen_key is None:
+            return None
+        for task in self.__tasks:
+            task.cancel()
+        await self.__stream.close()
+        response = await self.__rest_client.request("DELETE", "/fapi/v1/listenKey", {"listenKey": self.listen_key},
+                                                    signed=False)
+        if response.status_code != 200:
+            self.logger.warning(f"Listen key hasn't been closed: {response.text}")
+        self.listen_key = None
+        self.logger.info("User Data Stream have been stopped")
+
+    def message_handler(self, message: dict) -> None:
+        """
+        Callback function for WebSockets stream
+        :param message: Message from the exchange
+        """
+        if 'e' not in message.keys():
+            return None
+        if message['e'] == 'ORDER_TRADE_UPDATE':
+            self.fills.update(message['o'])
+            self.trades.update(message['o'])
+            handler = self.__handlers.get(message['o']['s'])
+            if handler is not None:
+                handler(message)
+        elif message['e'] == 'ACCOUNT_UPDATE':
+            self.__account_updates.log(message['e'], message)
+        elif message['e'] == 'listenKeyExpired':
+            self.logger.warning("Listen key has expired. Subscribing with a new one")
+            self.__tasks.append(asyncio.get_running_loop().create_task(self.__resubscribe()))
+
+    async def __new_listen_key(self) -> str:
+        response = await self.__rest_client.request("POST", "/fapi/v1/listenKey", signed=False)
+        if response.status_code != 200:
+            raise ConnectionError(response.text)
+        return response.json()['listenKey']
+
+    async def __resubscribe(self) -> None:
+        self.listen_key = await self.__new_listen_key()
+        await self.__stream.reconnect(f"{self.__stream_url}/ws/{self.listen_key}")
+
+    async def __renew_listen_key(self) -> None:
+        while True:
+            await asyncio.sleep(self.__renew_interval)
+            try:
+                response = await self.__rest_client.request("PUT", "/fapi/v1/listenKey",
+                                                            {"listenKey": self.listen_key}, signed=False)
+                if response.status_code != 200:
+                    self.logger.error(f"Listen key hasn't been renewed: {response.text}")
+            except ConnectionError as binance_exception:
+                self.logger.error("Listen key hasn't been renewed", exc_info=binance_exception)
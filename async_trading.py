@@ -0,0 +1,138 @@
+import asyncio
+import collections
+from configparser import ConfigParser
+from decimal import Decimal
+
+import general_logger
+from async_binance_connector import AsyncBinance
+from async_streams import WebsocketStream
+from latency_metrics import latency
+from trading import Strategy, StrategyRunner
+
+
+class AsyncStrategy(Strategy):
+    """
+    Strategy with AsyncBinance connector. Klines are handled on the event loop, the position workflow of a signal
+    runs as a task, so the klines of other tickers aren't held by its requests. Workflows of one ticker are
+    serialized. The klines cache and the checkpoint are written by a writer task in the default executor, in the
+    order of the klines
+    """
+    bot_class = AsyncBinance
+
+    def __init__(self, ticker: str, bot: AsyncBinance):
+        self.__trade_lock = asyncio.Lock()
+        self.__tasks = set()
+        self.__writes = collections.deque()
+        self.__writer = None
+        super().__init__(ticker, bot)
+
+    def persist(self, kline: dict, checkpoint: dict) -> None:
+        """
+        Queues the kline and the checkpoint for the writer task, the event loop doesn't wait for the file lock or
+        the checkpoint store
+        :param kline: Kline of the stream message
+        :param checkpoint: Checkpoint of make_checkpoint
+        """
+        self.__writes.append((kline, checkpoint))
+        if self.__writer is None or self.__writer.done():
+            self.__writer = asyncio.get_running_loop().create_task(self.__write())
+
+    async def __write(self) -> None:
+        while self.__writes:
+            kline, checkpoint = self.__writes.popleft()
+            try:
+                await asyncio.to_thread(super().persist, kline, checkpoint)
+            except Exception as persist_exception:
+                self.logger.error("Kline and checkpoint haven't been saved", exc_info=persist_exception)
+
+    async def flush(self) -> None:
+        """
+        Waits until the queued klines and checkpoints are written
+        """
+        if self.__writer is not None:
+            await self.__writer
+
+    def macd_analyzer(self):
+        """
+        Analyzes the current MACD value and starts the position workflow if necessary
+        """
+        position = self.position_signal()
+        if position is None:
+            return None
+        latency.since(self.ticker, "signal", self._received_at)
+        self.logger.info(f"Signal for {position}")
+        task = asyncio.get_running_loop().create_task(
+            self.trade(position, self._received_at, Decimal(str(self.cache.close[-1]))))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def trade(self, position: str, received_at: float, reference_price: Decimal) -> None:
+        """
+        Closes the open position and opens a new one
+        :param position: LONG or SHORT
+        :param received_at: perf_counter value of the kline receipt
+        :param reference_price: Closure value of the signal kline
+        """
+        quantity = Decimal(self.macd_config[self.ticker]['token_qty'])
+        async with self.__trade_lock:
+            try:
+                if self._bot.has_position:
+                    self.logger.warning("It have open position already. Change signal without closing position "
+                                        "by TP or SL activate close position by signal change")
+                    await self._bot.close_position(quantity)
+                if not self._bot.has_position:
+                    opened = await self._bot.open_position(position, quantity, self._take_profit, self._stop_loss,
+                                                           reference_price=reference_price)
+                    if opened:
+                        latency.since(self.ticker, "receipt_to_protected", received_at)
+                        self.logger.info("Order have been placed")
+                else:
+                    self.logger.info("Position isn't closed. Can't open new position.")
+            except Exception as binance_exception:
+                self.logger.error("Some error during the position workflow", exc_info=binance_exception)
+
+
+class AsyncStrategyRunner(StrategyRunner):
+    """
+    Runs the strategies of several tickers on one event loop. Klines come over combined streams of up to
+    STREAMS_PER_CONNECTION streams each
+    """
+    STREAMS_PER_CONNECTION = 200
+
+    config = ConfigParser()
+    config.read("config.ini")
+
+    def __init__(self, tickers: list, strategy_class=AsyncStrategy):
+        self.logger = general_logger.get_logger("Strategy Runner", "runner")
+        self.tickers = tickers
+        self.strategy_class = strategy_class
+        self.strategies = {}
+        self.__streams = []
+
+    async def start(self) -> None:
+        """
+        Prepares the connectors concurrently, then loads the start data of the strategies in the default executor
+        """
+        bots = await asyncio.gather(*(self.strategy_class.bot_class.create(ticker) for ticker in self.tickers))
+        await asyncio.to_thread(self.strategy_class.get_klines_cache)
+        await asyncio.to_thread(self.strategy_class.get_checkpoint_store)
+        strategies = await asyncio.gather(*(asyncio.to_thread(self.strategy_class, ticker, bot)
+                                            for ticker, bot in zip(self.tickers, bots)))
+        for strategy in strategies:
+            self.strategies[strategy.stream_name] = strategy
+        self.logger.info(f"Strategies have been started for {len(self.strategies)} tickers")
+
+    async def run(self) -> None:
+        await self.start()
+        streams = list(self.strategies.keys())
+        for position in range(0, len(streams), self.STREAMS_PER_CONNECTION):
+            names = "/".join(streams[position:position + self.STREAMS_PER_CONNECTION])
+            self.__streams.append(WebsocketStream(f"{self.config['main']['wss_url_spot']}/stream?streams={names}",
+                                                  self.message_handler, "Klines Stream"))
+        try:
+            await asyncio.gather(*(stream.run() for stream in self.__streams))
+        finally:
+            for stream in self.__streams:
+                await stream.close()
+            await asyncio.gather(*(strategy.flush() for strategy in self.strategies.values()))
+            await self.strategy_class.bot_class.close()
@@ -0,0 +1,61 @@
+import datetime
+import json
+
+import click
+
+from backtesting.engine import Backtester, Klines, summarize, trades_frame
+from databases_connectors.klines_cache import KlinesCache
+from databases_connectors.klines_db import DatabaseConnector
+
+
+def read_macd_config() -> dict:
+    with open("configs/macd_config.json", "r") as config_file:
+        macd_config = json.load(config_file)
+    return macd_config
+
+
+def to_timestamp(date: str | None) -> int | None:
+    if date is None:
+        return None
+    return int(datetime.datetime.strptime(date, "%Y-%m-%d").timestamp() * 1000)
+
+
+def load_klines(ticker: str, ts_start: int | None = None, ts_finish: int | None = None,
+                duration: str = "1m") -> Klines:
+    """
+    Loads the stored klines of the ticker into column arrays. The arrays are views of the local klines cache, which
+    is updated from the database first
+    :param ticker: Ticker name
+    :param ts_start: Start of the period in ms
+    :param ts_finish: End of the period in ms
+    :param duration: Klines duration
+    :return: Loaded klines
+    """
+    columns = KlinesCache(DatabaseConnector()).select(ticker, ts_start, ts_finish, duration)
+    return Klines(columns["open_time"], columns["open"], columns["high"], columns["low"], columns["close"],
+                  columns["close_time"])
+
+
+@click.command()
+@click.argument("ticker")
+@click.option("--start", default=None, help="Start date, YYYY-MM-DD")
+@click.option("--finish", default=None, help="End date, YYYY-MM-DD")
+@click.option("--base-interval", default="1m", help="Interval of the klines stored in the database")
+@click.option("--fee-rate", default=0.0004, help="Commission rate for every order")
+@click.option("--output", default=None, help="CSV file for the simulated trades")
+def run(ticker, start, finish, base_interval, fee_rate, output):
+    ticker = ticker.upper()
+    config = read_macd_config()[ticker]
+    klines = load_klines(ticker, to_timestamp(start), to_timestamp(finish), base_interval)
+    klines = klines.resample(config["klines_duration"], base_interval)
+    trades = Backtester(klines).run(int(config["fast_ma"]), int(config["slow_ma"]), int(config["signal"]),
+                                    float(config["take_profit"]), float(config["stop_loss"]),
+                                    float(config["token_qty"]), fee_rate)
+    for key, value in summarize(trades).items():
+        click.echo(f"{key}: {value}")
+    if output is not None:
+        trades_frame(ticker, klines, trades).to_csv(output, index=False)
+
+
+if __name__ == "__main__":
+    run()
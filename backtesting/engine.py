@@ -0,0 +1,228 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from indicators.ema import macd_histogram
+from objects.intervals import INTERVALS_MS
+
+LONG = 1
+SHORT = -1
+EXIT_TP = 0
+EXIT_SL = 1
+EXIT_SIGNAL = 2
+CLOSE_REASONS = np.array(["TP", "SL", "Change MACD"])
+
+TRADE_COLUMNS = ["ticker", "open_order_id", "position", "open_price", "take_profit_price", "stop_loss_price",
+                 "close_order_id", "close_price", "close_reason", "fee_amount", "profit", "open_position_time",
+                 "close_position_time"]
+
+
+class Klines:
+    """
+    Column arrays of klines sorted by open time
+    """
+
+    def __init__(self, open_time: np.ndarray, open_price: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, close_time: np.ndarray):
+        self.open_time = np.ascontiguousarray(open_time, dtype=np.int64)
+        self.open = np.ascontiguousarray(open_price, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.close_time = np.ascontiguousarray(close_time, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.open_time.shape[0]
+
+    def resample(self, interval: str, base_interval: str = "1m") -> "Klines":
+        """
+        Aggregates klines into klines of a longer interval. The last kline is dropped if it isn't complete yet
+        :param interval: Target interval, e.g. 1h
+        :param base_interval: Interval of the stored klines
+        :return: Aggregated klines
+        """
+        interval_ms = INTERVALS_MS[interval]
+        if interval_ms == INTERVALS_MS[base_interval] or len(self) == 0:
+            return self
+        bucket = self.open_time // interval_ms
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(self)] - 1
+        high = np.maximum.reduceat(self.high, starts)
+        low = np.minimum.reduceat(self.low, starts)
+        count = starts.shape[0]
+        if self.close_time[-1] < (bucket[-1] + 1) * interval_ms - 1:
+            count -= 1
+        open_time = bucket[starts[:count]] * interval_ms
+        return Klines(open_time, self.open[starts[:count]], high[:count], low[:count], self.close[ends[:count]],
+                      open_time + interval_ms - 1)
+
+
+def crossover_signals(hist: np.ndarray, warmup: int = 0) -> tuple:
+    """
+    Finds the MACD histogram zero crossings exactly like Strategy.macd_analyzer does
+    :param hist: Array of MACD histogram values
+    :param warmup: Number of first klines in which the signals are ignored
+    :return: Indexes of klines on which the signals appear and their directions (LONG or SHORT)
+    """
+    previous = hist[:-1]
+    current = hist[1:]
+    long_signal = (previous < 0) & (current >= 0)
+    short_signal = (previous > 0) & (current <= 0)
+    indexes = np.flatnonzero(long_signal | short_signal) + 1
+    indexes = indexes[indexes >= warmup]
+    directions = np.where(long_signal[indexes - 1], LONG, SHORT).astype(np.int8)
+    return indexes, directions
+
+
+def simulate(klines: Klines, signal_indexes: np.ndarray, directions: np.ndarray, take_profit: float,
+             stop_loss: float, quantity: float = 1, fee_rate: float = 0.0004) -> dict:
+    """
+    Simulates trades opened at the close of every signal kline. A position is closed by take-profit or stop-loss
+    (checked with high/low of the following klines, stop-loss wins if both are hit inside one kline) or by the next
+    signal. As every signal opens a new position, trades are independent and are simulated without a loop
+    :param klines: Klines the signals were calculated on
+    :param signal_indexes: Indexes of the signal klines
+    :param directions: LONG or SHORT for every signal
+    :param take_profit: Percentage of price change for take-profit
+    :param stop_loss: Percentage of price change for stop-loss
+    :param quantity: The quantity of the asset in every trade
+    :param fee_rate: Commission rate charged on both entry and exit
+    :return: Dictionary of trade arrays
+    """
+    length = len(klines)
+    entry_price = klines.close[signal_indexes]
+    take_profit_price = entry_price * (1 + directions * take_profit / 100)
+    stop_loss_price = entry_price * (1 - directions * stop_loss / 100)
+
+    last_bar = np.r_[signal_indexes[1:], length - 1] if signal_indexes.shape[0] else signal_indexes
+    lengths = last_bar - signal_indexes
+    total = int(lengths.sum())
+    first_offsets = np.full(signal_indexes.shape[0], total, dtype=np.int64)
+    if total:
+        segment = np.repeat(np.arange(signal_indexes.shape[0]), lengths)
+        segment_starts = np.cumsum(lengths) - lengths
+        offsets = np.arange(total) - np.repeat(segment_starts, lengths)
+        bars = signal_indexes[segment] + 1 + offsets
+        is_long = directions[segment] == LONG
+        high = klines.high[bars]
+        low = klines.low[bars]
+        hit_take_profit = np.where(is_long, high >= take_profit_price[segment], low <= take_profit_price[segment])
+        hit_stop_loss = np.where(is_long, low <= stop_loss_price[segment], high >= stop_loss_price[segment])
+        candidates = np.where(hit_take_profit | hit_stop_loss, offsets, total)
+        not_empty = lengths > 0
+        first_offsets[not_empty] = np.minimum.reduceat(candidates, segment_starts[not_empty])
+
+    hit = first_offsets < total
+    exit_bar = np.where(hit, signal_indexes + 1 + first_offsets, last_bar)
+    is_long = directions == LONG
+    exit_open = klines.open[exit_bar]
+    stop_loss_hit = hit & np.where(is_long, klines.low[exit_bar] <= stop_loss_price,
+                                   klines.high[exit_bar] >= stop_loss_price)
+    reason = np.where(hit, np.where(stop_loss_hit, EXIT_SL, EXIT_TP), EXIT_SIGNAL)
+    # A kline which opens beyond the trigger price fills the market order at its open
+    stop_loss_fill = np.where(is_long, np.minimum(stop_loss_price, exit_open), np.maximum(stop_loss_price, exit_open))
+    take_profit_fill = np.where(is_long, np.maximum(take_profit_price, exit_open),
+                                np.minimum(take_profit_price, exit_open))
+    exit_price = np.select([reason == EXIT_SL, reason == EXIT_TP], [stop_loss_fill, take_profit_fill],
+                           klines.close[exit_bar])
+
+    # The position opened by the last signal without TP or SL is still open
+    closed = hit | (np.arange(signal_indexes.shape[0]) < signal_indexes.shape[0] - 1)
+    fee = fee_rate * quantity * (entry_price + exit_price)
+    profit = directions * (exit_price - entry_price) * quantity - fee
+    return {
+        "entry_bar": signal_indexes[closed],
+        "exit_bar": exit_bar[closed],
+        "direction": directions[closed],
+        "entry_price": entry_price[closed],
+        "take_profit_price": take_profit_price[closed],
+        "stop_loss_price": stop_loss_price[closed],
+        "exit_price": exit_price[closed],
+        "reason": reason[closed],
+        "fee": fee[closed],
+        "profit": profit[closed]
+    }
+
+
+def summarize(trades: dict) -> dict:
+    """
+    Calculates the main statistics of simulated trades
+    :param trades: Result of simulate
+    :return: Dictionary of statistics
+    """
+    profit = trades["profit"]
+    count = profit.shape[0]
+    if count == 0:
+        return {"trades": 0, "profit": 0.0, "win_rate": 0.0, "profit_factor": 0.0, "max_drawdown": 0.0,
+                "fee": 0.0}
+    equity = np.cumsum(profit)
+    drawdown = np.maximum.accumulate(np.r_[0.0, equity])[1:] - equity
+    gains = profit[profit > 0].sum()
+    losses = -profit[profit < 0].sum()
+    return {
+        "trades": count,
+        "profit": float(equity[-1]),
+        "win_rate": float((profit > 0).mean()),
+        "profit_factor": float(gains / losses) if losses > 0 else float("inf"),
+        "max_drawdown": float(drawdown.max()),
+        "fee": float(trades["fee"].sum())
+    }
+
+
+def trades_frame(ticker: str, klines: Klines, trades: dict) -> pd.DataFrame:
+    """
+    Converts simulated trades to the rows of the trading table
+    :param ticker: Ticker name
+    :param klines: Klines the trades were simulated on
+    :param trades: Result of simulate
+    :return: DataFrame with the columns of the trading table
+    """
+    def to_datetime(timestamps: np.ndarray) -> list:
+        return [datetime.datetime.fromtimestamp((int(ts) + 1) / 1000) for ts in timestamps]
+
+    frame = pd.DataFrame({
+        "ticker": ticker,
+        "open_order_id": None,
+        "position": np.where(trades["direction"] == LONG, "LONG", "SHORT"),
+        "open_price": trades["entry_price"],
+        "take_profit_price": trades["take_profit_price"],
+        "stop_loss_price": trades["stop_loss_price"],
+        "close_order_id": None,
+        "close_price": trades["exit_price"],
+        "close_reason": CLOSE_REASONS[trades["reason"]],
+        "fee_amount": trades["fee"],
+        "profit": trades["profit"],
+        "open_position_time": to_datetime(klines.close_time[trades["entry_bar"]]),
+        "close_position_time": to_datetime(klines.close_time[trades["exit_bar"]])
+    }, columns=TRADE_COLUMNS)
+    return frame
+
+
+class Backtester:
+    """
+    Vectorized backtest of the MACD strategy over stored klines
+    """
+
+    def __init__(self, klines: Klines):
+        self.klines = klines
+
+    def run(self, fast_period: int, slow_period: int, signal_period: int, take_profit: float, stop_loss: float,
+            quantity: float = 1, fee_rate: float = 0.0004, warmup: int | None = None) -> dict:
+        """
+        Calculates MACD over the klines and simulates the trades
+        :param fast_period: Period of short EMA
+        :param slow_period: Period of long EMA
+        :param signal_period: Signal value for EMA
+        :param take_profit: Percentage of price change for take-profit
+        :param stop_loss: Percentage of price change for stop-loss
+        :param quantity: The quantity of the asset in every trade
+        :param fee_rate: Commission rate charged on both entry and exit
+        :param warmup: Number of first klines in which the signals are ignored
+        :return: Dictionary of trade arrays
+        """
+        if warmup is None:
+            warmup = slow_period + signal_period
+        hist = macd_histogram(self.klines.close, fast_period, slow_period, signal_period)
+        signal_indexes, directions = crossover_signals(hist, warmup)
+        return simulate(self.klines, signal_indexes, directions, take_profit, stop_loss, quantity, fee_rate)
@@ -0,0 +1,161 @@
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+from backtesting.engine import Klines, crossover_signals, simulate, summarize
+from indicators.ema import ema, ema_batch
+
+RESULT_COLUMNS = ["klines_duration", "fast_ma", "slow_ma", "signal", "take_profit", "stop_loss", "trades", "profit",
+                  "win_rate", "profit_factor", "max_drawdown", "fee"]
+# Attributes of Klines in the order of its constructor arguments
+KLINES_COLUMNS = ("open_time", "open", "high", "low", "close", "close_time")
+
+_worker_arrays = {}
+_worker_blocks = []
+_worker_settings = {}
+
+
+class SharedArrays:
+    """
+    NumPy arrays placed in shared memory blocks, so worker processes attach to them instead of receiving copies
+    """
+
+    def __init__(self):
+        self.layout = {}
+        self.__blocks = []
+
+    def add(self, name: str, array: np.ndarray) -> None:
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        self.__blocks.append(block)
+        self.layout[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self) -> None:
+        for block in self.__blocks:
+            block.close()
+            block.unlink()
+        self.__blocks = []
+
+    @staticmethod
+    def attach(layout: dict) -> tuple:
+        """
+        Opens the shared memory blocks described by the layout
+        :param layout: Layout of the owner process
+        :return: Dictionary of arrays and the list of opened blocks, which must stay referenced
+        """
+        arrays = {}
+        blocks = []
+        for name, (block_name, shape, dtype) in layout.items():
+            block = SharedMemory(name=block_name)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            blocks.append(block)
+        return arrays, blocks
+
+
+def parse_values(values: str, value_type: type = int) -> list:
+    """
+    Parses a comma separated list or a start:stop:step range (stop included)
+    :param values: String with values, e.g. "8,12,16" or "8:16:2"
+    :param value_type: int or float
+    :return: List of values
+    """
+    if ":" in values:
+        start, stop, step = [value_type(value) for value in values.split(":")]
+        count = int(round((stop - start) / step)) + 1
+        return [value_type(round(start + step * index, 10)) for index in range(count)]
+    return [value_type(value) for value in values.split(",")]
+
+
+def _init_worker(layout: dict, settings: dict) -> None:
+    global _worker_arrays, _worker_blocks, _worker_settings
+    _worker_arrays, _worker_blocks = SharedArrays.attach(layout)
+    _worker_settings = settings
+
+
+def _evaluate(task: tuple) -> list:
+    """
+    Evaluates one MACD setting with every take-profit and stop-loss pair.
+    The fast and slow EMAs are shared between all tasks of the same klines duration
+    """
+    duration, fast_period, slow_period, signal_period = task
+    arrays = _worker_arrays
+    periods = _worker_settings["periods"]
+    emas = arrays[f"{duration}/ema"]
+    klines = Klines(*(arrays[f"{duration}/{column}"] for column in KLINES_COLUMNS))
+    macd_line = emas[periods.index(fast_period)] - emas[periods.index(slow_period)]
+    hist = macd_line - ema(macd_line, signal_period)
+    signal_indexes, directions = crossover_signals(hist, slow_period + signal_period)
+    results = []
+    for take_profit, stop_loss in _worker_settings["exits"]:
+        trades = simulate(klines, signal_indexes, directions, take_profit, stop_loss, _worker_settings["quantity"],
+                          _worker_settings["fee_rate"])
+        stats = summarize(trades)
+        results.append([duration, fast_period, slow_period, signal_period, take_profit, stop_loss] +
+                       [stats[column] for column in RESULT_COLUMNS[6:]])
+    return results
+
+
+class ParameterSweep:
+    """
+    Evaluates a grid (or a random part of it) of MACD settings over stored klines in a process pool
+    """
+
+    def __init__(self, klines: Klines, base_interval: str = "1m", quantity: float = 1, fee_rate: float = 0.0004):
+        self.klines = klines
+        self.base_interval = base_interval
+        self.quantity = quantity
+        self.fee_rate = fee_rate
+
+    def run(self, durations: list, fast_periods: list, slow_periods: list, signal_periods: list,
+            take_profits: list, stop_losses: list, samples: int | None = None, workers: int | None = None,
+            seed: int = 0) -> pd.DataFrame:
+        """
+        Runs the sweep
+        :param durations: Klines durations, e.g. ["1h", "4h"]
+        :param fast_periods: Periods of short EMA
+        :param slow_periods: Periods of long EMA
+        :param signal_periods: Signal values for EMA
+        :param take_profits: Percentages of price change for take-profit
+        :param stop_losses: Percentages of price change for stop-loss
+        :param samples: Number of randomly chosen MACD settings, the whole grid is used if None
+        :param workers: Number of worker processes
+        :param seed: Seed of the random search
+        :return: DataFrame with statistics for every evaluated combination
+        """
+        tasks = [(duration, fast, slow, signal)
+                 for duration, fast, slow, signal in itertools.product(durations, fast_periods, slow_periods,
+                                                                       signal_periods)
+                 if fast < slow]
+        if samples is not None and samples < len(tasks):
+            tasks = random.Random(seed).sample(tasks, samples)
+        periods = sorted(set(fast_periods) | set(slow_periods))
+        settings = {
+            "periods": periods,
+            "exits": list(itertools.product(take_profits, stop_losses)),
+            "quantity": self.quantity,
+            "fee_rate": self.fee_rate
+        }
+
+        shared = SharedArrays()
+        try:
+            for duration in sorted({task[0] for task in tasks}):
+                klines = self.klines.resample(duration, self.base_interval)
+                for column in KLINES_COLUMNS:
+                    shared.add(f"{duration}/{column}", getattr(klines, column))
+                shared.add(f"{duration}/ema", ema_batch(klines.close, periods))
+            workers = workers or os.cpu_count()
+            chunk_size = max(1, len(tasks) // (workers * 8))
+            rows = []
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shared.layout, settings)) as executor:
+                for result in executor.map(_evaluate, tasks, chunksize=chunk_size):
+                    rows.extend(result)
+        finally:
+            shared.close()
+        return pd.DataFrame(rows, columns=RESULT_COLUMNS)
@@ -0,0 +1,53 @@
+import time
+
+import click
+import numpy as np
+
+from indicators.ema import ema, ema_batch
+
+
+def loop_ema(close: np.ndarray, period: int) -> np.ndarray:
+    """
+    Reference per-element EMA, the way Strategy.ema calculated it before the vectorized kernel
+    """
+    alpha = 2 / (period + 1)
+    ema_calc = np.zeros_like(close)
+    ema_calc[0] = float(close[0])
+    for i in range(1, close.shape[0]):
+        ema_calc[i] = alpha * float(close[i]) + (1 - alpha) * float(ema_calc[i - 1])
+    return ema_calc.astype(float)
+
+
+def measure(function, *args, repeat: int = 1) -> tuple:
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+@click.command()
+@click.option("--sizes", default="1000,100000,10000000", help="Comma separated lengths of the series")
+@click.option("--period", default=26, help="EMA period")
+@click.option("--batch-periods", default="9,12,26,50,100,200", help="Periods for the batch EMA")
+@click.option("--repeat", default=3, help="Number of runs, the best one is reported")
+def run(sizes, period, batch_periods, repeat):
+    batch_periods = [int(value) for value in batch_periods.split(",")]
+    rng = np.random.default_rng(0)
+    click.echo(f"{'points':>10} {'loop, s':>10} {'vector, s':>10} {'speedup':>8} {'max rel err':>12} "
+               f"{'batch x' + str(len(batch_periods)) + ', s':>14}")
+    for size in [int(value) for value in sizes.split(",")]:
+        close = 100 + np.cumsum(rng.normal(0, 0.1, size))
+        loop_time, expected = measure(loop_ema, close, period, repeat=1 if size > 100000 else repeat)
+        vector_time, calculated = measure(ema, close, period, repeat=repeat)
+        batch_time, _ = measure(ema_batch, close, batch_periods, repeat=repeat)
+        error = float(np.max(np.abs(calculated - expected) / np.abs(expected)))
+        click.echo(f"{size:>10} {loop_time:>10.4f} {vector_time:>10.4f} {loop_time / vector_time:>8.1f} "
+                   f"{error:>12.2e} {batch_time:>14.4f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,207 @@
+import json
+import logging
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import click
+import numpy as np
+
+from databases_connectors.klines_cache import KlinesCache
+from objects.intervals import INTERVALS_MS
+from objects.kline_buffer import KlineBuffer
+from trading import Strategy, StrategyRunner
+
+
+class StubBinance:
+    """
+    Connector without the exchange, positions are opened and closed instantly
+    """
+    instances = []
+
+    def __init__(self, ticker: str):
+        self.ticker = ticker
+        self.has_position = False
+        self.opened = 0
+        self.closed = 0
+        self.instances.append(self)
+
+    def open_position(self, position, quantity, take_profit, stop_loss, reference_price=None) -> bool:
+        self.has_position = True
+        self.opened += 1
+        return True
+
+    def close_position(self, quantity) -> None:
+        self.has_position = False
+        self.closed += 1
+
+
+class StubCheckpointStore:
+    def __init__(self):
+        self.checkpoints = {}
+
+    def save_checkpoint(self, name: str, data: dict) -> None:
+        self.checkpoints[name] = data
+
+    def load_checkpoint(self, name: str) -> dict | None:
+        return None
+
+
+class ReplayStrategy(Strategy):
+    """
+    Strategy with stub connectors. Start data is a synthetic random walk, the klines cache is a temporary directory
+    """
+    bot_class = StubBinance
+    replay_config = {}
+    replay_klines_cache = None
+    replay_checkpoint_store = StubCheckpointStore()
+    history_seed = 0
+
+    @staticmethod
+    def read_macd_config():
+        return ReplayStrategy.replay_config
+
+    @classmethod
+    def get_klines_cache(cls) -> KlinesCache:
+        return cls.replay_klines_cache
+
+    @classmethod
+    def get_checkpoint_store(cls):
+        return cls.replay_checkpoint_store
+
+    def get_start_data(self) -> KlineBuffer:
+        config = self.macd_config[self.ticker]
+        history_length = int(config.get("history_length", self.HISTORY_LENGTH))
+        interval_ms = INTERVALS_MS[config["klines_duration"]]
+        rng = np.random.default_rng(ReplayStrategy.history_seed)
+        ReplayStrategy.history_seed += 1
+        open_time = np.arange(-history_length, 0, dtype=np.int64) * interval_ms
+        close = config.get("start_price", 100.0) * np.exp(np.cumsum(rng.normal(0, 0.002, history_length)))
+        buffer = KlineBuffer(history_length)
+        buffer.extend(open_time, close, open_time + interval_ms - 1)
+        return buffer
+
+
+def ticker_config(duration: str) -> dict:
+    return {"fast_ma": 12, "slow_ma": 26, "signal": 9, "token_qty": 1, "stop_loss": 1, "take_profit": 3,
+            "klines_duration": duration}
+
+
+def synthetic_messages(tickers: list, klines: int, duration: str, seed: int = 1):
+    """
+    Generates closed klines of every ticker in the combined stream format, one kline of every ticker per interval
+    """
+    rng = np.random.default_rng(seed)
+    interval_ms = INTERVALS_MS[duration]
+    prices = np.full(len(tickers), 100.0)
+    for step in range(klines):
+        open_time = step * interval_ms
+        returns = np.exp(rng.normal(0, 0.002, len(tickers)))
+        for position, ticker in enumerate(tickers):
+            open_price = prices[position]
+            prices[position] = open_price * returns[position]
+            yield {
+                "stream": f"{ticker.lower()}@kline_{duration}",
+                "data": {
+                    "e": "kline",
+                    "s": ticker,
+                    "k": {
+                        "t": open_time,
+                        "T": open_time + interval_ms - 1,
+                        "s": ticker,
+                        "i": duration,
+                        "o": f"{open_price:.8f}",
+                        "c": f"{prices[position]:.8f}",
+                        "h": f"{max(open_price, prices[position]):.8f}",
+                        "l": f"{min(open_price, prices[position]):.8f}",
+                        "v": "1.0",
+                        "x": True
+                    }
+                }
+            }
+
+
+def recorded_messages(path: str):
+    """
+    Reads messages saved one per line, either combined stream messages or kline events of one stream
+    """
+    with open(path, "r") as recorded_file:
+        for line in recorded_file:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if "stream" not in message:
+                kline = message["k"]
+                message = {"stream": f"{kline['s'].lower()}@kline_{kline['i']}", "data": message}
+            yield message
+
+
+@click.command()
+@click.option("--tickers", default=100, help="Number of synthetic tickers")
+@click.option("--klines", default=200, help="Number of synthetic klines of every ticker")
+@click.option("--duration", default="1h", help="Klines duration of the synthetic stream")
+@click.option("--recorded", default=None, help="JSON lines file with recorded kline messages instead of synthetic")
+@click.option("--rate", default=0.0, help="Events per second, 0 - as fast as possible")
+@click.option("--history", default=1000, help="Number of klines in the start data of every strategy")
+@click.option("--log/--no-log", default=False, help="Keep logging of the strategies")
+@click.option("--trace-memory", is_flag=True, help="Measure peak Python allocations, slows the replay down")
+def run(tickers, klines, duration, recorded, rate, history, log, trace_memory):
+    if not log:
+        logging.disable(logging.WARNING)
+    if recorded is not None:
+        messages = list(recorded_messages(recorded))
+        names = sorted({message["data"]["k"]["s"] for message in messages})
+        durations = {message["data"]["k"]["s"]: message["data"]["k"]["i"] for message in messages}
+    else:
+        names = [f"SYN{index:04d}USDT" for index in range(tickers)]
+        durations = {name: duration for name in names}
+        messages = list(synthetic_messages(names, klines, duration))
+    ReplayStrategy.replay_config = {name: dict(ticker_config(durations[name]), history_length=history)
+                                    for name in names}
+    # Messages have to be newer than the synthetic start data, recorded times are moved accordingly
+    first_open_time = min(message["data"]["k"]["t"] for message in messages)
+    for message in messages:
+        message["data"]["k"]["t"] -= first_open_time
+        message["data"]["k"]["T"] -= first_open_time
+
+    with tempfile.TemporaryDirectory() as directory:
+        ReplayStrategy.replay_klines_cache = KlinesCache(None, directory)
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        runner = StrategyRunner(names, ReplayStrategy)
+        setup_time = time.perf_counter() - started
+
+        latencies = np.zeros(len(messages))
+        started = time.perf_counter()
+        for position, message in enumerate(messages):
+            if rate > 0:
+                delay = started + position / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            event_started = time.perf_counter()
+            runner.message_handler(message)
+            latencies[position] = time.perf_counter() - event_started
+        elapsed = time.perf_counter() - started
+        if trace_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    opened = sum(bot.opened for bot in StubBinance.instances)
+    closed = sum(bot.closed for bot in StubBinance.instances)
+    percentiles = np.percentile(latencies, [50, 90, 99, 99.9]) * 1e6
+    click.echo(f"tickers: {len(names)}, events: {len(messages)}, setup: {setup_time:.2f} s")
+    click.echo(f"events/s: {len(messages) / elapsed:.0f} (busy {latencies.sum() / elapsed * 100:.0f}%)")
+    click.echo(f"latency, us: p50 {percentiles[0]:.1f}, p90 {percentiles[1]:.1f}, p99 {percentiles[2]:.1f}, "
+               f"p99.9 {percentiles[3]:.1f}, max {latencies.max() * 1e6:.1f}")
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if trace_memory:
+        click.echo(f"peak traced memory: {peak_memory / 2 ** 20:.1f} MB, max RSS: {max_rss:.1f} MB")
+    else:
+        click.echo(f"max RSS: {max_rss:.1f} MB")
+    click.echo(f"positions opened: {opened}, closed: {closed}")
+
+
+if __name__ == "__main__":
+    run()
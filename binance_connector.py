@@ -1,29 +1,39 @@
 import datetime
-import hashlib
-import hmac
-import logging
+import json
 import time
+import uuid
 from configparser import ConfigParser
 from decimal import Decimal
-from threading import Event, Thread
-from urllib.parse import urlencode
+from threading import Lock, RLock
 
-import requests
 from binance.um_futures import UMFutures
 from binance.websocket.um_futures.websocket_client import UMFuturesWebsocketClient as futures_ws
 
 import general_logger
-from databases_connectors.database_connector import DatabaseConnector
+from binance_rest import SignedRestClient, error_message
+from exchange_info import ExchangeInfoCache
+from latency_metrics import latency
+from databases_connectors.trade_journal import TradeJournal
 from objects.order import Order
 from databases_connectors.redis_connector import RedisClient
+from trade_reconciler import TradeReconciler
+from user_data_stream import OrderFillTracker, UserDataStream
 
-with open(".env", "r") as env_file:
-    keys = env_file.readlines()
+
+def read_api_keys() -> tuple[str, str]:
+    """
+    :return: API key and secret from .env
+    """
+    with open(".env", "r") as env_file:
+        keys = env_file.readlines()
+    return keys[5].split("=")[1].rstrip(), keys[6].split("=")[1].rstrip()
 
 
 class Binance:
-    __API_KEY = keys[5].split("=")[1].rstrip()
-    __API_SECRET = keys[6].split("=")[1].rstrip()
+    """
+    Connector of one ticker. Clients, caches and streams are shared by all connectors of the process and created on
+    first use, importing the module doesn't read the keys or open connections
+    """
     __orders_side = {
         "LONG": {"open": "BUY", "close": "SELL"},
         "SHORT": {"open": "SELL", "close": "BUY"}
@@ -33,49 +43,61 @@ class Binance:
     STOP_MARKET_ORDER = "STOP_MARKET"
     TAKE_PROFIT_MARKET_ORDER = "TAKE_PROFIT_MARKET"
     RETRY_COUNT = 3
+    RECV_WINDOW = 5000
+    FILL_TIMEOUT = 10
+    FILL_STREAM_WAIT = 1
+    FILL_POLL_INTERVAL = 0.5
 
     config = ConfigParser()
     config.read("config.ini")
 
-    __base_url = config['main']['base_url']
-    __wss_url = config['main']['wss_url']
-    futures_client = UMFutures(key=__API_KEY, secret=__API_SECRET, base_url=__base_url)
-    futures_client_ws = futures_ws(stream_url=__wss_url)
-
-    db = DatabaseConnector()
-    __redis_client = RedisClient()
+    __shared_lock = RLock()
+    __rest_client = None
+    __exchange_info = None
+    __journal = None
+    __redis_client = None
+    __user_data_stream = None
+    __user_data_stream_lock = Lock()
+    __trade_reconciler = None
 
     def __init__(self, ticker: str):
         self.ticker = ticker
         self.logger = general_logger.get_logger("Binance Connector", self.ticker)
-        self.listen_key = self.__get_listen_key()
-        self.__update_listen_key(self.listen_key, interval=35 * 60)
         self.user_data_stream()
-        self.__recv_window = 59999
+        self.__fills = self.get_user_data_stream().fills
         self.__change_margin_type()
         self.leverage = self.__set_leverage()
-        self.open_position = self.__redis_client.check_open_position(self.ticker)
-        self.trading_pairs = {}
+        self.has_position = self.get_redis_client().check_open_position(self.ticker)
+        self.symbol_filters = None
         self.get_pairs_info()
 
-    def open_position(self, position: str, quantity: Decimal, take_profit: Decimal, stop_loss: Decimal) -> None:
+    def open_position(self, position: str, quantity: Decimal, take_profit: Decimal, stop_loss: Decimal,
+                      reference_price: Decimal | None = None) -> bool:
         """
         Opens a position on the exchange and places Stop-loss and Take-profit orders.
         :param position: LONG or SHORT
         :param quantity: The quantity of the asset to be bought or sold
         :param take_profit: Percentage of price change at which the bot will close the position with a profit
         :param stop_loss: Percentage of price change at which the bot will close the position and record losses
-        """
+        :param reference_price: Expected entry price used to check the minimal notional value of the order
+        :return: True if the position has been opened and protected by Take-profit and Stop-loss orders
+        """
+        quantity = self.symbol_filters.round_quantity(quantity, market=True)
+        if reference_price is not None and not self.symbol_filters.check_notional(reference_price, quantity,
+                                                                                  market=True):
+            self.logger.warning(f"Order of {quantity} {self.ticker} at {reference_price} doesn't pass "
+                                f"the quantity or notional filters. Position won't be opened.")
+            return False
         open_result = self.place_order(self.__orders_side[position]['open'], quantity, self.MARKET_ORDER)
         filled_entry_result, status = self.__order_handler(open_result)
         if status:
-            self.open_position = True
+            self.has_position = True
             entry_order = Order(self.ticker, filled_entry_result['orderId'], self.MARKET_ORDER,
                                 position, filled_entry_result['avgPrice'], filled_entry_result['status'],
                                 filled_entry_result['updateTime'])
         else:
             self.logger.warning("Position haven't been opened.")
-            return None
+            return False
 
         if position == "LONG":
             take_profit_price = Decimal(Decimal(entry_order.price) * (1 + (take_profit / 100)))
@@ -87,17 +109,22 @@ class Binance:
         filtered_take_profit_price = self.__price_filter(take_profit_price)
         filtered_stop_loss_price = self.__price_filter(stop_loss_price)
 
-        tp_result = self.place_order(self.__orders_side[position]['close'], order_type=self.TAKE_PROFIT_MARKET_ORDER)
-        sl_result = self.place_order(self.__orders_side[position]['close'], order_type=self.STOP_MARKET_ORDER)
+        started = time.perf_counter()
+        tp_result, sl_result = self.place_protection_orders(self.__orders_side[position]['close'],
+                                                            filtered_take_profit_price, filtered_stop_loss_price)
+        latency.since(self.ticker, "protection_orders", started)
         tp_order = Order(self.ticker, tp_result['orderId'], self.TAKE_PROFIT_MARKET_ORDER,
                          position, filtered_take_profit_price, tp_result['status'], tp_result['updateTime'])
         sl_order = Order(self.ticker, sl_result['orderId'], self.STOP_MARKET_ORDER,
                          position, filtered_stop_loss_price, sl_result['status'], sl_result['updateTime'])
         try:
+            started = time.perf_counter()
             self.__save_orders_in_cache(entry_order, tp_order, sl_order)
+            latency.since(self.ticker, "redis_save", started)
             self.logger.info("Info about orders has been saved in Redis")
         except Exception as redis_exception:
             self.logger.error("Info about orders hasn't been saved in Redis.", redis_exception)
+        return True
 
     def close_position(self, quantity: Decimal) -> None:
         """
@@ -105,7 +132,7 @@ class Binance:
         :param quantity: The amount of asset for which the position should be closed
         """
         self.logger.info("Closing position")
-        open_position = self.__redis_client.get_order(self.ticker)
+        open_position = self.get_redis_client().get_order(self.ticker)
         entry_order = Order(self.ticker, open_position['entry_order']['order_id'], self.MARKET_ORDER,
                             open_position['entry_order']['position'], open_position['entry_order']['price'],
                             open_position['entry_order']['status'], open_position['entry_order']['order_time'])
@@ -118,9 +145,9 @@ class Binance:
                                 filled_close_order['avgPrice'], filled_close_order['status'],
                                 filled_close_order['updateTime'])
             self.insert_trade(entry_order, close_order)
-            self.open_position = False
+            self.has_position = False
             try:
-                self.__redis_client.delete_key(self.ticker)
+                self.get_redis_client().delete_key(self.ticker)
                 self.logger.error(f"Deleting key {self.ticker} from Redis. Status: SUCCESS")
             except Exception as redis_exception:
                 self.logger.error(f"Deleting key {self.ticker} from Redis. Status: FAILED", redis_exception)
@@ -129,24 +156,17 @@ class Binance:
 
     def insert_trade(self, open_order: Order, close_order: Order) -> None:
         """
-        Inserts position information into the database
+        Inserts position information into the database. Fee and profit are filled in later by the trade reconciler
         :param open_order: Position opening order
         :param close_order: Position closing order
         """
-        open_trade = self.get_trade(open_order.order_id)
-        close_trade = self.get_trade(close_order.order_id)
-        try:
-            general_fee_amount = Decimal(open_trade[0]['commission']) + Decimal(close_trade[0]['commission'])
-            profit = Decimal(close_trade[0]['realizedPnl']) - general_fee_amount
-        except IndexError:
-            self.logger.info("Some error during handling trades")
-            general_fee_amount = 0
-            profit = 0
         if close_order.close_reason is not None:
             reason = close_order.close_reason
         else:
             reason = "Change MACD"
-        self.__insert_into_db(open_order, close_order, general_fee_amount, profit, reason)
+        self.__insert_into_db(open_order, close_order, None, None, reason)
+        self.get_trade_reconciler().submit(self.ticker, open_order.order_id, open_order.order_time,
+                                           close_order.order_id, close_order.order_time)
 
     def __save_orders_in_cache(self, open_order: Order, tp_order: Order, sl_order: Order) -> None:
         """
@@ -178,29 +198,49 @@ class Binance:
             "order_time": open_order.order_time
         }
         try:
-            self.__redis_client.insert_into_db(self.ticker, {"entry_order": entry_cache,
-                                                             "tp_order": tp_cache,
-                                                             "sl_order": sl_cache})
+            self.get_redis_client().insert_into_db(self.ticker, {"entry_order": entry_cache,
+                                                                 "tp_order": tp_cache,
+                                                                 "sl_order": sl_cache})
         except Exception as redis_exception:
             self.logger.warning("Can't save data about orders in Redis. Status: FAILED", redis_exception)
 
-    def __order_handler(self, order: dict) -> tuple[dict, True] | False:
+    def __order_handler(self, order: dict) -> tuple[dict | None, bool]:
+        """
+        Waits until the order is filled. The fill is taken from the User Data Stream, order status requests are
+        used only as a fallback until the deadline
+        :param order: Order's info returned on placement
+        :return: Filled order's info and True or None and False if the order hasn't been filled
+        """
+        started = time.perf_counter()
+        deadline = started + self.FILL_TIMEOUT
+        filled_order = order if order.get('status') == "FILLED" else None
+        if filled_order is None:
+            filled_order = self.__fills.wait(order['orderId'], self.FILL_STREAM_WAIT)
         counter = 0
-        while counter < 5:
+        while filled_order is None and time.perf_counter() < deadline:
             counter += 1
-            self.logger.info(f"Get order status. Try #{counter}")
-            time.sleep(counter)
+            self.logger.info(f"Fill hasn't come from the stream. Get order status. Try #{counter}")
             try:
-                filled_order = self.get_order_status(order['orderId'])
-                if filled_order['status'] == "FILLED":
-                    self.logger.info("Status: SUCCESS")
-                    return filled_order, True
+                status_result = self.get_order_status(order['orderId'])
+                if status_result['status'] in OrderFillTracker.FINAL_STATUSES:
+                    filled_order = status_result
+                    break
             except Exception as binance_exception:
-                self.logger.error("Some error during request order status", binance_exception)
-        return False
-
-    def __insert_into_db(self, open_order: Order, close_order: Order, fee: Decimal,
-                         profit: Decimal, reason: str = "Change MACD") -> None:
+                self.logger.error("Some error during request order status", exc_info=binance_exception)
+            filled_order = self.__fills.wait(order['orderId'], self.FILL_POLL_INTERVAL)
+        self.__fills.forget(order['orderId'])
+        elapsed = time.perf_counter() - started
+        latency.record(self.ticker, "fill_confirmation", elapsed)
+        if filled_order is not None and filled_order['status'] == "FILLED":
+            self.logger.info(f"Order {order['orderId']} is filled. Confirmation time: {elapsed:.3f} s. "
+                             f"Status requests: {counter}")
+            return filled_order, True
+        self.logger.warning(f"Order {order['orderId']} isn't filled after {elapsed:.3f} s. "
+                            f"Status: {None if filled_order is None else filled_order['status']}")
+        return None, False
+
+    def __insert_into_db(self, open_order: Order, close_order: Order, fee: Decimal | None,
+                         profit: Decimal | None, reason: str = "Change MACD") -> None:
         """
 
         :param open_order: Position opening order
@@ -209,7 +249,7 @@ class Binance:
         :param profit: The amount of USDT that was actually earned (positive value) or spent (negative value)
         :param reason: Reason for closing the position
         """
-        open_position = self.__redis_client.get_order(self.ticker)
+        open_position = self.get_redis_client().get_order(self.ticker)
         data = {
             "ticker": self.ticker,
             "open_order_id": open_order.order_id,
@@ -222,40 +262,21 @@ class Binance:
             "close_reason": reason,
             "fee_amount": fee,
             "profit": profit,
-            "open_position_time": datetime.datetime.fromtimestamp(open_order.order_time / 1000)
+            "open_position_time": datetime.datetime.fromtimestamp(open_order.order_time / 1000),
+            # The journal writes the row later, the column default would take the time of the write
+            "close_position_time": datetime.datetime.fromtimestamp(close_order.order_time / 1000)
         }
-        try:
-            self.db.insert_data(data)
-        except Exception as sql_exception:
-            self.logger.error("Error during insert into MySQL", sql_exception)
-        self.logger.info(data)
+        started = time.perf_counter()
+        self.get_journal().write(data)
+        latency.since(self.ticker, "db_enqueue", started)
+        self.logger.info(f"{data}. Journal queue depth: {self.get_journal().depth}")
 
     def __set_leverage(self) -> str:
         """
         Sets the leverage that is specified in the configuration file
         :return: Leverage value that has been established
         """
-        counter = 0
-        response = None
-        while counter < self.RETRY_COUNT:
-            try:
-                params = {
-                    "symbol": self.ticker,
-                    "leverage": 1,
-                    "timestamp": int(time.time() * 1000),
-                    "recvWindow": self.__recv_window
-                }
-                string_for_sign = urlencode(params)
-                params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                               hashlib.sha256).hexdigest()
-                response = requests.post(f"{self.__base_url}/fapi/v1/leverage", data=params,
-                                         headers={"X-MBX-APIKEY": self.__API_KEY, "User-Agent": "futures/1.0"})
-                break
-            except BaseException:
-                counter += 1
-        if response is None:
-            raise ConnectionError("Connection error to Binance")
-
+        response = self.get_rest_client().request("POST", "/fapi/v1/leverage", {"symbol": self.ticker, "leverage": 1})
         if response.status_code != 200:
             raise ConnectionError(response.text)
         else:
@@ -269,27 +290,8 @@ class Binance:
         """
         margin_type = self.__check_margin_type()
         if margin_type.upper() != "ISOLATED":
-            counter = 0
-            response = None
-            while counter < self.RETRY_COUNT:
-                try:
-                    params = {
-                        "symbol": self.ticker,
-                        "marginType": "ISOLATED",
-                        "timestamp": int(time.time() * 1000),
-                        "recvWindow": self.__recv_window
-                    }
-                    string_for_sign = urlencode(params)
-                    params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                                   hashlib.sha256).hexdigest()
-                    response = requests.post(f"{self.__base_url}/fapi/v1/marginType", data=params,
-                                             headers={"X-MBX-APIKEY": self.__API_KEY, "User-Agent": "futures/1.0"})
-                    break
-                except BaseException:
-                    counter += 1
-            if response is None:
-                raise ConnectionError("Connection error to Binance")
-
+            response = self.get_rest_client().request("POST", "/fapi/v1/marginType",
+                                                      {"symbol": self.ticker, "marginType": "ISOLATED"})
             if response.status_code != 200:
                 raise ConnectionError(response.text)
             else:
@@ -300,26 +302,7 @@ class Binance:
         Checking the current margin type
         :return: Returns the current margin type or None if the request failed
         """
-        counter = 0
-        response = None
-        while counter < self.RETRY_COUNT:
-            try:
-                params = {
-                    "symbol": self.ticker,
-                    "timestamp": int(time.time() * 1000),
-                    "recvWindow": self.__recv_window
-                }
-                string_for_sign = urlencode(params)
-                params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                               hashlib.sha256).hexdigest()
-                response = requests.get(f"{self.__base_url}/fapi/v2/positionRisk?{urlencode(params)}",
-                                        headers={"X-MBX-APIKEY": self.__API_KEY})
-                break
-            except BaseException:
-                counter += 1
-        if response is None:
-            raise ConnectionError("Connection error to Binance")
-
+        response = self.get_rest_client().request("GET", "/fapi/v2/positionRisk", {"symbol": self.ticker})
         if response.status_code != 200:
             raise ConnectionError(response.text)
         else:
@@ -328,27 +311,10 @@ class Binance:
 
     def get_pairs_info(self) -> None:
         """
-        Creates a dictionary of existing tickers and information about them on the exchange
-        """
-        result = requests.get(url=f"{self.__base_url}/fapi/v1/exchangeInfo").json()["symbols"]
-        trading_pairs = {}
-        for ticker in result:
-            if ticker["status"] != "BREAK":
-                trading_pairs[ticker['symbol']] = {
-                    'base_asset': ticker["baseAsset"],
-                    'quote_asset': ticker["quoteAsset"],
-                    'margin_asset': ticker["marginAsset"],
-                    'trigger_protect': ticker["triggerProtect"]
-                }
-                for symbol_filter in ticker['filters']:
-                    filters_names = list(symbol_filter.keys())
-                    filters_values = list(symbol_filter.values())
-                    filter_type_index = keys.index("filterType")
-                    filter_name = filters_values.pop(filter_type_index)
-                    filters_names.pop(filter_type_index)
-                    updating = {filter_name.lower(): dict(zip(filters_names, filters_values))}
-                    trading_pairs[ticker['symbol']].update(updating)
-        self.trading_pairs = trading_pairs
+        Loads the trading rules of the ticker from the exchangeInfo shared by the process
+        """
+        self.symbol_filters = self.get_exchange_info().get(self.ticker)
+        self.get_rest_client().scheduler.configure(self.get_exchange_info().rate_limits)
 
     def __price_filter(self, price: Decimal) -> Decimal:
         """
@@ -356,51 +322,115 @@ class Binance:
         :param price: Calculated price
         :return: Price after processing, which corresponds to the exchange's filters
         """
-        price_filter = self.trading_pairs[self.ticker]['price_filter']
-        filtered_price = price.quantize(Decimal(price_filter['tickSize'].rstrip("0")))
-        return filtered_price
+        return self.symbol_filters.round_price(price)
 
-    def place_order(self, route: str, amount: Decimal | None = None, order_type: str = MARKET_ORDER) -> dict:
+    def place_protection_orders(self, route: str, take_profit_price: Decimal,
+                                stop_loss_price: Decimal) -> tuple[dict, dict]:
         """
-        Places an order on the exchange with the specified parameters
+        Places Take-profit and Stop-loss orders with one batch request. Legs rejected by the batch (or all legs if
+        the batch request failed) are placed one by one
+        :param route: BUY or SELL
+        :param take_profit_price: Trigger price of the Take-profit order
+        :param stop_loss_price: Trigger price of the Stop-loss order
+        :return: Take-profit and Stop-loss orders' info
+        """
+        legs = [(self.TAKE_PROFIT_MARKET_ORDER, take_profit_price), (self.STOP_MARKET_ORDER, stop_loss_price)]
+        batch = [{
+            "symbol": self.ticker,
+            "side": route,
+            "type": order_type,
+            "stopPrice": str(stop_price),
+            "closePosition": "true",
+            "newClientOrderId": self.new_client_order_id()
+        } for order_type, stop_price in legs]
+        try:
+            batch_result = self.place_batch_orders(batch)
+        except Exception as binance_exception:
+            self.logger.error("Batch of protection orders hasn't been placed", exc_info=binance_exception)
+            # The batch may have reached the exchange before the connection failed
+            batch_result = [self.__lookup_order(leg["newClientOrderId"]) for leg in batch]
+
+        results = []
+        for (order_type, stop_price), leg, leg_result in zip(legs, batch, batch_result):
+            if 'orderId' in leg_result:
+                results.append(leg_result)
+                continue
+            self.logger.warning(f"{order_type} order hasn't been placed by the batch: {leg_result.get('msg')}. "
+                                f"Placing it separately")
+            results.append(self.place_order(route, order_type=order_type, stop_price=stop_price,
+                                            client_order_id=leg["newClientOrderId"]))
+        return results[0], results[1]
+
+    def place_batch_orders(self, orders: list[dict]) -> list[dict]:
+        """
+        Places up to 5 orders with one request
+        :param orders: Parameters of the orders
+        :return: Result for every order in the same order: order's info or error code and message
+        """
+        response = self.get_rest_client().request("POST", "/fapi/v1/batchOrders",
+                                                  {"batchOrders": json.dumps(orders, separators=(",", ":"))},
+                                                  orders=len(orders))
+        if response.status_code != 200:
+            self.logger.warning(f"Binance return status code {response.status_code}")
+            self.logger.warning(response.text)
+            raise ConnectionError(error_message(response))
+        else:
+            response = response.json()
+            self.logger.info("Batch of orders has been handled")
+            self.logger.debug(response)
+            return response
+
+    def place_order(self, route: str, amount: Decimal | None = None, order_type: str = MARKET_ORDER,
+                    stop_price: Decimal | None = None, client_order_id: str | None = None) -> dict:
+        """
+        Places an order on the exchange with the specified parameters. If the connection fails after the order may
+        have been sent or the exchange replies with 5xx (unknown execution status), the order is looked up by its
+        client order ID and sent again only if the exchange doesn't know it
         :param route: BUY or SELL
         :param amount: The quantity of the asset to be bought or sold
         :param order_type: MARKET_ORDER or STOP_MARKET_ORDER or TAKE_PROFIT_MARKET_ORDER
+        :param stop_price: Trigger price of STOP_MARKET_ORDER or TAKE_PROFIT_MARKET_ORDER, which closes the position
+        :param client_order_id: Client order ID, a new one by default
         :return: Order's info
         """
-        counter = 0
-        response = None
-        while counter < self.RETRY_COUNT:
-            try:
-                params = {
-                    "symbol": self.ticker,
-                    "side": route,
-                    "type": order_type,
-                    "timestamp": int(time.time() * 1000),
-                    "recvWindow": self.__recv_window
-                }
-                if amount is not None:
-                    params['quantity'] = float(Decimal(amount))
-
-                string_for_sign = urlencode(params)
-                params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                               hashlib.sha256).hexdigest()
-                response = requests.post(f"{self.__base_url}/fapi/v1/order", data=params,
-                                         headers={"X-MBX-APIKEY": self.__API_KEY})
-                break
-            except BaseException:
-                counter += 1
-        if response is None:
-            raise ConnectionError("Connection error to Binance")
+        params = {
+            "symbol": self.ticker,
+            "side": route,
+            "type": order_type,
+            "newClientOrderId": client_order_id or self.new_client_order_id()
+        }
+        if amount is not None:
+            params['quantity'] = float(Decimal(amount))
+        if stop_price is not None:
+            params['stopPrice'] = str(stop_price)
+            params['closePosition'] = "true"
+        if order_type == self.MARKET_ORDER:
+            # The response of a market order then contains the final status and the average price
+            params['newOrderRespType'] = "RESULT"
+        started = time.perf_counter()
+        try:
+            response = self.get_rest_client().request("POST", "/fapi/v1/order", params)
+            if response.status_code >= 500:
+                # The execution status is unknown, the order may have been placed
+                raise ConnectionError(f"Status code {response.status_code}: {error_message(response)}")
+        except ConnectionError as connection_exception:
+            self.logger.warning(f"Order {params['newClientOrderId']} may have been placed. Looking it up",
+                                exc_info=connection_exception)
+            placed_order = self.find_order(params['newClientOrderId'])
+            if placed_order is not None:
+                self.logger.info(f"Order {placed_order['orderId']} has been placed before the request failed")
+                return placed_order
+            response = self.get_rest_client().request("POST", "/fapi/v1/order", params)
+        latency.since(self.ticker, "order_request", started)
 
         if response.status_code != 200:
             self.logger.warning(f"Binance return status code {response.status_code}")
             self.logger.warning(response.text)
-            raise ConnectionError(response.json()["msg"])
+            raise ConnectionError(error_message(response))
         else:
             response = response.json()
-            self.logger.info("Order has been created")
-            self.logger.info(response)
+            self.logger.info(f"Order {response.get('orderId')} has been created: {response.get('status')}")
+            self.logger.debug(response)
             return response
 
     def get_order_status(self, order_id: str) -> dict:
@@ -409,27 +439,7 @@ class Binance:
         :param order_id: Order's ID
         :return: Order's info
         """
-        counter = 0
-        response = None
-        while counter < self.RETRY_COUNT:
-            try:
-                params = {
-                    "symbol": self.ticker,
-                    "orderId": order_id,
-                    "timestamp": int(time.time() * 1000),
-                    "recvWindow": self.__recv_window
-                }
-                string_for_sign = urlencode(params)
-                params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                               hashlib.sha256).hexdigest()
-                response = requests.get(f"{self.__base_url}/fapi/v1/order?{urlencode(params)}",
-                                        headers={"X-MBX-APIKEY": self.__API_KEY})
-                break
-            except BaseException:
-                counter += 1
-        if response is None:
-            raise ConnectionError("Connection error to Binance")
-
+        response = self.get_rest_client().request("GET", "/fapi/v1/order", {"symbol": self.ticker, "orderId": order_id})
         if response.status_code != 200:
             self.logger.warning(f"Binance return status code {response.status_code}")
             self.logger.warning(response.text)
@@ -439,38 +449,45 @@ class Binance:
             self.logger.info("Order status was get successfully.")
             return response
 
+    def find_order(self, client_order_id: str) -> dict | None:
+        """
+        Request for an order by its client order ID
+        :param client_order_id: Client order ID given on placement
+        :return: Order's info or None if the exchange doesn't know the order
+        """
+        response = self.get_rest_client().request("GET", "/fapi/v1/order",
+                                                  {"symbol": self.ticker, "origClientOrderId": client_order_id})
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 400 and response.json().get("code") == -2013:
+            return None
+        raise ConnectionError(response.text)
+
+    def __lookup_order(self, client_order_id: str) -> dict:
+        """
+        :return: Order's info or an empty dictionary if the order isn't found or the request failed
+        """
+        try:
+            return self.find_order(client_order_id) or {}
+        except Exception as binance_exception:
+            self.logger.error(f"Order {client_order_id} hasn't been looked up", exc_info=binance_exception)
+            return {}
+
+    @staticmethod
+    def new_client_order_id() -> str:
+        return uuid.uuid4().hex
+
     def cancel_orders(self) -> bool | None:
         """
         Cancels the placed order
         :return: True if the order was canceled or Non, if an error occurred
         """
         self.logger.info(f"Trying cancel open orders for ticker {self.ticker}")
-        counter = 0
-        response = None
-        while counter < self.RETRY_COUNT:
-            try:
-                params = {
-                    "symbol": self.ticker,
-                    "timestamp": int(time.time() * 1000),
-                    "recvWindow": self.__recv_window
-                }
-
-                logging.debug(str(params))
-                string_for_sign = urlencode(params)
-                params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                               hashlib.sha256).hexdigest()
-                response = requests.delete(f"{self.__base_url}/fapi/v1/allOpenOrders", data=params,
-                                           headers={"X-MBX-APIKEY": self.__API_KEY, "User-Agent": "futures/1.0"})
-                break
-            except BaseException:
-                counter += 1
-        if response is None:
-            raise ConnectionError("Connection error to Binance")
-
+        response = self.get_rest_client().request("DELETE", "/fapi/v1/allOpenOrders", {"symbol": self.ticker})
         if response.status_code != 200:
             raise ConnectionError(response.text)
         else:
-            self.logger.info(response.json())
+            self.logger.debug(response.json())
             return True
 
     def get_trade(self, order_id: str) -> dict:
@@ -480,31 +497,12 @@ class Binance:
         :return: Trades info
         """
         self.logger.info(f"Trying get trade info for ticker {self.ticker}")
-        counter = 0
-        response = None
-        while counter < self.RETRY_COUNT:
-            try:
-                params = {
-                    "symbol": self.ticker,
-                    "orderId": order_id,
-                    "timestamp": int(time.time() * 1000),
-                    "recvWindow": self.__recv_window
-                }
-                string_for_sign = urlencode(params)
-                params['signature'] = hmac.new(bytes(self.__API_SECRET, "UTF-8"), bytes(string_for_sign, "UTF-8"),
-                                               hashlib.sha256).hexdigest()
-                response = requests.get(f"{self.__base_url}/fapi/v1/userTrades?{urlencode(params)}",
-                                        headers={"X-MBX-APIKEY": self.__API_KEY})
-                break
-            except BaseException:
-                counter += 1
-        if response is None:
-            raise ConnectionError("Connection error to Binance")
-
+        response = self.get_rest_client().request("GET", "/fapi/v1/userTrades",
+                                                  {"symbol": self.ticker, "orderId": order_id})
         if response.status_code != 200:
             self.logger.warning(f"Binance return status code {response.status_code}")
             self.logger.warning(response.text)
-            raise ConnectionError(response.json()["msg"])
+            raise ConnectionError(error_message(response))
         else:
             trade = response.json()
             self.logger.info("Order status was get successfully.")
@@ -515,7 +513,7 @@ class Binance:
         Handler of messages about orders sent via private WebSocket
         :param message: Message containing information about the order
         """
-        open_orders = self.__redis_client.get_order(self.ticker)
+        open_orders = self.get_redis_client().get_order(self.ticker)
         entry_order = Order(self.ticker, open_orders['entry_order']['order_id'], self.MARKET_ORDER,
                             open_orders['entry_order']['position'], open_orders['entry_order']['price'],
                             open_orders['entry_order']['status'], open_orders['entry_order']['order_time'])
@@ -541,33 +539,75 @@ class Binance:
         Callback function for WebSockets stream
         :param message: Message from the exchange
         """
-        if 'e' in message.keys():
-            if message['e'] == 'ORDER_TRADE_UPDATE':
-                if message['o']['s'] == self.ticker:
-                    self.logger.info(message)
-                    if self.open_position:
-                        self.__order_update(message)
-            if message['e'] == 'ACCOUNT_UPDATE':
-                self.logger.info(message)
+        self.logger.info(f"Order {message['o']['i']} {message['o']['o']} {message['o']['S']}: {message['o']['X']}")
+        self.logger.debug(message)
+        if self.has_position:
+            self.__order_update(message)
+
+    @classmethod
+    def get_rest_client(cls) -> SignedRestClient:
+        """
+        Returns the REST client shared by all connectors of the process, created on first use
+        """
+        with cls.__shared_lock:
+            if cls.__rest_client is None:
+                api_key, api_secret = read_api_keys()
+                cls.__rest_client = SignedRestClient(cls.config['main']['base_url'], api_key, api_secret,
+                                                     recv_window=cls.RECV_WINDOW, retry_count=cls.RETRY_COUNT)
+            return cls.__rest_client
+
+    @classmethod
+    def get_exchange_info(cls) -> ExchangeInfoCache:
+        with cls.__shared_lock:
+            if cls.__exchange_info is None:
+                cls.__exchange_info = ExchangeInfoCache(cls.get_rest_client())
+            return cls.__exchange_info
+
+    @classmethod
+    def get_journal(cls) -> TradeJournal:
+        with cls.__shared_lock:
+            if cls.__journal is None:
+                cls.__journal = TradeJournal()
+            return cls.__journal
+
+    @classmethod
+    def get_redis_client(cls) -> RedisClient:
+        with cls.__shared_lock:
+            if cls.__redis_client is None:
+                cls.__redis_client = RedisClient()
+            return cls.__redis_client
+
+    @classmethod
+    def get_user_data_stream(cls) -> UserDataStream:
+        """
+        Returns the user data stream shared by all connectors of the process
+        """
+        with cls.__user_data_stream_lock:
+            if cls.__user_data_stream is None:
+                api_key, api_secret = read_api_keys()
+                futures_client = UMFutures(key=api_key, secret=api_secret, base_url=cls.config['main']['base_url'])
+                futures_client_ws = futures_ws(stream_url=cls.config['main']['wss_url'])
+                cls.__user_data_stream = UserDataStream(futures_client, futures_client_ws)
+            return cls.__user_data_stream
+
+    @classmethod
+    def get_trade_reconciler(cls) -> TradeReconciler:
+        """
+        Returns the trade reconciler shared by all connectors of the process
+        """
+        user_data_stream = cls.get_user_data_stream()
+        with cls.__user_data_stream_lock:
+            if cls.__trade_reconciler is None:
+                cls.__trade_reconciler = TradeReconciler(cls.get_rest_client(), cls.get_journal(),
+                                                         user_data_stream.trades)
+            return cls.__trade_reconciler
+
+    @classmethod
+    def stop_user_data_stream(cls) -> None:
+        with cls.__user_data_stream_lock:
+            if cls.__user_data_stream is not None:
+                cls.__user_data_stream.stop()
 
     def user_data_stream(self):
-        self.futures_client_ws.start()
-        self.logger.info("User Data Stream have been started")
-        self.futures_client_ws.user_data(
-            listen_key=self.listen_key,
-            id=1,
-            callback=self.__profile_info_stream_handler,
-        )
-
-    def __get_listen_key(self):
-        return self.futures_client.new_listen_key()['listenKey']
-
-    def __update_listen_key(self, listen_key, interval):
-        stopped = Event()
-
-        def loop():
-            while not stopped.wait(interval):
-                self.futures_client.renew_listen_key(listenKey=listen_key)
-
-        Thread(target=loop).start()
-        return stopped.set
+        self.get_user_data_stream().register(self.ticker, self.__profile_info_stream_handler)
+        self.logger.info("Order events are routed from the shared User Data Stream")
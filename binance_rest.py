@@ -0,0 +1,435 @@
+import hashlib
+import hmac
+import random
+import time
+from threading import Condition, Event, Lock, Thread
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HIGH_PRIORITY = 0
+LOW_PRIORITY = 1
+
+# Request weights of the endpoints used by the bot, the rest weigh 1
+ENDPOINT_WEIGHTS = {
+    ("POST", "/fapi/v1/batchOrders"): 5,
+    ("GET", "/fapi/v1/userTrades"): 5,
+    ("GET", "/fapi/v2/positionRisk"): 5,
+    ("GET", "/api/v3/klines"): 2
+}
+HIGH_PRIORITY_ENDPOINTS = {
+    ("POST", "/fapi/v1/order"),
+    ("POST", "/fapi/v1/batchOrders"),
+    ("DELETE", "/fapi/v1/order"),
+    ("DELETE", "/fapi/v1/allOpenOrders")
+}
+
+
+def request_cost(method: str, path: str, orders: int | None = None, priority: int | None = None) -> tuple:
+    """
+    :return: Weight, number of orders and priority of the request, orders and priority default by the endpoint
+    """
+    if orders is None:
+        orders = 1 if (method, path) == ("POST", "/fapi/v1/order") else 0
+    if priority is None:
+        priority = HIGH_PRIORITY if (method, path) in HIGH_PRIORITY_ENDPOINTS else LOW_PRIORITY
+    return ENDPOINT_WEIGHTS.get((method, path), 1), orders, priority
+
+
+def error_message(response) -> str:
+    """
+    :return: Message of an error response, the body itself if it isn't an error of the exchange (e.g. HTML of
+        a proxy or an empty body)
+    """
+    try:
+        return response.json().get("msg", response.text)
+    except (ValueError, AttributeError):
+        return response.text
+
+
+class TokenBucket:
+    """
+    Token bucket for one exchange limit, e.g. 2400 of request weight per minute
+    """
+
+    def __init__(self, capacity: float, interval: float):
+        self.capacity = capacity
+        self.interval = interval
+        self.rate = capacity / interval
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float, reserve: float = 0) -> float:
+        """
+        Time in seconds until the bucket has the cost plus the reserve
+        """
+        reserve = min(reserve, max(self.capacity - cost, 0))
+        missing = cost + reserve - self.tokens
+        return 0 if missing <= 0 else missing / self.rate
+
+    def take(self, cost: float) -> None:
+        self.tokens -= cost
+
+    def sync(self, used: float) -> None:
+        """
+        Aligns the bucket with the usage reported by the exchange
+        :param used: Used amount of the limit in the current window
+        """
+        self.tokens = min(self.tokens, self.capacity - used)
+
+
+class RequestScheduler:
+    """
+    Process-wide scheduler of REST requests. Keeps token buckets for request weight and order count limits, aligns
+    them with the usage headers of the exchange and lets orders and cancels go first: informational requests
+    can't use the last part of every limit and wait while an order request is waiting
+    """
+    LIMIT_HEADERS = {
+        "x-mbx-used-weight-1m": "weight_1m",
+        "x-mbx-order-count-10s": "orders_10s",
+        "x-mbx-order-count-1m": "orders_1m"
+    }
+    HELD_RETRY_DELAY = 0.05
+
+    def __init__(self, weight_limit: int = 2400, orders_10s_limit: int = 300, orders_1m_limit: int = 1200,
+                 low_priority_share: float = 0.8):
+        self.low_priority_share = low_priority_share
+        self.__buckets = {
+            "weight_1m": TokenBucket(weight_limit, 60),
+            "orders_10s": TokenBucket(orders_10s_limit, 10),
+            "orders_1m": TokenBucket(orders_1m_limit, 60)
+        }
+        self.__condition = Condition()
+        self.__high_priority_waiting = 0
+        self.__blocked_until = 0
+        self.__reported_usage = {}
+        self.__counters = {"requests": 0, "waits": 0, "wait_time": 0.0, "bans": 0}
+
+    def configure(self, rate_limits: list[dict]) -> None:
+        """
+        Sets the limits from the rateLimits part of exchangeInfo
+        :param rate_limits: List of limits
+        """
+        seconds = {"SECOND": 1, "MINUTE": 60, "HOUR": 3600, "DAY": 86400}
+        with self.__condition:
+            for rate_limit in rate_limits:
+                interval = seconds[rate_limit["interval"]] * int(rate_limit["intervalNum"])
+                if rate_limit["rateLimitType"] == "REQUEST_WEIGHT" and interval == 60:
+                    name = "weight_1m"
+                elif rate_limit["rateLimitType"] == "ORDERS" and interval in (10, 60):
+                    name = "orders_10s" if interval == 10 else "orders_1m"
+                else:
+                    continue
+                self.__buckets[name] = TokenBucket(int(rate_limit["limit"]), interval)
+
+    def acquire(self, weight: int, orders: int = 0, priority: int = LOW_PRIORITY) -> float:
+        """
+        Blocks until the request fits into the limits and takes its cost from the buckets
+        :param weight: Request weight
+        :param orders: Number of orders placed by the request
+        :param priority: HIGH_PRIORITY or LOW_PRIORITY
+        :return: Waiting time in seconds
+        """
+        started = time.monotonic()
+        with self.__condition:
+            if priority == HIGH_PRIORITY:
+                self.__high_priority_waiting += 1
+            try:
+                while True:
+                    wait = self.__wait_time(weight, orders, priority)
+                    if wait is not None and wait <= 0:
+                        break
+                    # A held request waits without a timeout for notify_all of the finished order request
+                    self.__condition.wait(wait)
+                waited = time.monotonic() - started
+                self.__take(weight, orders, waited)
+                return waited
+            finally:
+                if priority == HIGH_PRIORITY:
+                    self.__high_priority_waiting -= 1
+                self.__condition.notify_all()
+
+    def try_acquire(self, weight: int, orders: int = 0, priority: int = LOW_PRIORITY, waited: float = 0) -> float:
+        """
+        Non-blocking variant of acquire for coroutines: takes the cost if the request fits into the limits
+        :param waited: Time the caller has already waited for this request, for the counters
+        :return: 0 if the cost has been taken, otherwise time in seconds to wait before the next try
+        """
+        with self.__condition:
+            wait = self.__wait_time(weight, orders, priority)
+            if wait is None:
+                # Coroutines can't wait on the condition, they try again shortly
+                return self.HELD_RETRY_DELAY
+            if wait > 0:
+                return wait
+            self.__take(weight, orders, waited)
+            return 0
+
+    def __wait_time(self, weight: int, orders: int, priority: int) -> float | None:
+        """
+        :return: Time in seconds until the request fits into the limits, None while an order request is waiting
+        """
+        if priority == LOW_PRIORITY and self.__high_priority_waiting > 0:
+            return None
+        now = time.monotonic()
+        share = 1 if priority == HIGH_PRIORITY else self.low_priority_share
+        wait = self.__blocked_until - now
+        for name, bucket in self.__buckets.items():
+            cost = weight if name == "weight_1m" else orders
+            if cost == 0:
+                continue
+            bucket.refill(now)
+            wait = max(wait, bucket.wait_time(cost, bucket.capacity * (1 - share)))
+        return wait
+
+    def __take(self, weight: int, orders: int, waited: float) -> None:
+        self.__buckets["weight_1m"].take(weight)
+        if orders:
+            self.__buckets["orders_10s"].take(orders)
+            self.__buckets["orders_1m"].take(orders)
+        self.__counters["requests"] += 1
+        if waited > 0.001:
+            self.__counters["waits"] += 1
+            self.__counters["wait_time"] += waited
+
+    def update(self, headers: dict) -> None:
+        """
+        Aligns the buckets with the usage headers of the response
+        :param headers: Response headers
+        """
+        with self.__condition:
+            now = time.monotonic()
+            for header, name in self.LIMIT_HEADERS.items():
+                value = headers.get(header)
+                if value is None:
+                    continue
+                self.__reported_usage[name] = int(value)
+                self.__buckets[name].refill(now)
+                self.__buckets[name].sync(int(value))
+
+    def block(self, seconds: float) -> None:
+        """
+        Holds all requests after 429 or 418 response
+        :param seconds: Value of Retry-After header
+        """
+        with self.__condition:
+            self.__blocked_until = max(self.__blocked_until, time.monotonic() + seconds)
+            self.__counters["bans"] += 1
+            self.__condition.notify_all()
+
+    def metrics(self) -> dict:
+        """
+        Returns current usage of the limits and counters of the scheduler
+        """
+        with self.__condition:
+            now = time.monotonic()
+            limits = {}
+            for name, bucket in self.__buckets.items():
+                bucket.refill(now)
+                limits[name] = {"limit": bucket.capacity,
+                                "available": round(bucket.tokens, 2),
+                                "used_reported": self.__reported_usage.get(name)}
+            return {"limits": limits,
+                    "blocked_for": max(self.__blocked_until - now, 0),
+                    **self.__counters}
+
+
+class SignedRestClient:
+    """
+    Client for Binance REST API. All requests go through one keep-alive session with a connection pool,
+    the HMAC key is prepared once and every endpoint has its latency counters.
+    Timestamps of signed requests are corrected by the measured server time offset
+    """
+    CLOCK_SYNC_INTERVAL = 600
+
+    def __init__(self, base_url: str, api_key: str | None, api_secret: str | None, recv_window: int = 5000,
+                 retry_count: int = 3, timeout: tuple = (3.05, 10), pool_size: int = 32,
+                 backoff: float = 0.1, max_backoff: float = 2, scheduler: RequestScheduler | None = None,
+                 time_path: str = "/fapi/v1/time"):
+        self.base_url = base_url
+        self.recv_window = recv_window
+        self.retry_count = retry_count
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": "futures/1.0"})
+        if api_key:
+            self.session.headers.update({"X-MBX-APIKEY": api_key})
+        self.__hmac = hmac.new(bytes(api_secret or "", "UTF-8"), digestmod=hashlib.sha256)
+        self.__latency = {}
+        self.__latency_lock = Lock()
+        self.__time_path = time_path
+        self.__clock_lock = Lock()
+        self.__clock_stopped = Event()
+        self.__clock_thread = None
+        self.time_offset = 0
+        self.time_rtt = None
+
+    def sign(self, params: dict) -> str:
+        """
+        Builds the query string with the signature
+        :param params: Request parameters
+        :return: Signed query string
+        """
+        query = urlencode(params)
+        signature = self.__hmac.copy()
+        signature.update(bytes(query, "UTF-8"))
+        return f"{query}&signature={signature.hexdigest()}"
+
+    def timestamp(self) -> int:
+        """
+        Current server time in ms estimated with the local clock and the measured offset
+        """
+        if self.__clock_thread is None:
+            self.start_clock_sync()
+        return int(time.time() * 1000 + self.time_offset)
+
+    def sync_clock(self, samples: int = 3) -> None:
+        """
+        Measures the offset between the server and the local clock, the sample with the smallest round trip wins
+        :param samples: Number of time requests
+        """
+        best_rtt = None
+        best_offset = None
+        for _ in range(samples):
+            local_before = time.time() * 1000
+            response = self.request("GET", self.__time_path, signed=False)
+            local_after = time.time() * 1000
+            if response.status_code != 200:
+                continue
+            rtt = local_after - local_before
+            if best_rtt is None or rtt < best_rtt:
+                best_rtt = rtt
+                best_offset = response.json()["serverTime"] - (local_before + local_after) / 2
+        if best_offset is not None:
+            self.time_offset = best_offset
+            self.time_rtt = best_rtt
+
+    def start_clock_sync(self) -> None:
+        """
+        Measures the server time offset and starts its periodic update
+        """
+        with self.__clock_lock:
+            if self.__clock_thread is not None:
+                return None
+            self.__clock_thread = Thread(target=self.__clock_sync_loop, name="ServerClockSync", daemon=True)
+            try:
+                self.sync_clock()
+            except ConnectionError:
+                pass
+            self.__clock_thread.start()
+
+    def stop_clock_sync(self) -> None:
+        self.__clock_stopped.set()
+
+    def __clock_sync_loop(self) -> None:
+        while not self.__clock_stopped.wait(self.CLOCK_SYNC_INTERVAL):
+            try:
+                self.sync_clock()
+            except ConnectionError:
+                pass
+
+    def request(self, method: str, path: str, params: dict | None = None, signed: bool = True,
+                orders: int | None = None, priority: int | None = None,
+                headers: dict | None = None) -> requests.Response:
+        """
+        Sends the request, retrying connection errors with exponential backoff and jitter.
+        POST requests are retried only after connect timeouts: after other errors the order may have been placed
+        already, the caller looks it up by its client order ID
+        :param method: GET, POST, PUT or DELETE
+        :param path: Endpoint path, e.g. /fapi/v1/order
+        :param params: Request parameters without timestamp and signature
+        :param signed: Whether the request must be signed
+        :param orders: Number of orders placed by the request, 1 for POST /fapi/v1/order by default, batches pass it
+        :param priority: HIGH_PRIORITY or LOW_PRIORITY, orders and cancels have the high priority by default
+        :param headers: Additional request headers
+        :return: Response of the exchange
+        """
+        params = dict(params or {})
+        weight, orders, priority = request_cost(method, path, orders, priority)
+        last_exception = None
+        clock_synced = False
+        for attempt in range(self.retry_count):
+            if attempt > 0:
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            # The scheduler may hold the request for seconds, it is signed after the wait to stay in recvWindow
+            self.scheduler.acquire(weight, orders, priority)
+            if signed:
+                params["timestamp"] = self.timestamp()
+                params["recvWindow"] = self.recv_window
+                query = self.sign(params)
+            else:
+                query = urlencode(params)
+            started = time.perf_counter()
+            try:
+                response = self._send(method, path, query, headers)
+            except requests.exceptions.ConnectTimeout as timeout_exception:
+                # The connection hasn't been established, the request hasn't been sent
+                last_exception = timeout_exception
+                self._record_latency(path, time.perf_counter() - started, failed=True)
+                continue
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as connection_exception:
+                last_exception = connection_exception
+                self._record_latency(path, time.perf_counter() - started, failed=True)
+                if method == "POST":
+                    break
+                continue
+            self._record_latency(path, time.perf_counter() - started, failed=response.status_code >= 400)
+            self.scheduler.update(response.headers)
+            if response.status_code in (418, 429):
+                self.scheduler.block(float(response.headers.get("Retry-After", 60)))
+                return response
+            if response.status_code == 400 and signed and not clock_synced and '"code":-1021' in response.text:
+                # Timestamp is outside of recvWindow, the clock offset must be measured again
+                clock_synced = True
+                self.sync_clock()
+                continue
+            if response.status_code >= 500 and method != "POST" and attempt < self.retry_count - 1:
+                continue
+            return response
+        raise ConnectionError(f"Connection error to Binance: {last_exception}")
+
+    def _send(self, method: str, path: str, query: str, headers: dict | None = None) -> requests.Response:
+        url = f"{self.base_url}{path}"
+        if method in ("POST", "PUT"):
+            headers = {**(headers or {}), "Content-Type": "application/x-www-form-urlencoded"}
+            return self.session.request(method, url, data=query, timeout=self.timeout, headers=headers)
+        return self.session.request(method, f"{url}?{query}" if query else url, timeout=self.timeout,
+                                    headers=headers)
+
+    def _record_latency(self, path: str, elapsed: float, failed: bool = False) -> None:
+        with self.__latency_lock:
+            counters = self.__latency.setdefault(path, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0})
+            counters["count"] += 1
+            counters["errors"] += failed
+            counters["total"] += elapsed
+            counters["max"] = max(counters["max"], elapsed)
+
+    def latency_stats(self) -> dict:
+        """
+        Returns latency counters of every endpoint: number of requests, errors, average and maximal latency in seconds
+        """
+        with self.__latency_lock:
+            return {path: {"count": counters["count"],
+                           "errors": counters["errors"],
+                           "avg": counters["total"] / counters["count"],
+                           "max": counters["max"]}
+                    for path, counters in self.__latency.items()}
+
+    def metrics(self) -> dict:
+        """
+        Returns latency counters, usage of the rate limits and the server clock state
+        """
+        return {"latency": self.latency_stats(),
+                "rate_limits": self.scheduler.metrics(),
+                "clock": {"offset_ms": self.time_offset, "rtt_ms": self.time_rtt}}
@@ -1,15 +1,22 @@
 import datetime
+from itertools import groupby
 
 from sqlalchemy import DECIMAL
-from sqlalchemy import Table, Column, Integer, String, MetaData, DateTime, Enum, BigInteger
-from sqlalchemy import create_engine, insert
+from sqlalchemy import Table, Column, Integer, String, MetaData, DateTime, Enum, BigInteger, UniqueConstraint
+from sqlalchemy import create_engine, insert, inspect, text, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
-with open(".env", "r") as env_file:
-    keys = env_file.readlines()
+
+def read_connection_string() -> str:
+    """
+    :return: Connection string of the database from .env, read when a connector is created
+    """
+    with open(".env", "r") as env_file:
+        keys = env_file.readlines()
+    return keys[0].split("=")[1].rstrip()
 
 
 class DatabaseConnector(object):
-    CONNECTION_STRING = keys[0].split("=")[1].rstrip()
 
     meta = MetaData()
 
@@ -28,16 +35,73 @@ class DatabaseConnector(object):
         Column('fee_amount', DECIMAL(20, 8)),
         Column('profit', DECIMAL(20, 8)),
         Column('open_position_time', DateTime),
-        Column('close_position_time', DateTime, default=datetime.datetime.now)
+        Column('close_position_time', DateTime, default=datetime.datetime.now),
+        UniqueConstraint('ticker', 'close_order_id', name='uq_trading_ticker_close_order_id')
     )
 
     def __init__(self):
-        self.engine = create_engine(self.CONNECTION_STRING, pool_pre_ping=True)
+        self.engine = create_engine(read_connection_string(), pool_pre_ping=True)
         self.meta.bind = self.engine
         self.meta.create_all()
+        self.__add_unique_index()
+
+    def __add_unique_index(self):
+        """
+        Creates the unique index of the trading tables created before it was declared. Duplicated trades are removed
+        first, the row with the smallest id is kept
+        """
+        constraint = next(item for item in self.trading.constraints if isinstance(item, UniqueConstraint))
+        inspector = inspect(self.engine)
+        names = {index['name'] for index in inspector.get_indexes("trading")}
+        names.update(item['name'] for item in inspector.get_unique_constraints("trading"))
+        if constraint.name in names:
+            return None
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                """
+                CREATE TEMPORARY TABLE trading_duplicates (INDEX (ticker, close_order_id))
+                SELECT ticker, close_order_id, MIN(id) AS kept_id
+                FROM trading
+                WHERE close_order_id IS NOT NULL
+                GROUP BY ticker, close_order_id
+                HAVING COUNT(*) > 1;
+                """
+            ))
+            conn.execute(text(
+                """
+                DELETE trading FROM trading
+                JOIN trading_duplicates ON trading.ticker = trading_duplicates.ticker
+                    AND trading.close_order_id = trading_duplicates.close_order_id
+                    AND trading.id > trading_duplicates.kept_id;
+                """
+            ))
+            conn.execute(text("DROP TEMPORARY TABLE trading_duplicates"))
+            conn.execute(text(f"ALTER TABLE trading ADD UNIQUE INDEX {constraint.name} (ticker, close_order_id)"))
 
     def insert_data(self, data):
-        conn = self.engine.connect()
-        conn.execute(insert(self.trading), data)
-        conn.close()
-        self.engine.dispose()
+        """
+        Inserts one trade or several trades in one transaction
+        :param data: Row as a dictionary or a list of rows
+        """
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.trading), data)
+
+    def write_operations(self, operations):
+        """
+        Applies journal operations in one transaction, in their order. An insert of a trade which is already stored
+        (the same ticker and close order) keeps the stored row, so operations can be applied again
+        :param operations: Dictionaries {"op": "insert", "row": ...} or
+            {"op": "update", "ticker": ..., "close_order_id": ..., "values": ...}
+        """
+        insert_query = mysql_insert(self.trading)
+        insert_query = insert_query.on_duplicate_key_update(id=self.trading.c.id)
+        with self.engine.begin() as conn:
+            for operation_type, group in groupby(operations, key=lambda operation: operation["op"]):
+                if operation_type == "insert":
+                    conn.execute(insert_query, [operation["row"] for operation in group])
+                    continue
+                for operation in group:
+                    conn.execute(update(self.trading)
+                                 .where(self.trading.c.ticker == operation["ticker"])
+                                 .where(self.trading.c.close_order_id == operation["close_order_id"])
+                                 .values(**operation["values"]))
@@ -0,0 +1,61 @@
+import os
+from threading import Lock
+
+from databases_connectors.klines_db import DatabaseConnector
+from objects.klines_file import KlinesFile
+
+
+class KlinesCache:
+    """
+    Local memory-mapped copy of the klines table in front of the database. Stored klines are immutable, so the
+    cache only reads the klines newer than its last one, the whole file is rebuilt only if older klines have been
+    added to the table
+    """
+
+    def __init__(self, db: DatabaseConnector | None = None, directory: str = "cache/klines"):
+        self.__db = db
+        self.__directory = directory
+        self.__files = {}
+        self.__lock = Lock()
+
+    def file(self, ticker: str, duration: str = "1m") -> KlinesFile:
+        with self.__lock:
+            key = (ticker, duration)
+            if key not in self.__files:
+                self.__files[key] = KlinesFile(os.path.join(self.__directory, f"{ticker}_{duration}"))
+            return self.__files[key]
+
+    def sync(self, ticker: str, duration: str = "1m") -> int:
+        """
+        Appends the klines from the database which are newer than the cached ones
+        :return: Number of appended klines
+        """
+        klines_file = self.file(ticker, duration)
+        first_open_time = self.__db.select_first_open_time(ticker, duration)
+        if first_open_time is None:
+            return 0
+        if klines_file.first_open_time is not None and first_open_time < klines_file.first_open_time:
+            return klines_file.rebuild(self.__db.iter_columns(ticker, 0, None, duration))
+        last_open_time = klines_file.last_open_time
+        added = 0
+        for chunk in self.__db.iter_columns(ticker, 0 if last_open_time is None else last_open_time + 1, None,
+                                            duration):
+            added += klines_file.append(chunk)
+        return added
+
+    def select(self, ticker: str, ts_start: int | None = None, ts_finish: int | None = None,
+               duration: str = "1m") -> dict:
+        """
+        Reads klines of the range, the same columns as DatabaseConnector.select_columns but as read-only views
+        of the cache file
+        """
+        self.sync(ticker, duration)
+        return self.file(ticker, duration).slice(ts_start, ts_finish)
+
+    def append(self, ticker: str, duration: str, rows: list) -> int:
+        """
+        Adds new closed klines to the cache file
+        :param rows: Klines as dictionaries with the columns of the klines table
+        :return: Number of appended klines
+        """
+        return self.file(ticker, duration).append_rows(rows)
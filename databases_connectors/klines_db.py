@@ -1,13 +1,20 @@
+import numpy as np
 from sqlalchemy import DECIMAL
-from sqlalchemy import Table, Column, Integer, String, MetaData, BigInteger, bindparam
-from sqlalchemy import create_engine, insert, text
+from sqlalchemy import Table, Column, Index, Integer, String, MetaData, BigInteger, UniqueConstraint, bindparam
+from sqlalchemy import create_engine, insert, inspect, text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 
-with open(".env", "r") as env_file:
-    keys = env_file.readlines()
+
+def read_connection_string() -> str:
+    """
+    :return: Connection string of the database from .env, read when a connector is created
+    """
+    with open(".env", "r") as env_file:
+        keys = env_file.readlines()
+    return keys[7].split("=")[1].rstrip()
 
 
 class DatabaseConnector(object):
-    CONNECTION_STRING = keys[7].split("=")[1].rstrip()
 
     meta = MetaData()
 
@@ -15,23 +22,78 @@ class DatabaseConnector(object):
         "klines", meta,
         Column('id', Integer, primary_key=True),
         Column('ticker', String(50)),
+        Column('duration', String(10), nullable=False, server_default="1m"),
         Column('open_time', BigInteger),
         Column('open', DECIMAL(20, 8)),
         Column('high', DECIMAL(20, 8)),
         Column('low', DECIMAL(20, 8)),
         Column('close', DECIMAL(20, 8)),
         Column('volume', DECIMAL(20, 8)),
-        Column('close_time', BigInteger)
+        Column('close_time', BigInteger),
+        UniqueConstraint('ticker', 'duration', 'open_time', name='uq_klines_ticker_duration_open_time'),
+        Index('ix_klines_ticker_open_time', 'ticker', 'open_time')
     )
 
+    COLUMNS = ("open_time", "open", "high", "low", "close", "volume", "close_time")
+
     def __init__(self):
-        self.engine = create_engine(self.CONNECTION_STRING, pool_pre_ping=True)
+        self.engine = create_engine(read_connection_string(), pool_pre_ping=True)
         self.meta.bind = self.engine
         self.meta.create_all()
+        self.__add_duration_column()
+        self.__add_unique_index()
+        self.__add_indexes()
+
+    def __add_duration_column(self):
+        columns = [column['name'] for column in inspect(self.engine).get_columns("klines")]
+        if "duration" not in columns:
+            with self.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE klines ADD COLUMN duration VARCHAR(10) NOT NULL DEFAULT '1m' "
+                                  "AFTER ticker"))
+
+    def __add_unique_index(self):
+        """
+        Creates the unique index of the klines tables created before it was declared. Duplicated klines are removed
+        first, the row with the smallest id is kept. The duplicates are found with one GROUP BY into an indexed
+        temporary table, the table may have no index on the key yet
+        """
+        constraint = next(item for item in self.klines.constraints if isinstance(item, UniqueConstraint))
+        inspector = inspect(self.engine)
+        names = {index['name'] for index in inspector.get_indexes("klines")}
+        names.update(item['name'] for item in inspector.get_unique_constraints("klines"))
+        if constraint.name in names:
+            return None
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                """
+                CREATE TEMPORARY TABLE klines_duplicates (INDEX (ticker, duration, open_time))
+                SELECT ticker, duration, open_time, MIN(id) AS kept_id
+                FROM klines
+                GROUP BY ticker, duration, open_time
+                HAVING COUNT(*) > 1;
+                """
+            ))
+            conn.execute(text(
+                """
+                DELETE klines FROM klines
+                JOIN klines_duplicates ON klines.ticker = klines_duplicates.ticker
+                    AND klines.duration = klines_duplicates.duration AND klines.open_time = klines_duplicates.open_time
+                    AND klines.id > klines_duplicates.kept_id;
+                """
+            ))
+            conn.execute(text("DROP TEMPORARY TABLE klines_duplicates"))
+            conn.execute(text(f"ALTER TABLE klines ADD UNIQUE INDEX {constraint.name} (ticker, duration, open_time)"))
+
+    def __add_indexes(self):
+        names = {index['name'] for index in inspect(self.engine).get_indexes("klines")}
+        for index in self.klines.indexes:
+            if index.name not in names:
+                index.create(self.engine)
 
-    def insert_data(self, ticker, data):
+    def insert_data(self, ticker, data, duration="1m"):
         conn = self.engine.connect()
         insert_query = insert(self.klines).values(ticker=ticker,
+                                                  duration=duration,
                                                   open_time=bindparam("open_time"),
                                                   open=bindparam("open"),
                                                   high=bindparam("high"),
@@ -41,7 +103,106 @@ class DatabaseConnector(object):
                                                   close_time=bindparam("close_time"))
         conn.execute(insert_query, data)
         conn.close()
-        self.engine.dispose()
+
+    def upsert_data(self, ticker, data, duration="1m", chunk_size=5000):
+        """
+        Writes klines, existing rows with the same ticker, duration and open time are overwritten
+        :param ticker: Ticker name
+        :param data: Klines as dictionaries with the columns of the klines table
+        :param duration: Klines duration
+        :param chunk_size: Number of rows in one multi-row INSERT, every chunk is a separate transaction
+        :return: Number of written klines
+        """
+        insert_query = mysql_insert(self.klines)
+        insert_query = insert_query.on_duplicate_key_update(
+            {column: insert_query.inserted[column]
+             for column in ("open", "high", "low", "close", "volume", "close_time")}
+        )
+        for start in range(0, len(data), chunk_size):
+            rows = [dict(row, ticker=ticker, duration=duration) for row in data[start:start + chunk_size]]
+            with self.engine.begin() as conn:
+                conn.execute(insert_query.values(rows))
+        return len(data)
+
+    def select_last_open_time(self, ticker, duration="1m"):
+        """
+        :return: Open time of the latest stored kline or None if there are no klines
+        """
+        conn = self.engine.connect()
+        query = text(
+            """
+            SELECT MAX(open_time)
+            FROM klines
+            WHERE ticker = :ticker AND duration = :duration;
+            """
+        )
+        result = conn.execute(query, ticker=ticker, duration=duration).scalar()
+        conn.close()
+        return result
+
+    def select_first_open_time(self, ticker, duration="1m"):
+        """
+        :return: Open time of the earliest stored kline or None if there are no klines
+        """
+        conn = self.engine.connect()
+        query = text(
+            """
+            SELECT MIN(open_time)
+            FROM klines
+            WHERE ticker = :ticker AND duration = :duration;
+            """
+        )
+        result = conn.execute(query, ticker=ticker, duration=duration).scalar()
+        conn.close()
+        return result
+
+    def iter_columns(self, ticker, ts_start=None, ts_finish=None, duration="1m", chunk_size=100_000):
+        """
+        Streams klines of the range with a server-side cursor
+        :param ticker: Ticker name
+        :param ts_start: Start of the range in ms
+        :param ts_finish: End of the range in ms
+        :param duration: Klines duration
+        :param chunk_size: Number of klines in one chunk
+        :return: Generator of dictionaries with int64 arrays of times and float64 arrays of prices and volumes
+        """
+        query = text(
+            """
+            SELECT open_time, CAST(open AS DOUBLE), CAST(high AS DOUBLE), CAST(low AS DOUBLE),
+                CAST(close AS DOUBLE), CAST(volume AS DOUBLE), close_time
+            FROM klines
+            WHERE ticker = :ticker AND duration = :duration AND open_time BETWEEN :ts_start AND :ts_finish
+            ORDER BY open_time ASC;
+            """
+        )
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(
+                query, ticker=ticker, duration=duration, ts_start=ts_start if ts_start is not None else 0,
+                ts_finish=ts_finish if ts_finish is not None else 2 ** 62
+            )
+            while True:
+                rows = result.fetchmany(chunk_size)
+                if not rows:
+                    break
+                # Times are below 2 ** 53, so they pass through float64 exactly
+                block = np.array(rows, dtype=np.float64).T
+                yield {
+                    column: block[position].astype(np.int64) if column.endswith("_time") else block[position]
+                    for position, column in enumerate(self.COLUMNS)
+                }
+
+    def select_columns(self, ticker, ts_start=None, ts_finish=None, duration="1m", chunk_size=100_000):
+        """
+        Reads klines of the range as column arrays
+        :return: Dictionary with int64 arrays open_time, close_time and float64 arrays open, high, low, close, volume
+        """
+        chunks = list(self.iter_columns(ticker, ts_start, ts_finish, duration, chunk_size))
+        if not chunks:
+            return {column: np.empty(0, dtype=np.int64 if column.endswith("_time") else np.float64)
+                    for column in self.COLUMNS}
+        if len(chunks) == 1:
+            return chunks[0]
+        return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in self.COLUMNS}
 
     def select_klines(self, ticker, ts_start=None, ts_finish=None, count=None):
         conn = self.engine.connect()
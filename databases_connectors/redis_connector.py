@@ -1,9 +1,32 @@
+import copy
+import itertools
 import json
+import uuid
+from configparser import ConfigParser
+from threading import Lock
 
 from redis import Redis
+from redis.exceptions import ResponseError
+
+import general_logger
 
 
 class RedisClient:
+    """
+    Position store. Every position is a hash with one JSON field per order (entry_order, tp_order, sl_order).
+    Reads are served from a local write-through cache, which is invalidated by keyspace notifications, so
+    changes made by other processes are seen. If notifications can't be enabled, every read goes to Redis.
+    Notifications are enabled on the server only with redis_enable_notifications option of config.ini. Every
+    write stores the mark of its client in the position, the notifications of the own writes don't drop the cache
+    """
+    KEY_PREFIX = "position:"
+    CHECKPOINT_PREFIX = "checkpoint:"
+    WRITER_FIELD = "_writer"
+    MISSING = object()
+
+    config = ConfigParser()
+    config.read("config.ini")
+
     def __init__(self):
         with open(".env", "r") as config_file:
             keys = config_file.readlines()
@@ -13,27 +36,171 @@ class RedisClient:
         self.REDIS_DB = int(keys[4].split("=")[1].rstrip())
         self.redis_client = Redis(host=self.REDIS_HOST, port=self.REDIS_PORT,
                                   password=self.REDIS_PASSWORD, db=self.REDIS_DB)
+        self.logger = general_logger.get_logger("Redis Client", "redis")
+        self.__cache = {}
+        self.__generations = {}
+        self.__cache_lock = Lock()
+        self.__listener = None
+        self.__cache_enabled = None
+        self.__client_id = uuid.uuid4().hex
+        self.__writes = itertools.count()
+        self.__writers = {}
 
     def insert_into_db(self, name, data):
-        self.redis_client.set(name, json.dumps(data))
+        """
+        Replaces the position of the ticker
+        :param name: Ticker name
+        :param data: Orders of the position by name
+        """
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.delete(self.KEY_PREFIX + name, name)
+        pipeline.hset(self.KEY_PREFIX + name, mapping=self.__mapping(name, data))
+        pipeline.execute()
+        self.__store(name, copy.deepcopy(data))
 
     def get_order(self, ticker):
-        order = json.loads(self.redis_client.get(ticker))
+        """
+        :return: Orders of the open position or None if there is no open position
+        """
+        if self.__use_cache():
+            with self.__cache_lock:
+                order = self.__cache.get(ticker)
+                generation = self.__generations.get(ticker, 0)
+            if order is self.MISSING:
+                return None
+            if order is not None:
+                return copy.deepcopy(order)
+        else:
+            generation = None
+        order = self.__read(ticker)
+        if generation is not None:
+            with self.__cache_lock:
+                # The key could have been changed while it has been read
+                if self.__generations.get(ticker, 0) == generation:
+                    self.__cache[ticker] = self.MISSING if order is None else copy.deepcopy(order)
         return order
 
     def delete_key(self, ticker):
-        self.redis_client.delete(ticker)
+        with self.__cache_lock:
+            self.__writers[ticker] = None
+        self.redis_client.delete(self.KEY_PREFIX + ticker, ticker)
+        self.__store(ticker, self.MISSING)
 
     def check_open_position(self, ticker):
-        orders = self.redis_client.get(ticker)
-        if orders is not None:
-            return True
-        else:
-            return False
+        return self.get_order(ticker) is not None
 
     def update_info(self, ticker, data):
-        exists_info = self.get_order(ticker)
-        new_keys = data.keys()
-        for key in new_keys:
-            exists_info[key] = data[key]
-        self.insert_into_db(ticker, exists_info)
+        """
+        Replaces orders of the position, other orders stay unchanged. The fields are written with one HSET,
+        so concurrent updates of different orders don't overwrite each other. The position is read back in the same
+        transaction, the cache gets the orders written by other clients too
+        :param ticker: Ticker name
+        :param data: Orders by name
+        """
+        pipeline = self.redis_client.pipeline(transaction=True)
+        pipeline.hset(self.KEY_PREFIX + ticker, mapping=self.__mapping(ticker, data))
+        pipeline.hgetall(self.KEY_PREFIX + ticker)
+        fields = pipeline.execute()[1]
+        self.__store(ticker, self.__decode(fields))
+
+    def save_checkpoint(self, name, data):
+        self.redis_client.set(self.CHECKPOINT_PREFIX + name, json.dumps(data))
+
+    def load_checkpoint(self, name):
+        """
+        :return: Saved checkpoint or None if there is no checkpoint
+        """
+        data = self.redis_client.get(self.CHECKPOINT_PREFIX + name)
+        return None if data is None else json.loads(data)
+
+    def __mapping(self, ticker, data) -> dict:
+        """
+        :return: Fields of the hash with the mark of this write, it is set before the write, so the notification
+            of the write always finds it
+        """
+        writer = json.dumps(f"{self.__client_id}:{next(self.__writes)}")
+        with self.__cache_lock:
+            self.__writers[ticker] = writer.encode()
+        return {self.WRITER_FIELD: writer, **{field: json.dumps(value) for field, value in data.items()}}
+
+    def __read(self, ticker):
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.hgetall(self.KEY_PREFIX + ticker)
+        pipeline.get(ticker)
+        fields, legacy = pipeline.execute()
+        if fields:
+            return self.__decode(fields)
+        if legacy is not None:
+            # Positions saved before the hash format as one JSON string, moved to a hash on first read
+            order = json.loads(legacy)
+            self.insert_into_db(ticker, order)
+            return order
+        return None
+
+    def __decode(self, fields: dict) -> dict:
+        return {field.decode(): json.loads(value) for field, value in fields.items()
+                if field.decode() != self.WRITER_FIELD}
+
+    def __store(self, ticker, order) -> None:
+        if not self.__use_cache():
+            return None
+        with self.__cache_lock:
+            self.__cache[ticker] = order
+            self.__generations[ticker] = self.__generations.get(ticker, 0) + 1
+
+    def __use_cache(self) -> bool:
+        if self.__cache_enabled is None:
+            with self.__cache_lock:
+                if self.__cache_enabled is None:
+                    self.__cache_enabled = self.__subscribe()
+        return self.__cache_enabled
+
+    def __subscribe(self) -> bool:
+        """
+        Enables keyspace notifications for generic and hash commands and listens to the position keys
+        :return: True if the local cache can be used
+        """
+        try:
+            events = next(iter(self.redis_client.config_get("notify-keyspace-events").values()), "")
+            if isinstance(events, bytes):
+                events = events.decode()
+            # K - keyspace channels, g - DEL and EXPIRE, h - hash commands, A includes g and h
+            missing = "".join(flag for flag in ("K" if "A" in events else "Kgh") if flag not in events)
+            if missing:
+                if not self.config.getboolean("main", "redis_enable_notifications", fallback=False):
+                    self.logger.warning(f"Keyspace notifications of the Redis server lack '{missing}', local cache "
+                                        f"is disabled. They are enabled by redis_enable_notifications = yes")
+                    return False
+                self.redis_client.config_set("notify-keyspace-events", events + missing)
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{f"__keyspace@{self.REDIS_DB}__:{self.KEY_PREFIX}*": self.__invalidate})
+            self.__listener = pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                   exception_handler=self.__listener_failed)
+        except ResponseError as redis_exception:
+            self.logger.warning("Keyspace notifications aren't available, local cache is disabled",
+                                exc_info=redis_exception)
+            return False
+        return True
+
+    def __listener_failed(self, exception, pubsub, thread) -> None:
+        """
+        Notifications could have been lost while the connection has been broken, so the whole cache is dropped.
+        The subscription is restored on the next read of the listener
+        """
+        self.logger.warning("Keyspace notifications connection has failed, local cache is cleared",
+                            exc_info=exception)
+        with self.__cache_lock:
+            self.__cache.clear()
+            for ticker in self.__generations:
+                self.__generations[ticker] += 1
+
+    def __invalidate(self, message: dict) -> None:
+        channel = message["channel"].decode()
+        ticker = channel.split(f"__:{self.KEY_PREFIX}", 1)[1]
+        writer = self.redis_client.hget(self.KEY_PREFIX + ticker, self.WRITER_FIELD)
+        with self.__cache_lock:
+            if ticker in self.__writers and self.__writers[ticker] == writer:
+                # The last write of the key is the own one, the cache already holds it
+                return None
+            self.__cache.pop(ticker, None)
+            self.__generations[ticker] = self.__generations.get(ticker, 0) + 1
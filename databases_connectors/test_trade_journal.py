@@ -0,0 +1,126 @@
+import datetime
+import json
+import os
+import time
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import general_logger
+from databases_connectors.database_connector import DatabaseConnector
+from databases_connectors.trade_journal import TradeJournal
+
+
+class FakeDatabase:
+    """
+    Trading table in memory with the unique key of ticker and close order, inserts of stored trades are skipped
+    like the ON DUPLICATE KEY UPDATE insert of DatabaseConnector
+    """
+    trading = DatabaseConnector.trading
+
+    def __init__(self):
+        self.rows = {}
+        self.available = True
+
+    def __call__(self):
+        return self
+
+    def write_operations(self, operations: list) -> None:
+        if not self.available:
+            raise OperationalError("INSERT INTO trading", {}, Exception("MySQL server has gone away"))
+        rows = {key: dict(row) for key, row in self.rows.items()}
+        for operation in operations:
+            if operation["op"] == "update":
+                rows[(operation["ticker"], operation["close_order_id"])].update(operation["values"])
+                continue
+            row = operation["row"]
+            if row["ticker"] is None:
+                raise IntegrityError("INSERT INTO trading", {}, Exception("Column 'ticker' cannot be null"))
+            rows.setdefault((row["ticker"], row["close_order_id"]), dict(row))
+        self.rows = rows
+
+
+def trade(close_order_id: int, ticker: str | None = "BTCUSDT") -> dict:
+    return {"ticker": ticker, "open_order_id": close_order_id - 1, "position": "LONG",
+            "open_price": Decimal("30000.5"), "close_order_id": close_order_id, "close_price": Decimal("30100"),
+            "close_reason": "TP", "open_position_time": datetime.datetime(2024, 1, 1, 12, 0, close_order_id % 60)}
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Journal hasn't finished in time"
+        time.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def log_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(general_logger, "LOG_DIRECTORY", str(tmp_path / "logs"))
+
+
+@pytest.fixture
+def database() -> FakeDatabase:
+    return FakeDatabase()
+
+
+@pytest.fixture
+def spool_path(tmp_path) -> str:
+    return str(tmp_path / "journal.jsonl")
+
+
+def test_operations_are_written(database, spool_path):
+    journal = TradeJournal(database, spool_path=spool_path, flush_interval=0.01)
+    journal.write(trade(1))
+    journal.write(trade(2))
+    journal.update("BTCUSDT", 1, {"profit": Decimal("12.5")})
+    journal.close()
+    assert database.rows[("BTCUSDT", 1)]["profit"] == Decimal("12.5")
+    assert set(database.rows) == {("BTCUSDT", 1), ("BTCUSDT", 2)}
+    assert journal.metrics()["written"] == 3
+
+
+def test_operations_are_spooled_and_replayed_after_outage(database, spool_path):
+    database.available = False
+    journal = TradeJournal(database, spool_path=spool_path, flush_interval=0.01, retry_delay=0.05)
+    journal.write(trade(1))
+    journal.write(trade(2))
+    wait_for(lambda: journal.metrics()["spooled"] == 2 and journal.depth == 0)
+    assert os.path.exists(spool_path) and not database.rows
+
+    database.available = True
+    wait_for(lambda: not journal.metrics()["spool_pending"] and len(database.rows) == 2)
+    journal.close()
+    # Datetimes come back from the JSON spool with their type, decimals as strings which MySQL converts
+    assert database.rows[("BTCUSDT", 2)]["open_position_time"] == trade(2)["open_position_time"]
+    assert Decimal(database.rows[("BTCUSDT", 2)]["open_price"]) == trade(2)["open_price"]
+
+
+def test_interrupted_replay_doesnt_duplicate_trades(database, spool_path):
+    # The bot has been stopped while replaying trades 1 and 2, trade 1 had been written already
+    database.rows[("BTCUSDT", 1)] = trade(1)
+    with open(f"{spool_path}.replay", "w") as replay_file:
+        for close_order_id in (1, 2):
+            replay_file.write(json.dumps({"op": "insert", "row": trade(close_order_id)}, default=str) + "\n")
+    with open(spool_path, "w") as spool_file:
+        spool_file.write(json.dumps({"op": "insert", "row": trade(3)}, default=str) + "\n")
+
+    journal = TradeJournal(database, spool_path=spool_path, flush_interval=0.01)
+    journal.start()
+    wait_for(lambda: not os.path.exists(f"{spool_path}.replay") and not os.path.exists(spool_path))
+    journal.close()
+    assert sorted(database.rows) == [("BTCUSDT", 1), ("BTCUSDT", 2), ("BTCUSDT", 3)]
+    assert database.rows[("BTCUSDT", 3)]["open_position_time"] == trade(3)["open_position_time"]
+    assert journal.metrics()["rejected"] == 0
+
+
+def test_rejected_operation_doesnt_block_batch(database, spool_path):
+    journal = TradeJournal(database, spool_path=spool_path, flush_interval=0.01)
+    for row in (trade(1), trade(2, ticker=None), trade(3)):
+        journal.write(row)
+    journal.close()
+    assert sorted(database.rows) == [("BTCUSDT", 1), ("BTCUSDT", 3)]
+    with open(f"{spool_path}.rejected") as rejected_file:
+        rejected = [json.loads(line) for line in rejected_file]
+    assert [operation["row"]["close_order_id"] for operation in rejected] == [2]
+    assert not os.path.exists(spool_path)
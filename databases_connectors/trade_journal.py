@@ -0,0 +1,246 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import time
+from decimal import Decimal
+from threading import Event, Lock, Thread
+
+from sqlalchemy import DateTime
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+
+import general_logger
+from latency_metrics import latency
+
+
+class TradeJournal:
+    """
+    Writes rows of the trading table from a background thread. Callers only put operations (inserts of new trades
+    and updates of reconciled ones) into a bounded queue, the writer applies them in batches over a persistent
+    connection pool. Operations which can't be applied because the database is unavailable are appended to a local
+    spool file and applied again when the database is back, so trades survive a MySQL outage and a restart of the bot
+    """
+    TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, ConnectionError)
+
+    def __init__(self, db_factory=None, max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 0.5,
+                 spool_path: str = "cache/trade_journal.jsonl", retry_delay: float = 1, max_retry_delay: float = 60):
+        self.logger = general_logger.get_logger("Trade Journal", "trade_journal")
+        self.__db_factory = db_factory
+        self.__db = None
+        self.__queue = queue.Queue(maxsize=max_queue)
+        self.__batch_size = batch_size
+        self.__flush_interval = flush_interval
+        self.__spool_path = spool_path
+        self.__rejected_path = f"{spool_path}.rejected"
+        self.__retry_delay = retry_delay
+        self.__max_retry_delay = max_retry_delay
+        self.__next_retry = 0
+        self.__failures = 0
+        self.__spool_lock = Lock()
+        self.__start_lock = Lock()
+        self.__stopped = Event()
+        self.__thread = None
+        self.__written = 0
+        self.__spooled = 0
+        self.__rejected = 0
+
+    @property
+    def db(self):
+        """
+        Connector of the trading table, created on first use so importing the module doesn't connect to MySQL
+        """
+        if self.__db is None:
+            self.__db = self.__factory()()
+        return self.__db
+
+    def __factory(self):
+        if self.__db_factory is None:
+            from databases_connectors.database_connector import DatabaseConnector
+            self.__db_factory = DatabaseConnector
+        return self.__db_factory
+
+    @property
+    def depth(self) -> int:
+        return self.__queue.qsize()
+
+    def metrics(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "written": self.__written,
+            "spooled": self.__spooled,
+            "rejected": self.__rejected,
+            "spool_pending": os.path.exists(self.__spool_path)
+        }
+
+    def write(self, row: dict) -> None:
+        """
+        Schedules the row for insertion and returns immediately
+        :param row: Row of the trading table
+        """
+        self.__put({"op": "insert", "row": row})
+
+    def update(self, ticker: str, close_order_id: int, values: dict) -> None:
+        """
+        Schedules the update of the trade row and returns immediately
+        :param ticker: Ticker name
+        :param close_order_id: ID of the order which has closed the position
+        :param values: New values of the columns
+        """
+        self.__put({"op": "update", "ticker": ticker, "close_order_id": close_order_id, "values": values})
+
+    def __put(self, operation: dict) -> None:
+        """
+        Puts the operation into the queue. If the queue is full, the operation goes straight to the spool file
+        """
+        self.start()
+        try:
+            self.__queue.put_nowait(operation)
+        except queue.Full:
+            self.logger.warning(f"Journal queue is full ({self.depth} operations). The operation is spooled")
+            self.__spool([operation])
+
+    def start(self) -> None:
+        with self.__start_lock:
+            if self.__thread is not None and self.__thread.is_alive():
+                return None
+            self.__stopped.clear()
+            self.__thread = Thread(target=self.__run, name="TradeJournal", daemon=True)
+            self.__thread.start()
+            atexit.register(self.close)
+
+    def close(self, timeout: float = 10) -> None:
+        """
+        Applies the queued operations and stops the writer. Operations which haven't been applied in time are
+        spooled
+        """
+        if self.__thread is None:
+            return None
+        self.__stopped.set()
+        self.__thread.join(timeout)
+        remaining = self.__drain(self.__queue.qsize())
+        if remaining:
+            self.__spool(remaining)
+        self.__thread = None
+        atexit.unregister(self.close)
+
+    def __run(self) -> None:
+        while not (self.__stopped.is_set() and self.__queue.empty()):
+            try:
+                first = self.__queue.get(timeout=self.__flush_interval)
+            except queue.Empty:
+                first = None
+            batch = [] if first is None else [first] + self.__drain(self.__batch_size - 1)
+            try:
+                self.__replay_spool()
+            except Exception as journal_exception:
+                self.logger.error("Spool file hasn't been replayed", exc_info=journal_exception)
+            if batch:
+                self.__apply(batch)
+
+    def __drain(self, limit: int) -> list:
+        operations = []
+        while len(operations) < limit:
+            try:
+                operations.append(self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        return operations
+
+    def __apply(self, operations: list) -> bool:
+        """
+        Applies the operations in one transaction or spools them if the database is unavailable. If the database
+        rejects the batch, the operations are applied one by one and only the rejected ones go to the rejected file
+        :return: False if the operations have been spooled
+        """
+        if time.monotonic() < self.__next_retry:
+            self.__spool(operations)
+            return False
+        started = time.perf_counter()
+        try:
+            self.db.write_operations(operations)
+        except self.TRANSIENT_ERRORS as sql_exception:
+            self.__failures += 1
+            delay = min(self.__retry_delay * 2 ** (self.__failures - 1), self.__max_retry_delay)
+            self.__next_retry = time.monotonic() + delay
+            self.logger.error(f"Database is unavailable, {len(operations)} operations are spooled. "
+                              f"Retry in {delay:.1f} s", exc_info=sql_exception)
+            self.__spool(operations)
+            return False
+        except Exception as sql_exception:
+            if len(operations) == 1:
+                self.logger.error(f"Operation has been rejected by the database: {operations[0]}",
+                                  exc_info=sql_exception)
+                self.__rejected += 1
+                self.__append_lines(self.__rejected_path, operations)
+                return True
+            self.logger.warning(f"{len(operations)} operations have been rejected by the database, they are "
+                                f"applied one by one", exc_info=sql_exception)
+        else:
+            latency.since("journal", "db_write", started)
+            self.__failures = 0
+            self.__written += len(operations)
+            self.logger.info(f"{len(operations)} operations have been applied. Queue depth: {self.depth}")
+            return True
+        return self.__apply_each(operations)
+
+    def __apply_each(self, operations: list) -> bool:
+        for position, operation in enumerate(operations):
+            if not self.__apply([operation]):
+                # The database has become unavailable, the rest is spooled unchanged
+                self.__spool(operations[position + 1:])
+                return False
+        return True
+
+    def __replay_spool(self) -> None:
+        if time.monotonic() < self.__next_retry:
+            return None
+        replay_path = f"{self.__spool_path}.replay"
+        with self.__spool_lock:
+            # A replay file is left only if the bot has been stopped during the replay
+            if not os.path.exists(replay_path):
+                if not os.path.exists(self.__spool_path):
+                    return None
+                os.replace(self.__spool_path, replay_path)
+        with open(replay_path, "r") as spool_file:
+            operations = [self.__decode(json.loads(line)) for line in spool_file if line.strip()]
+        # Inserts are idempotent, so the batches applied before a crash may be applied again
+        self.logger.info(f"Replaying {len(operations)} spooled operations")
+        for start in range(0, len(operations), self.__batch_size):
+            if not self.__apply(operations[start:start + self.__batch_size]):
+                # Failed operations have been spooled again, the rest is spooled unchanged
+                self.__spool(operations[start + self.__batch_size:])
+                break
+        os.remove(replay_path)
+
+    def __spool(self, operations: list) -> None:
+        if not operations:
+            return None
+        self.__spooled += len(operations)
+        self.__append_lines(self.__spool_path, operations)
+
+    def __append_lines(self, path: str, operations: list) -> None:
+        with self.__spool_lock:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "a") as spool_file:
+                for operation in operations:
+                    spool_file.write(json.dumps(operation, default=self.__encode) + "\n")
+                spool_file.flush()
+                os.fsync(spool_file.fileno())
+
+    @staticmethod
+    def __encode(value):
+        if isinstance(value, Decimal):
+            return str(value)
+        if isinstance(value, datetime.datetime):
+            return value.isoformat()
+        raise TypeError(f"{type(value)} isn't JSON serializable")
+
+    def __decode(self, operation: dict) -> dict:
+        values = operation["row"] if operation["op"] == "insert" else operation["values"]
+        for column in self.__factory().trading.columns:
+            if isinstance(column.type, DateTime) and isinstance(values.get(column.name), str):
+                values[column.name] = datetime.datetime.fromisoformat(values[column.name])
+        return operation
@@ -0,0 +1,189 @@
+import json
+import os
+import time
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+from threading import Lock
+
+import general_logger
+
+
+class SymbolFilters:
+    """
+    Trading rules of one symbol with precomputed quantizers for price and quantity
+    """
+    __slots__ = ("symbol", "base_asset", "quote_asset", "margin_asset", "trigger_protect", "tick_size", "min_price",
+                 "max_price", "step_size", "min_qty", "max_qty", "market_step_size", "market_min_qty",
+                 "market_max_qty", "min_notional", "__price_exponent", "__qty_exponent", "__market_qty_exponent")
+
+    def __init__(self, symbol_info: dict):
+        filters = {symbol_filter["filterType"]: symbol_filter for symbol_filter in symbol_info["filters"]}
+        price_filter = filters.get("PRICE_FILTER", {})
+        lot_size = filters.get("LOT_SIZE", {})
+        market_lot_size = filters.get("MARKET_LOT_SIZE", lot_size)
+        self.symbol = symbol_info["symbol"]
+        self.base_asset = symbol_info["baseAsset"]
+        self.quote_asset = symbol_info["quoteAsset"]
+        self.margin_asset = symbol_info["marginAsset"]
+        self.trigger_protect = symbol_info["triggerProtect"]
+        self.tick_size = Decimal(price_filter.get("tickSize", "0")).normalize()
+        self.min_price = Decimal(price_filter.get("minPrice", "0"))
+        self.max_price = Decimal(price_filter.get("maxPrice", "0"))
+        self.step_size = Decimal(lot_size.get("stepSize", "0")).normalize()
+        self.min_qty = Decimal(lot_size.get("minQty", "0"))
+        self.max_qty = Decimal(lot_size.get("maxQty", "0"))
+        self.market_step_size = Decimal(market_lot_size.get("stepSize", "0")).normalize()
+        self.market_min_qty = Decimal(market_lot_size.get("minQty", "0"))
+        self.market_max_qty = Decimal(market_lot_size.get("maxQty", "0"))
+        self.min_notional = Decimal(filters.get("MIN_NOTIONAL", {}).get("notional", "0"))
+        # Steps like 0.01 are applied with quantize, other steps (e.g. 0.5) with division
+        self.__price_exponent = self.__power_of_ten(self.tick_size)
+        self.__qty_exponent = self.__power_of_ten(self.step_size)
+        self.__market_qty_exponent = self.__power_of_ten(self.market_step_size)
+
+    @staticmethod
+    def __power_of_ten(step: Decimal) -> Decimal | None:
+        if step > 0 and step.as_tuple().digits == (1,):
+            return step
+        return None
+
+    @staticmethod
+    def __round(value: Decimal, step: Decimal, exponent: Decimal | None, rounding: str) -> Decimal:
+        if step <= 0:
+            return value
+        if exponent is not None:
+            return value.quantize(exponent, rounding=rounding)
+        return (value / step).to_integral_value(rounding=rounding) * step
+
+    def round_price(self, price: Decimal) -> Decimal:
+        """
+        Processes the price according to the tickSize of the symbol
+        :param price: Calculated price
+        :return: Price after processing, which corresponds to the exchange's filters
+        """
+        return self.__round(price, self.tick_size, self.__price_exponent, ROUND_HALF_UP)
+
+    def round_quantity(self, quantity: Decimal, market: bool = False) -> Decimal:
+        """
+        Rounds the quantity down according to the stepSize of the symbol
+        :param quantity: The quantity of the asset
+        :param market: Use the stepSize of MARKET_LOT_SIZE, which applies to market orders
+        :return: Quantity after processing
+        """
+        if market:
+            return self.__round(quantity, self.market_step_size, self.__market_qty_exponent, ROUND_DOWN)
+        return self.__round(quantity, self.step_size, self.__qty_exponent, ROUND_DOWN)
+
+    def check_notional(self, price: Decimal, quantity: Decimal, market: bool = False) -> bool:
+        """
+        Checks the quantity limits and the minimal notional value of an order
+        :param price: Expected price of the order
+        :param quantity: The quantity of the asset
+        :param market: Use the limits of MARKET_LOT_SIZE, which apply to market orders
+        :return: True if the order passes the filters
+        """
+        min_qty, max_qty = (self.market_min_qty, self.market_max_qty) if market else (self.min_qty, self.max_qty)
+        if quantity < min_qty or 0 < max_qty < quantity:
+            return False
+        return price * quantity >= self.min_notional
+
+
+class ExchangeInfoCache:
+    """
+    Futures exchangeInfo shared by all connectors of the process. The payload is kept in a file for the TTL,
+    after that it is requested again conditionally (with ETag), and parsed once into SymbolFilters records
+    """
+
+    def __init__(self, rest_client, path: str = "cache/exchange_info.json", ttl: int = 3600):
+        self.logger = general_logger.get_logger("Exchange Info", "exchange_info")
+        self.__rest_client = rest_client
+        self.__path = path
+        self.__ttl = ttl
+        self.__lock = Lock()
+        self.__loaded_at = None
+        self.__symbols = {}
+        self.rate_limits = []
+
+    def get(self, symbol: str) -> SymbolFilters:
+        """
+        Returns trading rules of the symbol
+        :param symbol: Ticker name
+        """
+        self.refresh()
+        return self.__symbols[symbol]
+
+    def symbols(self) -> dict:
+        self.refresh()
+        return self.__symbols
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Reloads the payload if the loaded one is older than the TTL
+        :param force: Reload even if the payload is fresh
+        """
+        with self.__lock:
+            now = time.time()
+            if not force and self.__loaded_at is not None and now - self.__loaded_at < self.__ttl:
+                return None
+            cached = self.__read_file()
+            if not force and cached is not None and now - cached["downloaded_at"] < self.__ttl:
+                self.__parse(cached)
+                return None
+            try:
+                payload = self.__download(cached)
+            except Exception as binance_exception:
+                if cached is None:
+                    raise
+                self.logger.warning("exchangeInfo hasn't been updated, the cached one is used",
+                                    exc_info=binance_exception)
+                self.__parse(cached)
+                # The next download is tried after the TTL, not on every call of the order path
+                self.__loaded_at = now
+                return None
+            self.__parse(payload)
+
+    def __download(self, cached: dict | None) -> dict:
+        headers = {}
+        if cached is not None and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        response = self.__rest_client.request("GET", "/fapi/v1/exchangeInfo", signed=False, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            self.logger.info("exchangeInfo hasn't changed")
+            payload = cached
+        elif response.status_code != 200:
+            raise ConnectionError(response.text)
+        else:
+            exchange_info = response.json()
+            payload = {
+                "etag": response.headers.get("ETag"),
+                "rateLimits": exchange_info["rateLimits"],
+                "symbols": [{key: symbol_info[key]
+                             for key in ("symbol", "status", "baseAsset", "quoteAsset", "marginAsset",
+                                         "triggerProtect", "filters")}
+                            for symbol_info in exchange_info["symbols"]]
+            }
+            self.logger.info(f"exchangeInfo has been downloaded: {len(payload['symbols'])} symbols")
+        payload["downloaded_at"] = time.time()
+        self.__write_file(payload)
+        return payload
+
+    def __parse(self, payload: dict) -> None:
+        self.__symbols = {symbol_info["symbol"]: SymbolFilters(symbol_info) for symbol_info in payload["symbols"]
+                          if symbol_info["status"] != "BREAK"}
+        self.rate_limits = payload["rateLimits"]
+        self.__loaded_at = payload["downloaded_at"]
+
+    def __read_file(self) -> dict | None:
+        try:
+            with open(self.__path, "r") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def __write_file(self, payload: dict) -> None:
+        directory = os.path.dirname(self.__path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.__path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(payload, cache_file)
+        os.replace(temporary_path, self.__path)
@@ -0,0 +1,108 @@
+import time
+from decimal import Decimal
+
+import click
+
+import general_logger
+from backtest import read_macd_config, to_timestamp
+from databases_connectors.klines_cache import KlinesCache
+from databases_connectors.klines_db import DatabaseConnector
+from objects.intervals import INTERVALS_MS
+from simulator.klines_replay import KlinesReplay
+from simulator.matching_engine import MatchingEngine
+from simulator.rest_server import ExchangeSimulator
+from simulator.websocket_server import StreamHub
+
+
+@click.command()
+@click.argument("tickers", nargs=-1)
+@click.option("--config", "config_tickers", is_flag=True, help="Replay every ticker from configs/macd_config.json")
+@click.option("--intervals", default=None, help="Streamed klines durations, by default from the MACD config")
+@click.option("--base-interval", default="1m", help="Duration of the stored klines which drive the replay")
+@click.option("--start", default=None, help="Start of the served history, YYYY-MM-DD")
+@click.option("--replay-from", default=None, help="Start of the replay, YYYY-MM-DD, by default 1000 klines of the "
+                                                  "longest interval after the start")
+@click.option("--finish", default=None, help="End of the replay, YYYY-MM-DD")
+@click.option("--from-cache", is_flag=True, help="Read the klines cache files without synchronizing with the DB")
+@click.option("--host", default="127.0.0.1", help="Address of both servers")
+@click.option("--rest-port", default=8080, help="Port of the REST API")
+@click.option("--ws-port", default=8090, help="Port of the streams")
+@click.option("--speed", default=1.0, help="Replay speed relative to the real time, 0 - as fast as possible")
+@click.option("--start-delay", default=10.0, help="Seconds between the start of the servers and the replay")
+@click.option("--fee-rate", default="0.0004", help="Taker commission rate")
+@click.option("--slippage", default="0", help="Share of the price added to every market fill")
+@click.option("--latency-ms", default=0.0, help="Delay of every REST response")
+@click.option("--jitter-ms", default=0.0, help="Random delay added to the latency, up to the value")
+@click.option("--error-rate", default=0.0, help="Share of REST requests answered with 503")
+@click.option("--weight-limit", default=2400, help="Request weight per minute")
+@click.option("--orders-10s", default=300, help="Orders per 10 seconds")
+@click.option("--orders-1m", default=1200, help="Orders per minute")
+def run(tickers, config_tickers, intervals, base_interval, start, replay_from, finish, from_cache, host, rest_port,
+        ws_port, speed, start_delay, fee_rate, slippage, latency_ms, jitter_ms, error_rate, weight_limit, orders_10s,
+        orders_1m):
+    logger = general_logger.get_logger("Exchange Simulator", "simulator")
+    macd_config = read_macd_config() if config_tickers or intervals is None else {}
+    tickers = [ticker.upper() for ticker in tickers]
+    if config_tickers:
+        tickers += list(macd_config.keys())
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        raise click.UsageError("Specify at least one ticker or --config")
+    if intervals is not None:
+        stream_intervals = {ticker: intervals.split(",") for ticker in tickers}
+    else:
+        stream_intervals = {ticker: [macd_config[ticker]["klines_duration"]] for ticker in tickers
+                            if ticker in macd_config}
+    for interval in [base_interval] + [interval for values in stream_intervals.values() for interval in values]:
+        if interval not in INTERVALS_MS:
+            raise click.BadParameter(f"Unknown interval {interval}")
+
+    klines_cache = KlinesCache(None if from_cache else DatabaseConnector())
+    ts_start, ts_finish = to_timestamp(start), to_timestamp(finish)
+    klines = {}
+    for ticker in tickers:
+        if from_cache:
+            columns = klines_cache.file(ticker, base_interval).slice(ts_start, ts_finish)
+        else:
+            columns = klines_cache.select(ticker, ts_start, ts_finish, base_interval)
+        if columns["open_time"].shape[0] == 0:
+            logger.warning(f"There are no stored {base_interval} klines of {ticker}")
+            continue
+        klines[ticker] = columns
+    if not klines:
+        raise click.UsageError("There are no klines to replay")
+    if replay_from is not None:
+        replay_start = to_timestamp(replay_from)
+    else:
+        longest = max([INTERVALS_MS[interval] for values in stream_intervals.values() for interval in values],
+                      default=INTERVALS_MS[base_interval])
+        first_open_time = min(int(columns["open_time"][0]) for columns in klines.values())
+        replay_start = -(-(first_open_time + 1000 * longest) // longest) * longest
+
+    engine = MatchingEngine(Decimal(fee_rate), Decimal(slippage))
+    hub = StreamHub((host, ws_port))
+    replay = KlinesReplay(klines, base_interval, stream_intervals, engine, hub, replay_start, speed)
+    rest = ExchangeSimulator((host, rest_port), engine, replay, latency_ms=latency_ms, jitter_ms=jitter_ms,
+                             error_rate=error_rate, weight_limit=weight_limit, orders_10s_limit=orders_10s,
+                             orders_1m_limit=orders_1m)
+    engine.add_listener(lambda event: hub.publish(rest.listen_key, event))
+    hub.start()
+    rest.start()
+    click.echo(f"REST API: http://{host}:{rest_port}, streams: ws://{host}:{ws_port}")
+    click.echo(f"{len(klines)} symbols, replay starts in {start_delay:.0f} s")
+    time.sleep(start_delay)
+    replay.start()
+    try:
+        while not replay.finished.wait(1):
+            pass
+    except KeyboardInterrupt:
+        replay.stop()
+    for position in engine.position_risk():
+        if Decimal(position["positionAmt"]) != 0:
+            click.echo(f"Open position {position['symbol']}: {position['positionAmt']} at {position['entryPrice']}")
+    rest.shutdown()
+    hub.shutdown()
+
+
+if __name__ == "__main__":
+    run()
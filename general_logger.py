@@ -1,22 +1,208 @@
+import atexit
 import datetime
 import logging
+import logging.handlers
 import os
+import queue
+import sys
+import threading
 
+LOG_FORMAT = '[%(levelname)s] - %(asctime)s - %(name)s - %(threadName)s - %(message)s'
+LOG_DIRECTORY = "logs"
+DEFAULT_FILE = "main"
 
-def get_logger(name: str, file_name: str):
-    if os.path.exists(f"logs/{datetime.datetime.now().strftime('%Y')}/{datetime.datetime.now().strftime('%m')}"):
-        pass
-    else:
-        os.makedirs(f"logs/{datetime.datetime.now().strftime('%Y')}/{datetime.datetime.now().strftime('%m')}")
+_settings = {
+    "level": os.environ.get("LOG_LEVEL", "INFO").upper(),
+    "max_bytes": int(os.environ.get("LOG_MAX_BYTES", 100 * 1024 * 1024)),
+    "backup_count": int(os.environ.get("LOG_BACKUP_COUNT", 20)),
+    "console": os.environ.get("LOG_CONSOLE", "1") != "0",
+}
+_install_lock = threading.Lock()
+_listener = None
+_loggers = {}
 
-    filename = f"logs/{datetime.datetime.now().strftime('%Y')}/{datetime.datetime.now().strftime('%m')}/" \
-               f"{file_name.lower()}_{datetime.datetime.now().strftime('%Y-%m-%d')}.log"
 
-    stream_handler = logging.StreamHandler()
-    file_handler = logging.FileHandler(filename=filename, mode="a")
-    logging.basicConfig(level=logging.INFO,
-                        format='[%(levelname)s] - %(asctime)s - %(name)s - %(threadName)s - %(message)s',
-                        handlers=[file_handler, stream_handler])
+class DatedFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    File logs/YYYY/MM/<file>_<YYYY-MM-DD>.log. The handler moves to the file of the new date after midnight, a file
+    larger than max_bytes is rotated to <file>_<YYYY-MM-DD>.log.1, .2, ...
+    """
+
+    def __init__(self, file_name: str, max_bytes: int, backup_count: int):
+        self.file_name = file_name.lower()
+        self.date = datetime.date.today()
+        super().__init__(self.__path(self.date), maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8",
+                         delay=True)
+
+    def __path(self, date: datetime.date) -> str:
+        directory = os.path.join(LOG_DIRECTORY, date.strftime('%Y'), date.strftime('%m'))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{self.file_name}_{date.strftime('%Y-%m-%d')}.log")
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if datetime.date.today() != self.date:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        today = datetime.date.today()
+        if today == self.date:
+            return super().doRollover()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.date = today
+        self.baseFilename = os.path.abspath(self.__path(today))
+
+
+class FileRouter(logging.Handler):
+    """
+    Writes every record to the file named by its log_file attribute. One handler per file is created on the first
+    record, it is called by the listener thread only
+    """
+
+    def __init__(self, max_bytes: int, backup_count: int):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.__handlers = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        file_name = getattr(record, "log_file", DEFAULT_FILE)
+        handler = self.__handlers.get(file_name)
+        if handler is None:
+            handler = DatedFileHandler(file_name, self.max_bytes, self.backup_count)
+            handler.setFormatter(self.formatter)
+            self.__handlers[file_name] = handler
+        handler.handle(record)
+
+    def close(self) -> None:
+        for handler in self.__handlers.values():
+            handler.close()
+        self.__handlers.clear()
+        super().close()
+
+
+class FileLogger(logging.LoggerAdapter):
+    """
+    Logger which marks its records with the file they are written to
+    """
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**kwargs.get("extra", {}), **self.extra}
+        return msg, kwargs
+
+
+class MessageSampler:
+    """
+    Logs one of every `every` messages of a kind at the level, the others at DEBUG. For raw dumps of high-volume
+    stream messages, the skipped ones aren't even formatted unless DEBUG is enabled. The counters aren't locked,
+    concurrent callbacks may shift the sampling slightly
+    """
+
+    def __init__(self, logger: logging.LoggerAdapter, every: int = 100, level: int = logging.INFO):
+        self.logger = logger
+        self.every = every
+        self.level = level
+        self.__counts = {}
+
+    def log(self, kind: str, message) -> None:
+        """
+        :param kind: Kind of the message, every kind is sampled separately
+        :param message: Message to log
+        """
+        count = self.__counts.get(kind, 0)
+        self.__counts[kind] = count + 1
+        if count % self.every == 0:
+            self.logger.log(self.level, message)
+        else:
+            self.logger.debug(message)
+
+
+def configure(level: str | None = None, max_bytes: int | None = None, backup_count: int | None = None,
+              console: bool | None = None) -> None:
+    """
+    Changes the settings of the handlers, must be called before the first get_logger of the process. The defaults
+    are taken from LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT and LOG_CONSOLE environment variables
+    :param level: Level of the root logger
+    :param max_bytes: Size of a log file which is rotated
+    :param backup_count: Number of rotated files of one date which are kept
+    :param console: Write the records to stderr too
+    """
+    for key, value in (("level", level), ("max_bytes", max_bytes), ("backup_count", backup_count),
+                       ("console", console)):
+        if value is not None:
+            _settings[key] = value.upper() if key == "level" else value
+
+
+def _install() -> None:
+    """
+    Replaces the handlers of the root logger with one QueueHandler, the records are formatted and written by the
+    listener thread, so callers never wait for the disk or the console
+    """
+    global _listener
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if _settings["console"]:
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(formatter)
+        handlers.append(stream_handler)
+    file_router = FileRouter(_settings["max_bytes"], _settings["backup_count"])
+    file_router.setFormatter(formatter)
+    handlers.append(file_router)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(_settings["level"])
     logging.getLogger("binance").setLevel(logging.WARNING)
     logging.getLogger("urllib3").setLevel(logging.WARNING)
-    return logging.getLogger(name)
+
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown() -> None:
+    """
+    Writes the queued records and closes the files
+    """
+    global _listener
+    with _install_lock:
+        if _listener is None:
+            return None
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _reinstall_in_child() -> None:
+    # The listener thread isn't copied by fork, the child gets its own queue and listener
+    global _listener, _install_lock
+    _install_lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        _install()
+
+
+def get_logger(name: str, file_name: str) -> FileLogger:
+    """
+    Returns the logger writing to logs/YYYY/MM/<file_name>_<YYYY-MM-DD>.log. Handlers are installed once per process,
+    loggers of one name and file are shared
+    :param name: Name of the logger
+    :param file_name: Name of the log file, e.g. a ticker
+    """
+    with _install_lock:
+        if _listener is None:
+            _install()
+        logger = _loggers.get((name, file_name))
+        if logger is None:
+            logger = FileLogger(logging.getLogger(name), {"log_file": file_name.lower()})
+            _loggers[(name, file_name)] = logger
+        return logger
+
+
+atexit.register(shutdown)
+os.register_at_fork(after_in_child=_reinstall_in_child)
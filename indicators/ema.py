@@ -0,0 +1,91 @@
+import numpy as np
+
+# The in-block weights grow as (1 - alpha) ** -j, the block size is chosen so that they stay below e ** MAX_LOG_SCALE
+MAX_LOG_SCALE = 300
+
+
+def ema(close: np.ndarray, period: int) -> np.ndarray:
+    """
+    Calculates the EMA for the specified series for the specified period
+    :param close: Array of klines closure values
+    :param period: EMA period
+    :return: Array of calculated EMA values
+    """
+    return ema_batch(close, [period])[0]
+
+
+def ema_batch(close: np.ndarray, periods: list | np.ndarray) -> np.ndarray:
+    """
+    Calculates the EMAs of one series for several periods at once.
+    The series is split into blocks, inside a block the EMA is a weighted cumulative sum, so only the last value
+    of every block is carried over sequentially
+    :param close: Array of klines closure values
+    :param periods: EMA periods
+    :return: 2-D array of calculated EMA values, one row per period
+    """
+    close = np.asarray(close, dtype=np.float64)
+    periods = np.asarray(periods, dtype=np.float64).reshape(-1)
+    length = close.shape[0]
+    result = np.empty((periods.shape[0], length), dtype=np.float64)
+    if length == 0 or periods.shape[0] == 0:
+        return result
+
+    alpha = 2 / (periods + 1)
+    # Period 1 (or less) means that EMA repeats the series
+    trivial = alpha >= 1
+    result[trivial] = close
+    if np.all(trivial):
+        return result
+    alpha = alpha[~trivial]
+    log_decay = np.log1p(-alpha)
+
+    block = int(max(1, min(length, MAX_LOG_SCALE // -log_decay.min())))
+    blocks_count = -(-length // block)
+    series = np.zeros(blocks_count * block, dtype=np.float64)
+    series[:length] = close
+    series = series.reshape(blocks_count, block)
+
+    steps = np.arange(block, dtype=np.float64)
+    growth = np.exp(-log_decay[:, None] * steps)
+    shrink = np.exp(log_decay[:, None] * steps)
+    local = np.cumsum(series[None, :, :] * growth[:, None, :], axis=2)
+    local *= (alpha[:, None] * shrink)[:, None, :]
+
+    block_decay = np.exp(log_decay * block)
+    carry = np.empty((alpha.shape[0], blocks_count), dtype=np.float64)
+    previous = np.full(alpha.shape[0], close[0])
+    ends = local[:, :, -1]
+    for index in range(blocks_count):
+        carry[:, index] = previous
+        previous = ends[:, index] + block_decay * previous
+    local += carry[:, :, None] * (shrink * np.exp(log_decay)[:, None])[:, None, :]
+
+    result[~trivial] = local.reshape(alpha.shape[0], -1)[:, :length]
+    return result
+
+
+def macd(close: np.ndarray, fast_period: int, slow_period: int, signal_period: int) -> tuple:
+    """
+    Calculates MACD line, signal line and histogram
+    :param close: Array of klines closure values
+    :param fast_period: Period of short EMA
+    :param slow_period: Period of long EMA
+    :param signal_period: Signal value for EMA
+    :return: Fast EMA, slow EMA, MACD line, signal line and histogram arrays
+    """
+    ema_fast, ema_slow = ema_batch(close, [fast_period, slow_period])
+    macd_line = ema_fast - ema_slow
+    signal = ema(macd_line, signal_period)
+    return ema_fast, ema_slow, macd_line, signal, macd_line - signal
+
+
+def macd_histogram(close: np.ndarray, fast_period: int, slow_period: int, signal_period: int) -> np.ndarray:
+    """
+    Calculates MACD histogram values from the specified EMA durations
+    :param close: Array of klines closure values
+    :param fast_period: Period of short EMA
+    :param slow_period: Period of long EMA
+    :param signal_period: Signal value for EMA
+    :return: Array of calculated MACD histogram values
+    """
+    return macd(close, fast_period, slow_period, signal_period)[-1]
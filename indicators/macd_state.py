@@ -0,0 +1,110 @@
+import numpy as np
+
+from indicators.ema import macd
+
+
+class MACDState:
+    """
+    Streaming MACD state. Keeps the last values of the fast, slow and signal EMAs so that every new closed kline
+    is processed in constant time instead of recalculating the whole history
+    """
+
+    def __init__(self, fast_period: int, slow_period: int, signal_period: int):
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self.signal_period = signal_period
+        self.__fast_alpha = 2 / (fast_period + 1)
+        self.__slow_alpha = 2 / (slow_period + 1)
+        self.__signal_alpha = 2 / (signal_period + 1)
+        self.fast_ema = None
+        self.slow_ema = None
+        self.signal_ema = None
+        self.hist = None
+        self.previous_hist = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.previous_hist is not None
+
+    def seed(self, close: np.ndarray) -> None:
+        """
+        Resets the state and calculates it over the historical closure values
+        :param close: Array of klines closure values
+        """
+        self.fast_ema = None
+        self.slow_ema = None
+        self.signal_ema = None
+        self.hist = None
+        self.previous_hist = None
+        if close.shape[0] == 0:
+            return None
+        ema_fast, ema_slow, _, signal, hist = macd(close, self.fast_period, self.slow_period, self.signal_period)
+        self.fast_ema = float(ema_fast[-1])
+        self.slow_ema = float(ema_slow[-1])
+        self.signal_ema = float(signal[-1])
+        self.hist = float(hist[-1])
+        if hist.shape[0] > 1:
+            self.previous_hist = float(hist[-2])
+
+    def update(self, close: float) -> float:
+        """
+        Adds the closure value of a new kline to the state
+        :param close: Closure value of the kline
+        :return: New value of the MACD histogram
+        """
+        close = float(close)
+        if self.fast_ema is None:
+            self.fast_ema = close
+            self.slow_ema = close
+            self.signal_ema = 0.0
+            self.hist = 0.0
+            return self.hist
+        self.fast_ema = self.__fast_alpha * close + (1 - self.__fast_alpha) * self.fast_ema
+        self.slow_ema = self.__slow_alpha * close + (1 - self.__slow_alpha) * self.slow_ema
+        macd_value = self.fast_ema - self.slow_ema
+        self.signal_ema = self.__signal_alpha * macd_value + (1 - self.__signal_alpha) * self.signal_ema
+        self.previous_hist = self.hist
+        self.hist = macd_value - self.signal_ema
+        return self.hist
+
+    def snapshot(self) -> dict:
+        """
+        :return: Periods and current values of the state, JSON serializable
+        """
+        return {
+            "fast_period": self.fast_period,
+            "slow_period": self.slow_period,
+            "signal_period": self.signal_period,
+            "fast_ema": self.fast_ema,
+            "slow_ema": self.slow_ema,
+            "signal_ema": self.signal_ema,
+            "hist": self.hist,
+            "previous_hist": self.previous_hist
+        }
+
+    def restore(self, snapshot: dict) -> None:
+        """
+        Sets the values of the state from a snapshot
+        :param snapshot: Result of snapshot of a state with the same periods
+        """
+        periods = (snapshot["fast_period"], snapshot["slow_period"], snapshot["signal_period"])
+        if periods != (self.fast_period, self.slow_period, self.signal_period):
+            raise ValueError(f"Snapshot periods {periods} don't match the state "
+                             f"{(self.fast_period, self.slow_period, self.signal_period)}")
+        self.fast_ema = snapshot["fast_ema"]
+        self.slow_ema = snapshot["slow_ema"]
+        self.signal_ema = snapshot["signal_ema"]
+        self.hist = snapshot["hist"]
+        self.previous_hist = snapshot["previous_hist"]
+
+    def matches(self, hist: np.ndarray, rtol: float = 1e-7, atol: float = 1e-8) -> bool:
+        """
+        Compares the state with the last values of the MACD histogram calculated over the whole series
+        :param hist: Array of MACD histogram values
+        :param rtol: Relative tolerance
+        :param atol: Absolute tolerance
+        :return: True if the last two values are equal within the tolerance
+        """
+        if not self.is_ready or hist.shape[0] < 2:
+            return False
+        return bool(np.allclose([self.previous_hist, self.hist], hist[-2:], rtol=rtol, atol=atol))
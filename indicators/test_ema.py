@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from indicators.ema import MAX_LOG_SCALE, ema, ema_batch, macd_histogram
+
+
+def ema_loop(close: np.ndarray, period: int) -> np.ndarray:
+    alpha = 2 / (period + 1)
+    result = np.empty(close.shape[0], dtype=np.float64)
+    result[0] = close[0]
+    for index in range(1, close.shape[0]):
+        result[index] = alpha * close[index] + (1 - alpha) * result[index - 1]
+    return result
+
+
+@pytest.fixture
+def close() -> np.ndarray:
+    rng = np.random.default_rng(7)
+    return 30000 + np.cumsum(rng.normal(0, 50, 5000))
+
+
+@pytest.mark.parametrize("period", [1, 2, 9, 12, 26, 200, 5000])
+def test_ema_matches_loop(close, period):
+    assert np.allclose(ema(close, period), ema_loop(close, period), rtol=1e-12, atol=0)
+
+
+def test_ema_batch_spans_several_blocks(close):
+    periods = [2, 12, 26, 9]
+    # The shortest period gives the smallest block, the series has to be split into many of them
+    assert close.shape[0] > 10 * MAX_LOG_SCALE // -np.log1p(-2 / 3)
+    result = ema_batch(close, periods)
+    assert result.shape == (len(periods), close.shape[0])
+    for row, period in zip(result, periods):
+        assert np.allclose(row, ema_loop(close, period), rtol=1e-12, atol=0)
+
+
+def test_ema_of_short_series(close):
+    assert ema(close[:0], 12).shape == (0,)
+    assert np.array_equal(ema(close[:1], 12), close[:1])
+    assert np.allclose(ema(close[:3], 26), ema_loop(close[:3], 26), rtol=1e-12, atol=0)
+
+
+def test_macd_histogram_matches_loop(close):
+    macd_line = ema_loop(close, 12) - ema_loop(close, 26)
+    expected = macd_line - ema_loop(macd_line, 9)
+    assert np.allclose(macd_histogram(close, 12, 26, 9), expected, rtol=1e-9, atol=1e-9)
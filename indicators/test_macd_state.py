@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from indicators.ema import macd_histogram
+from indicators.macd_state import MACDState
+
+WINDOW = 500
+
+
+@pytest.fixture
+def close() -> np.ndarray:
+    rng = np.random.default_rng(11)
+    return 30000 + np.cumsum(rng.normal(0, 50, 2000))
+
+
+def test_update_matches_batch_over_sliding_window(close):
+    state = MACDState(12, 26, 9)
+    state.seed(close[:WINDOW])
+    assert state.matches(macd_histogram(close[:WINDOW], 12, 26, 9))
+    for index in range(WINDOW, close.shape[0]):
+        hist = state.update(close[index])
+        window_hist = macd_histogram(close[index + 1 - WINDOW:index + 1], 12, 26, 9)
+        assert hist == pytest.approx(window_hist[-1], rel=1e-7, abs=1e-8)
+        assert state.matches(window_hist)
+
+
+def test_update_from_empty_state_matches_batch(close):
+    state = MACDState(12, 26, 9)
+    assert not state.is_ready
+    hists = [state.update(value) for value in close[:300]]
+    assert state.is_ready
+    assert np.allclose(hists, macd_histogram(close[:300], 12, 26, 9), rtol=1e-9, atol=1e-9)
+
+
+def test_seed_resets_state(close):
+    state = MACDState(12, 26, 9)
+    for value in close[:100]:
+        state.update(value)
+    state.seed(close[:0])
+    assert state.hist is None and not state.is_ready
+    state.seed(close[:1])
+    assert state.hist == 0 and not state.is_ready
+
+
+def test_restore_continues_like_original(close):
+    state = MACDState(12, 26, 9)
+    state.seed(close[:WINDOW])
+    restored = MACDState(12, 26, 9)
+    restored.restore(state.snapshot())
+    for value in close[WINDOW:WINDOW + 50]:
+        assert restored.update(value) == state.update(value)
+    with pytest.raises(ValueError):
+        MACDState(5, 35, 5).restore(state.snapshot())
@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from configparser import ConfigParser
+
+import click
+
+import general_logger
+from backtest import read_macd_config, to_timestamp
+from binance_rest import SignedRestClient
+from databases_connectors.klines_db import DatabaseConnector
+from exchange_info import ExchangeInfoCache
+from klines_downloader import KlinesDownloader
+from objects.intervals import INTERVALS_MS
+
+
+class KlinesIngestion:
+    """
+    Backfills the klines table for many tickers and intervals. Every (ticker, interval) pair is downloaded by its own
+    thread, all threads share one downloader and therefore one rate-limit budget. The download continues from the
+    latest stored kline, and the rows are upserted, so the command can be interrupted and run again at any time
+    """
+
+    def __init__(self, db: DatabaseConnector, downloader: KlinesDownloader, chunk_size: int = 5000):
+        self.logger = general_logger.get_logger("Klines Ingestion", "ingest_klines")
+        self.__db = db
+        self.__downloader = downloader
+        self.__chunk_size = chunk_size
+
+    def ingest(self, ticker: str, interval: str, start_time: int, end_time: int | None = None) -> int:
+        """
+        Downloads and stores the missing klines of one ticker
+        :param ticker: Ticker name
+        :param interval: Klines duration
+        :param start_time: Start of the range in ms, used if there are no stored klines
+        :param end_time: End of the range in ms, now if None
+        :return: Number of written klines
+        """
+        last_open_time = self.__db.select_last_open_time(ticker, interval)
+        if last_open_time is not None:
+            start_time = max(start_time, int(last_open_time) + 1)
+        written = 0
+        chunk = []
+        for page in self.__downloader.pages(ticker, interval, start_time, end_time):
+            chunk.extend(page)
+            if len(chunk) >= self.__chunk_size:
+                written += self.__db.upsert_data(ticker, chunk, interval, self.__chunk_size)
+                self.logger.info(f"{ticker} {interval}: {written} klines, up to {chunk[-1]['open_time']}")
+                chunk = []
+        if chunk:
+            written += self.__db.upsert_data(ticker, chunk, interval, self.__chunk_size)
+        self.logger.info(f"{ticker} {interval}: done, {written} klines")
+        return written
+
+    def run(self, tickers: list, intervals: list, start_time: int, end_time: int | None = None,
+            workers: int = 8) -> dict:
+        """
+        Ingests every pair of ticker and interval concurrently
+        :return: Number of written klines for every pair, None for the failed ones
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Ingestion") as executor:
+            futures = {executor.submit(self.ingest, ticker, interval, start_time, end_time): (ticker, interval)
+                       for ticker in tickers for interval in intervals}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as ingestion_exception:
+                    self.logger.error(f"{futures[future]} hasn't been ingested", exc_info=ingestion_exception)
+                    results[futures[future]] = None
+        return results
+
+
+@click.command()
+@click.argument("tickers", nargs=-1)
+@click.option("--config", "config_tickers", is_flag=True, help="Ingest every ticker from configs/macd_config.json")
+@click.option("--all", "all_tickers", is_flag=True,
+              help="Ingest every futures symbol with the quote asset which is traded on spot, the klines are spot ones")
+@click.option("--quote", default="USDT", help="Quote asset of the symbols for --all")
+@click.option("--intervals", default="1m", help="Klines durations, e.g. 1m,1h")
+@click.option("--start", default="2019-09-01", help="Start date for tickers without stored klines, YYYY-MM-DD")
+@click.option("--finish", default=None, help="End date, YYYY-MM-DD")
+@click.option("--workers", default=8, help="Number of concurrently downloaded pairs of ticker and interval")
+@click.option("--chunk-size", default=5000, help="Number of klines written in one transaction")
+def run(tickers, config_tickers, all_tickers, quote, intervals, start, finish, workers, chunk_size):
+    tickers = [ticker.upper() for ticker in tickers]
+    if config_tickers:
+        tickers += list(read_macd_config().keys())
+    downloader = KlinesDownloader()
+    if all_tickers:
+        config = ConfigParser()
+        config.read("config.ini")
+        exchange_info = ExchangeInfoCache(SignedRestClient(config['main']['base_url'], None, None))
+        futures_symbols = [symbol for symbol, filters in exchange_info.symbols().items()
+                           if filters.quote_asset == quote]
+        spot_symbols = downloader.symbols()
+        missing = [symbol for symbol in futures_symbols if symbol not in spot_symbols]
+        if missing:
+            click.echo(f"Skipped futures symbols without spot klines: {', '.join(missing)}")
+        tickers += [symbol for symbol in futures_symbols if symbol in spot_symbols]
+    tickers = list(dict.fromkeys(tickers))
+    if not tickers:
+        raise click.UsageError("Specify at least one ticker, --config or --all")
+    intervals = intervals.split(",")
+    for interval in intervals:
+        if interval not in INTERVALS_MS:
+            raise click.BadParameter(f"Unknown interval {interval}", param_hint="--intervals")
+
+    ingestion = KlinesIngestion(DatabaseConnector(), downloader, chunk_size)
+    started_at = time.perf_counter()
+    results = ingestion.run(tickers, intervals, to_timestamp(start), to_timestamp(finish), workers)
+    written = sum(count for count in results.values() if count is not None)
+    failed = [f"{ticker} {interval}" for (ticker, interval), count in results.items() if count is None]
+    click.echo(f"{written} klines have been written in {time.perf_counter() - started_at:.1f} s")
+    if failed:
+        click.echo(f"Failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,89 @@
+import time
+from configparser import ConfigParser
+
+from binance_rest import RequestScheduler, SignedRestClient
+
+
+class KlinesDownloader:
+    """
+    Downloads closed klines from the spot REST API page by page
+    """
+    PAGE_LIMIT = 1000
+
+    config = ConfigParser()
+    config.read("config.ini")
+
+    def __init__(self, rest_client: SignedRestClient | None = None):
+        if rest_client is None:
+            rest_client = SignedRestClient(self.config['main']['base_url_spot'], None, None,
+                                           scheduler=RequestScheduler(weight_limit=6000),
+                                           time_path="/api/v3/time")
+        self.rest_client = rest_client
+
+    def symbols(self) -> set:
+        """
+        :return: Spot symbols which are trading, their klines can be downloaded
+        """
+        response = self.rest_client.request("GET", "/api/v3/exchangeInfo", signed=False)
+        if response.status_code != 200:
+            raise ConnectionError(response.text)
+        return {symbol["symbol"] for symbol in response.json()["symbols"] if symbol["status"] == "TRADING"}
+
+    def fetch_page(self, ticker: str, interval: str, start_time: int, end_time: int) -> list:
+        """
+        Requests one page of klines
+        :return: Klines in the exchange format sorted by open time
+        """
+        response = self.rest_client.request("GET", "/api/v3/klines", {
+            "symbol": ticker,
+            "interval": interval,
+            "startTime": start_time,
+            "endTime": end_time,
+            "limit": self.PAGE_LIMIT
+        }, signed=False)
+        if response.status_code != 200:
+            raise ConnectionError(response.text)
+        return response.json()
+
+    def fetch(self, ticker: str, interval: str, start_time: int, end_time: int | None = None) -> list[dict]:
+        """
+        Downloads all closed klines with open time in the range
+        :param ticker: Ticker name
+        :param interval: Klines duration, e.g. 1h
+        :param start_time: Start of the range in ms
+        :param end_time: End of the range in ms, now if None
+        :return: Klines as dictionaries with the columns of the klines table
+        """
+        klines = []
+        for page in self.pages(ticker, interval, start_time, end_time):
+            klines.extend(page)
+        return klines
+
+    def pages(self, ticker: str, interval: str, start_time: int, end_time: int | None = None):
+        """
+        Iterates over the range page by page, the same as fetch but without keeping the whole range in memory
+        :return: Generator of lists of closed klines as dictionaries with the columns of the klines table
+        """
+        now = int(time.time() * 1000)
+        end_time = now if end_time is None else min(end_time, now)
+        while start_time <= end_time:
+            page = self.fetch_page(ticker, interval, start_time, end_time)
+            # The last kline may be still open
+            closed = [self.to_row(row) for row in page if int(row[6]) < now]
+            if closed:
+                yield closed
+            if len(page) < self.PAGE_LIMIT:
+                break
+            start_time = int(page[-1][0]) + 1
+
+    @staticmethod
+    def to_row(kline: list) -> dict:
+        return {
+            "open_time": int(kline[0]),
+            "open": kline[1],
+            "high": kline[2],
+            "low": kline[3],
+            "close": kline[4],
+            "volume": kline[5],
+            "close_time": int(kline[6])
+        }
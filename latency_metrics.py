@@ -0,0 +1,173 @@
+import json
+import math
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+
+import general_logger
+
+MIN_SECONDS = 1e-5
+BUCKETS_PER_DOUBLING = 2
+BUCKETS = 48
+
+
+class LatencyHistogram:
+    """
+    Histogram with fixed logarithmic buckets from 10 us to about 3 minutes, two buckets per doubling.
+    Recording a value is a logarithm and an increment, so it can be called on the callback thread
+    """
+    BOUNDS = [MIN_SECONDS * 2 ** (index / BUCKETS_PER_DOUBLING) for index in range(BUCKETS)]
+
+    def __init__(self):
+        self.__lock = Lock()
+        self.counts = [0] * (BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        if seconds <= MIN_SECONDS:
+            index = 0
+        else:
+            index = min(math.ceil(BUCKETS_PER_DOUBLING * math.log2(seconds / MIN_SECONDS)), BUCKETS)
+        with self.__lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, percent: float) -> float:
+        """
+        :return: Upper bound of the bucket with the percentile, the maximum for the last bucket
+        """
+        with self.__lock:
+            if self.count == 0:
+                return 0.0
+            rank = math.ceil(self.count * percent / 100)
+            cumulative = 0
+            for index, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= rank:
+                    return min(self.BOUNDS[index], self.max) if index < BUCKETS else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max
+        }
+
+
+class LatencyRecorder:
+    """
+    Latency histograms by ticker and stage of the signal path
+    """
+
+    def __init__(self):
+        self.logger = general_logger.get_logger("Latency", "latency")
+        self.__histograms = {}
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__report_thread = None
+        self.__server = None
+
+    def record(self, ticker: str, stage: str, seconds: float) -> None:
+        """
+        Adds a measurement
+        :param ticker: Ticker name
+        :param stage: Stage of the signal path
+        :param seconds: Duration of the stage
+        """
+        histogram = self.__histograms.get((ticker, stage))
+        if histogram is None:
+            with self.__lock:
+                histogram = self.__histograms.setdefault((ticker, stage), LatencyHistogram())
+        histogram.record(seconds)
+
+    def since(self, ticker: str, stage: str, started: float) -> None:
+        """
+        Adds the time passed since the perf_counter value
+        """
+        self.record(ticker, stage, time.perf_counter() - started)
+
+    def summary(self) -> dict:
+        with self.__lock:
+            histograms = list(self.__histograms.items())
+        return {f"{ticker} {stage}": histogram.summary() for (ticker, stage), histogram in sorted(histograms)}
+
+    def prometheus(self) -> str:
+        """
+        :return: Histograms in the Prometheus text format
+        """
+        with self.__lock:
+            histograms = sorted(self.__histograms.items())
+        lines = ["# TYPE bot_stage_latency_seconds histogram"]
+        for (ticker, stage), histogram in histograms:
+            labels = f'ticker="{ticker}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(LatencyHistogram.BOUNDS, histogram.counts):
+                cumulative += count
+                lines.append(f'bot_stage_latency_seconds_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'bot_stage_latency_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"bot_stage_latency_seconds_sum{{{labels}}} {histogram.total}")
+            lines.append(f"bot_stage_latency_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def start_reporting(self, interval: float = 60) -> None:
+        """
+        Logs the summary of every histogram periodically
+        """
+        if self.__report_thread is not None:
+            return None
+        self.__report_thread = Thread(target=self.__report, args=(interval,), name="LatencyReport", daemon=True)
+        self.__report_thread.start()
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> None:
+        """
+        Starts the HTTP endpoint with /metrics (Prometheus) and /metrics.json
+        """
+        recorder = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = recorder.prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(recorder.summary()), "application/json"
+                else:
+                    self.send_error(404)
+                    return None
+                payload = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.__server.daemon_threads = True
+        Thread(target=self.__server.serve_forever, name="MetricsServer", daemon=True).start()
+        self.logger.info(f"Metrics are served on http://{host}:{port}/metrics")
+
+    def stop(self) -> None:
+        self.__stopped.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server = None
+
+    def __report(self, interval: float) -> None:
+        while not self.__stopped.wait(interval):
+            for name, summary in self.summary().items():
+                self.logger.info(f"{name}: count={summary['count']} p50={summary['p50'] * 1000:.2f}ms "
+                                 f"p99={summary['p99'] * 1000:.2f}ms max={summary['max'] * 1000:.2f}ms")
+
+
+latency = LatencyRecorder()
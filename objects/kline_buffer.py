@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class KlineBuffer:
+    """
+    Fixed-size ring buffer of closed klines backed by preallocated NumPy arrays.
+    Every value is written twice (at index i and i + capacity), so the ordered history is always a contiguous slice
+    and can be returned as a view without copying
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.__open_time = np.zeros(2 * capacity, dtype=np.int64)
+        self.__close = np.zeros(2 * capacity, dtype=np.float64)
+        self.__close_time = np.zeros(2 * capacity, dtype=np.int64)
+        self.__start = 0
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def last_open_time(self) -> int | None:
+        if self.__size == 0:
+            return None
+        return int(self.__open_time[self.__start + self.__size - 1])
+
+    @property
+    def open_time(self) -> np.ndarray:
+        return self.__view(self.__open_time)
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.__view(self.__close)
+
+    @property
+    def close_time(self) -> np.ndarray:
+        return self.__view(self.__close_time)
+
+    def append(self, open_time: int, close: float, close_time: int) -> bool:
+        """
+        Adds a closed kline to the buffer, replacing the oldest one if the buffer is full
+        :param open_time: Kline open time in ms
+        :param close: Closure value of the kline
+        :param close_time: Kline close time in ms
+        :return: False if the kline is a duplicate or older than the last stored one, otherwise True
+        """
+        last_open_time = self.last_open_time
+        if last_open_time is not None and open_time <= last_open_time:
+            return False
+        if self.__size < self.capacity:
+            position = self.__size
+            self.__size += 1
+        else:
+            position = self.__start
+            self.__start = (self.__start + 1) % self.capacity
+        for array, value in ((self.__open_time, open_time), (self.__close, close), (self.__close_time, close_time)):
+            array[position] = value
+            array[position + self.capacity] = value
+        return True
+
+    def extend(self, open_time: np.ndarray, close: np.ndarray, close_time: np.ndarray) -> int:
+        """
+        Adds several closed klines sorted by open time
+        :return: Number of klines that have been added
+        """
+        if self.__size == 0 and open_time.shape[0] > 0 and np.all(np.diff(open_time) > 0):
+            count = min(open_time.shape[0], self.capacity)
+            for array, values in ((self.__open_time, open_time), (self.__close, close),
+                                  (self.__close_time, close_time)):
+                array[:count] = values[-count:]
+                array[self.capacity:self.capacity + count] = values[-count:]
+            self.__size = count
+            return count
+        added = 0
+        for kline in zip(open_time.tolist(), close.tolist(), close_time.tolist()):
+            added += self.append(*kline)
+        return added
+
+    def __view(self, array: np.ndarray) -> np.ndarray:
+        view = array[self.__start:self.__start + self.__size]
+        view.flags.writeable = False
+        return view
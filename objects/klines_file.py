@@ -0,0 +1,201 @@
+import fcntl
+import os
+import struct
+
+import numpy as np
+
+COLUMN_TYPES = {
+    "open_time": np.dtype("<i8"),
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+    "close_time": np.dtype("<i8")
+}
+
+
+class KlinesFile:
+    """
+    Append-only columnar file set of closed klines of one ticker and interval.
+    The directory holds a header (magic, version, number of committed klines, generation) and one raw little-endian
+    file per column and generation. Columns are memory-mapped read-only, so slices are views of the page cache
+    shared by all processes. Klines are written to the column files first and committed by updating the count in
+    the header, a reader never sees a partially written kline. Mapped files are never shrunk: a rebuild writes a
+    new generation of column files, switches the header to it and unlinks the old files, the mappings of readers
+    stay valid and the readers remap on their next call
+    """
+    MAGIC = b"KLNS"
+    VERSION = 2
+    HEADER = struct.Struct("<4sIQQ")
+    COMMIT = struct.Struct("<QQ")
+    COUNT_OFFSET = 8
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.__header_path = os.path.join(path, "header")
+        if not os.path.exists(self.__header_path):
+            with open(self.__header_path, "wb") as header_file:
+                header_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, 0))
+        with open(self.__header_path, "r+b") as header_file:
+            fcntl.flock(header_file, fcntl.LOCK_EX)
+            magic, version = struct.unpack("<4sI", header_file.read(8))
+            if magic != self.MAGIC or version > self.VERSION:
+                raise ValueError(f"{path} isn't a klines file of version {self.VERSION}")
+            if version < self.VERSION:
+                # The cache is filled again from the database, the old files are unlinked, not truncated
+                for column in COLUMN_TYPES:
+                    if os.path.exists(os.path.join(path, f"{column}.bin")):
+                        os.unlink(os.path.join(path, f"{column}.bin"))
+                header_file.seek(0)
+                header_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, 0))
+                header_file.truncate()
+        self.__state = None
+        self.__columns = {}
+
+    def __len__(self) -> int:
+        return self.__read_state()[0]
+
+    @property
+    def first_open_time(self) -> int | None:
+        open_time = self.columns()["open_time"]
+        return int(open_time[0]) if open_time.shape[0] else None
+
+    @property
+    def last_open_time(self) -> int | None:
+        open_time = self.columns()["open_time"]
+        return int(open_time[-1]) if open_time.shape[0] else None
+
+    def columns(self) -> dict:
+        """
+        :return: Read-only arrays of all committed klines, remapped if other writers have appended klines
+        """
+        while True:
+            state = self.__read_state()
+            if state == self.__state:
+                return self.__columns
+            count, generation = state
+            try:
+                self.__columns = {column: self.__map(column, generation, dtype, count)
+                                  for column, dtype in COLUMN_TYPES.items()}
+            except FileNotFoundError:
+                # The generation has been replaced by a rebuild after the header was read
+                continue
+            self.__state = state
+            return self.__columns
+
+    def slice(self, ts_start: int | None = None, ts_finish: int | None = None) -> dict:
+        """
+        Selects klines with open time in the range without copying
+        :param ts_start: Start of the range in ms
+        :param ts_finish: End of the range in ms
+        :return: Views of the columns
+        """
+        columns = self.columns()
+        open_time = columns["open_time"]
+        start = 0 if ts_start is None else int(np.searchsorted(open_time, ts_start, side="left"))
+        finish = open_time.shape[0] if ts_finish is None else int(np.searchsorted(open_time, ts_finish, side="right"))
+        return {column: values[start:finish] for column, values in columns.items()}
+
+    def latest(self, count: int) -> dict:
+        """
+        :return: Views of the columns of the last klines
+        """
+        columns = self.columns()
+        start = max(columns["open_time"].shape[0] - count, 0)
+        return {column: values[start:] for column, values in columns.items()}
+
+    def append(self, columns: dict) -> int:
+        """
+        Appends klines sorted by open time, the klines not newer than the last stored one are skipped
+        :param columns: Arrays or lists for every column of COLUMN_TYPES
+        :return: Number of appended klines
+        """
+        with open(self.__header_path, "r+b") as header_file:
+            fcntl.flock(header_file, fcntl.LOCK_EX)
+            count, generation = self.__read_state(header_file)
+            added = self.__write(columns, count, generation)
+            if added > 0:
+                self.__commit(header_file, count + added, generation)
+        return added
+
+    def append_rows(self, rows: list) -> int:
+        """
+        Appends klines given as dictionaries with the columns of the klines table
+        :return: Number of appended klines
+        """
+        return self.append({column: [row[column] for row in rows] for column in COLUMN_TYPES})
+
+    def rebuild(self, chunks) -> int:
+        """
+        Replaces all klines with the given ones. They are written to a new generation of the column files, which is
+        switched to at once, the old files are unlinked, so the views of readers stay valid
+        :param chunks: Iterable of column dictionaries sorted by open time, e.g. DatabaseConnector.iter_columns
+        :return: Number of stored klines
+        """
+        with open(self.__header_path, "r+b") as header_file:
+            fcntl.flock(header_file, fcntl.LOCK_EX)
+            old_generation = self.__read_state(header_file)[1]
+            generation = old_generation + 1
+            for column in COLUMN_TYPES:
+                open(self.__column_path(column, generation), "wb").close()
+            count = 0
+            for chunk in chunks:
+                count += self.__write(chunk, count, generation)
+            self.__commit(header_file, count, generation)
+            for column in COLUMN_TYPES:
+                if os.path.exists(self.__column_path(column, old_generation)):
+                    os.unlink(self.__column_path(column, old_generation))
+        return count
+
+    def __write(self, columns: dict, count: int, generation: int) -> int:
+        """
+        Writes the klines newer than the last stored one after the committed ones, the caller holds the lock
+        :return: Number of written klines
+        """
+        open_time = np.asarray(columns["open_time"], dtype=COLUMN_TYPES["open_time"])
+        last_open_time = self.__last_stored(count, generation)
+        start = 0 if last_open_time is None else int(np.searchsorted(open_time, last_open_time, side="right"))
+        added = open_time.shape[0] - start
+        if added <= 0:
+            return 0
+        for column, dtype in COLUMN_TYPES.items():
+            values = np.asarray(columns[column], dtype=dtype)[start:]
+            with open(self.__column_path(column, generation), "ab") as column_file:
+                # Drops the tail of an interrupted append, it is beyond every mapped range
+                column_file.truncate(count * dtype.itemsize)
+                column_file.write(values.tobytes())
+        return added
+
+    def __commit(self, header_file, count: int, generation: int) -> None:
+        header_file.seek(self.COUNT_OFFSET)
+        header_file.write(self.COMMIT.pack(count, generation))
+        header_file.flush()
+
+    def __read_state(self, header_file=None) -> tuple:
+        """
+        :return: Number of committed klines and generation of the column files
+        """
+        if header_file is None:
+            with open(self.__header_path, "rb") as header_file:
+                return self.HEADER.unpack(header_file.read(self.HEADER.size))[2:]
+        header_file.seek(0)
+        return self.HEADER.unpack(header_file.read(self.HEADER.size))[2:]
+
+    def __last_stored(self, count: int, generation: int) -> int | None:
+        if count == 0:
+            return None
+        with open(self.__column_path("open_time", generation), "rb") as column_file:
+            column_file.seek((count - 1) * COLUMN_TYPES["open_time"].itemsize)
+            return struct.unpack("<q", column_file.read(8))[0]
+
+    def __map(self, column: str, generation: int, dtype: np.dtype, count: int) -> np.ndarray:
+        if count == 0:
+            values = np.empty(0, dtype=dtype)
+            values.flags.writeable = False
+            return values
+        return np.memmap(self.__column_path(column, generation), dtype=dtype, mode="r", shape=(count,))
+
+    def __column_path(self, column: str, generation: int) -> str:
+        return os.path.join(self.path, f"{column}.{generation}.bin")
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from objects.kline_buffer import KlineBuffer
+
+MINUTE = 60000
+
+
+def klines(count: int, start: int = 0) -> tuple:
+    open_time = np.arange(start, start + count, dtype=np.int64) * MINUTE
+    return open_time, open_time / MINUTE + 0.5, open_time + MINUTE - 1
+
+
+def test_append_wraps_around():
+    buffer = KlineBuffer(5)
+    assert len(buffer) == 0 and buffer.last_open_time is None
+    for index, kline in enumerate(zip(*klines(13))):
+        assert buffer.append(*kline)
+        expected = klines(13)[1][max(0, index - 4):index + 1]
+        assert np.array_equal(buffer.close, expected)
+        assert len(buffer) == min(index + 1, 5)
+        assert buffer.last_open_time == index * MINUTE
+    open_time, close, close_time = klines(5, 8)
+    assert np.array_equal(buffer.open_time, open_time)
+    assert np.array_equal(buffer.close_time, close_time)
+
+
+def test_views_are_contiguous_and_read_only():
+    buffer = KlineBuffer(4)
+    for kline in zip(*klines(7)):
+        buffer.append(*kline)
+    close = buffer.close
+    assert close.flags.c_contiguous
+    assert not close.flags.writeable
+    with pytest.raises(ValueError):
+        close[0] = 0
+
+
+def test_append_skips_old_and_duplicate_klines():
+    buffer = KlineBuffer(3)
+    buffer.append(2 * MINUTE, 2.5, 3 * MINUTE - 1)
+    assert not buffer.append(2 * MINUTE, 9.0, 3 * MINUTE - 1)
+    assert not buffer.append(MINUTE, 9.0, 2 * MINUTE - 1)
+    assert np.array_equal(buffer.close, [2.5])
+
+
+def test_extend_keeps_newest_klines():
+    buffer = KlineBuffer(5)
+    assert buffer.extend(*klines(8)) == 5
+    assert np.array_equal(buffer.close, klines(8)[1][-5:])
+    # The klines up to the last stored one are skipped, the rest go through the ring
+    assert buffer.extend(*klines(4, 6)) == 2
+    assert np.array_equal(buffer.open_time, klines(5, 5)[0])
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+from objects.klines_file import COLUMN_TYPES, KlinesFile
+
+MINUTE = 60000
+
+
+def klines(count: int, start: int = 0, price: float = 100) -> dict:
+    open_time = np.arange(start, start + count, dtype=np.int64) * MINUTE
+    values = price + np.arange(start, start + count, dtype=np.float64)
+    return {"open_time": open_time, "open": values, "high": values + 1, "low": values - 1, "close": values,
+            "volume": np.ones(count), "close_time": open_time + MINUTE - 1}
+
+
+def test_append_skips_stored_klines(tmp_path):
+    klines_file = KlinesFile(str(tmp_path))
+    assert len(klines_file) == 0 and klines_file.last_open_time is None
+    assert klines_file.append(klines(5)) == 5
+    assert klines_file.append(klines(5, 3)) == 3
+    assert len(klines_file) == 8
+    assert klines_file.first_open_time == 0 and klines_file.last_open_time == 7 * MINUTE
+    assert np.array_equal(klines_file.columns()["close"], klines(8)["close"])
+    for column, dtype in COLUMN_TYPES.items():
+        assert klines_file.columns()[column].dtype == dtype
+
+
+def test_append_rows(tmp_path):
+    klines_file = KlinesFile(str(tmp_path))
+    columns = klines(3)
+    rows = [{column: values[index] for column, values in columns.items()} for index in range(3)]
+    assert klines_file.append_rows(rows) == 3
+    assert np.array_equal(klines_file.columns()["high"], columns["high"])
+
+
+def test_slice_and_latest(tmp_path):
+    klines_file = KlinesFile(str(tmp_path))
+    klines_file.append(klines(10))
+    selected = klines_file.slice(2 * MINUTE, 4 * MINUTE)
+    assert np.array_equal(selected["open_time"], klines(3, 2)["open_time"])
+    assert np.array_equal(klines_file.latest(4)["close"], klines(4, 6)["close"])
+    assert klines_file.latest(20)["close"].shape == (10,)
+
+
+def test_reader_remaps_after_append(tmp_path):
+    writer = KlinesFile(str(tmp_path))
+    reader = KlinesFile(str(tmp_path))
+    writer.append(klines(4))
+    old_close = reader.columns()["close"]
+    writer.append(klines(3, 4))
+    assert old_close.shape == (4,)
+    assert np.array_equal(reader.columns()["close"], klines(7)["close"])
+
+
+def test_rebuild_keeps_views_of_readers(tmp_path):
+    writer = KlinesFile(str(tmp_path))
+    reader = KlinesFile(str(tmp_path))
+    writer.append(klines(6))
+    old_columns = reader.columns()
+    old_files = set(os.listdir(tmp_path))
+
+    chunks = [klines(3, 0, price=500), klines(4, 3, price=500)]
+    assert writer.rebuild(chunks) == 7
+    # The old generation is unlinked, the mapped pages stay readable with the old values
+    assert old_files.isdisjoint(set(os.listdir(tmp_path)) - {"header"})
+    assert np.array_equal(old_columns["close"], klines(6)["close"])
+
+    assert np.array_equal(reader.columns()["close"], klines(7, price=500)["close"])
+    assert reader.append(klines(2, 7, price=500)) == 2
+    assert np.array_equal(writer.columns()["close"], klines(9, price=500)["close"])
+
+
+def test_rebuild_to_empty(tmp_path):
+    klines_file = KlinesFile(str(tmp_path))
+    klines_file.append(klines(3))
+    assert klines_file.rebuild([]) == 0
+    assert len(klines_file) == 0 and klines_file.first_open_time is None
+    assert klines_file.append(klines(2)) == 2
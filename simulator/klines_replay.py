@@ -0,0 +1,192 @@
+import time
+from threading import Event, Lock, Thread
+
+import numpy as np
+
+import general_logger
+from objects.intervals import INTERVALS_MS
+from simulator.matching_engine import MatchingEngine
+from simulator.websocket_server import StreamHub
+
+PRICE_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+class KlinesReplay:
+    """
+    Replays stored klines as the live market. Times are shifted so that the replay start becomes the current time,
+    the shift is a multiple of the longest streamed interval, so the klines stay aligned. Every base kline moves
+    the price in the matching engine, closed klines of the streamed intervals are published to the kline streams
+    and the klines before the replay clock are served by the REST API
+    """
+
+    def __init__(self, klines: dict, base_interval: str, stream_intervals: dict, engine: MatchingEngine,
+                 hub: StreamHub, replay_from: int, speed: float = 1.0):
+        """
+        :param klines: Columns of the base klines by symbol, e.g. views of the klines cache files
+        :param base_interval: Duration of the stored klines
+        :param stream_intervals: Streamed klines durations by symbol
+        :param replay_from: Open time of the first replayed kline in ms
+        :param speed: Replay speed relative to the real time, 0 - as fast as possible
+        """
+        self.logger = general_logger.get_logger("Simulator Replay", "simulator")
+        self.klines = klines
+        self.base_interval = base_interval
+        self.base_ms = INTERVALS_MS[base_interval]
+        self.stream_intervals = stream_intervals
+        self.engine = engine
+        self.hub = hub
+        self.replay_from = replay_from
+        self.speed = speed
+        longest = max([INTERVALS_MS[interval] for intervals in stream_intervals.values() for interval in intervals],
+                      default=self.base_ms)
+        self.offset = (int(time.time() * 1000) - replay_from) // longest * longest
+        self.finished = Event()
+        self.__stopped = Event()
+        self.__clock = replay_from
+        self.__clock_lock = Lock()
+        self.__thread = None
+        for symbol, columns in klines.items():
+            # The engine needs a price before the first order
+            position = int(np.searchsorted(columns["open_time"], replay_from)) - 1
+            if position >= 0:
+                self.engine.update_kline(symbol, *(columns[column][position] for column in PRICE_COLUMNS[:4]),
+                                         int(columns["close_time"][position]) + self.offset)
+
+    @property
+    def now(self) -> int:
+        """
+        :return: Current time of the replay, shifted, in ms
+        """
+        with self.__clock_lock:
+            return self.__clock + self.offset
+
+    def symbols(self) -> list:
+        return list(self.klines)
+
+    def start(self) -> None:
+        self.__thread = Thread(target=self.run, name="SimulatorReplay", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        self.__stopped.set()
+
+    def run(self) -> None:
+        ends = [int(columns["open_time"][-1]) for columns in self.klines.values() if columns["open_time"].shape[0]]
+        if not ends:
+            self.finished.set()
+            return None
+        last_open_time = max(ends)
+        positions = {symbol: int(np.searchsorted(columns["open_time"], self.replay_from))
+                     for symbol, columns in self.klines.items()}
+        aggregates = {(symbol, interval): None for symbol, intervals in self.stream_intervals.items()
+                      for interval in intervals}
+        self.logger.info(f"Replay of {len(self.klines)} symbols has been started")
+        started = time.perf_counter()
+        steps = 0
+        for open_time in range(self.replay_from, last_open_time + 1, self.base_ms):
+            if self.__stopped.is_set():
+                break
+            for symbol, columns in self.klines.items():
+                position = positions[symbol]
+                if position >= columns["open_time"].shape[0] or columns["open_time"][position] != open_time:
+                    continue
+                positions[symbol] = position + 1
+                bar = [columns[column][position] for column in PRICE_COLUMNS]
+                close_time = int(columns["close_time"][position]) + self.offset
+                self.engine.update_kline(symbol, *bar[:4], close_time)
+                for interval in self.stream_intervals.get(symbol, ()):
+                    aggregates[(symbol, interval)] = self.__aggregate(symbol, interval, aggregates[(symbol, interval)],
+                                                                      open_time, bar)
+            with self.__clock_lock:
+                self.__clock = open_time + self.base_ms
+            steps += 1
+            if self.speed > 0:
+                delay = started + steps * self.base_ms / 1000 / self.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        self.logger.info(f"Replay has been finished after {steps} klines")
+        self.finished.set()
+
+    def __aggregate(self, symbol: str, interval: str, aggregate: list | None, open_time: int, bar: list) -> list | None:
+        """
+        Adds the base kline to the kline of the streamed interval and publishes it when the interval is closed
+        :return: Kline which is still open or None
+        """
+        interval_ms = INTERVALS_MS[interval]
+        kline_open_time = open_time // interval_ms * interval_ms
+        if aggregate is None or aggregate[0] != kline_open_time:
+            aggregate = [kline_open_time, *bar]
+        else:
+            aggregate[2] = max(aggregate[2], bar[1])
+            aggregate[3] = min(aggregate[3], bar[2])
+            aggregate[4] = bar[3]
+            aggregate[5] += bar[4]
+        if open_time + self.base_ms < kline_open_time + interval_ms:
+            return aggregate
+        kline_open_time += self.offset
+        self.hub.publish(f"{symbol.lower()}@kline_{interval}", {
+            "e": "kline",
+            "E": kline_open_time + interval_ms,
+            "s": symbol,
+            "k": {
+                "t": kline_open_time,
+                "T": kline_open_time + interval_ms - 1,
+                "s": symbol,
+                "i": interval,
+                "f": 0,
+                "L": 0,
+                "o": str(aggregate[1]),
+                "c": str(aggregate[4]),
+                "h": str(aggregate[2]),
+                "l": str(aggregate[3]),
+                "v": str(aggregate[5]),
+                "n": 0,
+                "x": True,
+                "q": "0",
+                "V": "0",
+                "Q": "0",
+                "B": "0"
+            }
+        })
+        return None
+
+    def history(self, symbol: str, interval: str, start_time: int | None = None, end_time: int | None = None,
+                limit: int = 500) -> list:
+        """
+        Klines closed before the replay clock in the format of GET /api/v3/klines
+        """
+        columns = self.klines.get(symbol)
+        if columns is None:
+            return []
+        interval_ms = INTERVALS_MS[interval]
+        ratio = max(interval_ms // self.base_ms, 1)
+        now = self.now
+        end_time = now if end_time is None else min(int(end_time), now)
+        if start_time is None:
+            start_time = (end_time // interval_ms - limit) * interval_ms
+        start_time = -(-int(start_time) // interval_ms) * interval_ms
+        open_time = columns["open_time"]
+        start = int(np.searchsorted(open_time, start_time - self.offset))
+        finish = int(np.searchsorted(open_time, end_time - self.offset, side="right"))
+        finish = min(finish, start + (limit + 1) * ratio)
+        if start >= finish:
+            return []
+        keys = open_time[start:finish] // interval_ms
+        _, first = np.unique(keys, return_index=True)
+        klines = {
+            "open_time": keys[first] * interval_ms + self.offset,
+            "open": columns["open"][start:finish][first],
+            "high": np.maximum.reduceat(columns["high"][start:finish], first),
+            "low": np.minimum.reduceat(columns["low"][start:finish], first),
+            "close": columns["close"][start:finish][np.append(first[1:], finish - start) - 1],
+            "volume": np.add.reduceat(columns["volume"][start:finish], first)
+        }
+        result = []
+        for index in range(first.shape[0]):
+            kline_open_time = int(klines["open_time"][index])
+            if kline_open_time + interval_ms > now or len(result) >= limit:
+                break
+            result.append([kline_open_time, str(klines["open"][index]), str(klines["high"][index]),
+                           str(klines["low"][index]), str(klines["close"][index]), str(klines["volume"][index]),
+                           kline_open_time + interval_ms - 1, "0", 0, "0", "0", "0"])
+        return result
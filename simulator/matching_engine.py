@@ -0,0 +1,327 @@
+import itertools
+from collections import defaultdict
+from decimal import Decimal
+from threading import RLock
+
+MARKET = "MARKET"
+STOP_MARKET = "STOP_MARKET"
+TAKE_PROFIT_MARKET = "TAKE_PROFIT_MARKET"
+ORDER_TYPES = (MARKET, STOP_MARKET, TAKE_PROFIT_MARKET)
+
+
+class SimulatorError(Exception):
+    """
+    Error returned to the client in the Binance format
+    """
+
+    def __init__(self, code: int, message: str, status: int = 400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+    def to_dict(self) -> dict:
+        return {"code": self.code, "msg": self.message}
+
+
+class MatchingEngine:
+    """
+    One-way mode USDT-M futures account. Market orders are filled at the last price, STOP_MARKET and
+    TAKE_PROFIT_MARKET orders are triggered by the price path of every kline (open, low, high, close for a rising
+    kline and open, high, low, close for a falling one) and filled at the stop price, or at the open price if the
+    kline has opened beyond it. Every change of an order is passed to the listeners as a user data stream event
+    """
+
+    def __init__(self, fee_rate: Decimal = Decimal("0.0004"), slippage: Decimal = Decimal(0)):
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.time = 0
+        self.__lock = RLock()
+        self.__order_ids = itertools.count(1_000_000)
+        self.__trade_ids = itertools.count(1)
+        self.__prices = {}
+        self.__positions = defaultdict(lambda: {"amount": Decimal(0), "entry_price": Decimal(0)})
+        self.__leverage = defaultdict(lambda: 20)
+        self.__margin_type = defaultdict(lambda: "CROSSED")
+        self.__orders = {}
+        self.__client_order_ids = {}
+        self.__open_orders = defaultdict(dict)
+        self.__trades = defaultdict(list)
+        self.__listeners = []
+
+    def add_listener(self, listener) -> None:
+        """
+        :param listener: Callable receiving ORDER_TRADE_UPDATE and ACCOUNT_UPDATE events
+        """
+        self.__listeners.append(listener)
+
+    def price(self, symbol: str) -> Decimal | None:
+        return self.__prices.get(symbol)
+
+    def set_leverage(self, symbol: str, leverage: int) -> dict:
+        self.__leverage[symbol] = leverage
+        return {"leverage": leverage, "maxNotionalValue": "1000000", "symbol": symbol}
+
+    def set_margin_type(self, symbol: str, margin_type: str) -> dict:
+        if self.__margin_type[symbol] == margin_type:
+            raise SimulatorError(-4046, "No need to change margin type.")
+        if self.__positions[symbol]["amount"] != 0:
+            raise SimulatorError(-4048, "Margin type cannot be changed if there exists position.")
+        self.__margin_type[symbol] = margin_type
+        return {"code": 200, "msg": "success"}
+
+    def update_kline(self, symbol: str, open_price, high, low, close, close_time: int) -> None:
+        """
+        Moves the price of the symbol along the kline and triggers the conditional orders
+        """
+        open_price, high, low, close = (Decimal(str(value)) for value in (open_price, high, low, close))
+        path = (open_price, low, high, close) if close >= open_price else (open_price, high, low, close)
+        with self.__lock:
+            self.time = int(close_time)
+            previous = self.__prices.get(symbol, open_price)
+            for point_index, point in enumerate(path):
+                triggered = [order for order in self.__open_orders[symbol].values()
+                             if self.__is_triggered(order, point)]
+                # Orders closer to the previous point are reached first
+                triggered.sort(key=lambda order: abs(Decimal(order["stopPrice"]) - previous))
+                for order in triggered:
+                    if order["orderId"] not in self.__open_orders[symbol]:
+                        continue
+                    fill_price = point if point_index == 0 else Decimal(order["stopPrice"])
+                    self.__trigger(order, fill_price)
+                previous = point
+            self.__prices[symbol] = close
+
+    def place_order(self, params: dict) -> dict:
+        """
+        Places an order
+        :param params: Request parameters of POST /fapi/v1/order
+        :return: Order's info
+        """
+        symbol = params.get("symbol")
+        side = params.get("side")
+        order_type = params.get("type")
+        if symbol is None or side not in ("BUY", "SELL") or order_type is None:
+            raise SimulatorError(-1102, "Mandatory parameter 'symbol', 'side' or 'type' was not sent or is invalid.")
+        if order_type not in ORDER_TYPES:
+            raise SimulatorError(-1116, "Invalid orderType.")
+        close_position = str(params.get("closePosition", "false")).lower() == "true"
+        with self.__lock:
+            price = self.__prices.get(symbol)
+            if price is None:
+                raise SimulatorError(-1121, "Invalid symbol.")
+            order = {
+                "orderId": next(self.__order_ids),
+                "symbol": symbol,
+                "status": "NEW",
+                "clientOrderId": params.get("newClientOrderId", f"sim{self.time}"),
+                "price": "0",
+                "avgPrice": "0",
+                "origQty": str(params.get("quantity", "0")),
+                "executedQty": "0",
+                "cumQuote": "0",
+                "timeInForce": "GTC",
+                "type": order_type,
+                "reduceOnly": close_position or str(params.get("reduceOnly", "false")).lower() == "true",
+                "closePosition": close_position,
+                "side": side,
+                "positionSide": "BOTH",
+                "stopPrice": str(params.get("stopPrice", "0")),
+                "workingType": "CONTRACT_PRICE",
+                "priceProtect": False,
+                "origType": order_type,
+                "updateTime": self.time
+            }
+            if order_type == MARKET:
+                quantity = Decimal(order["origQty"])
+                if quantity <= 0:
+                    raise SimulatorError(-4003, "Quantity less than or equal to zero.")
+                self.__orders[order["orderId"]] = order
+                self.__client_order_ids[(symbol, order["clientOrderId"])] = order["orderId"]
+                self.__emit_order(order, "NEW", "NEW")
+                self.__fill(order, self.__with_slippage(price, side), quantity)
+                return dict(order)
+            if Decimal(order["stopPrice"]) <= 0:
+                raise SimulatorError(-1102, "Mandatory parameter 'stopPrice' was not sent, was empty/null, "
+                                            "or malformed.")
+            if self.__is_triggered(order, price):
+                raise SimulatorError(-2021, "Order would immediately trigger.")
+            self.__orders[order["orderId"]] = order
+            self.__client_order_ids[(symbol, order["clientOrderId"])] = order["orderId"]
+            self.__open_orders[symbol][order["orderId"]] = order
+            self.__emit_order(order, "NEW", "NEW")
+            return dict(order)
+
+    def get_order(self, symbol: str, order_id=None, client_order_id: str | None = None) -> dict:
+        with self.__lock:
+            if order_id is None:
+                order_id = self.__client_order_ids.get((symbol, client_order_id), 0)
+            order = self.__orders.get(int(order_id))
+            if order is None or order["symbol"] != symbol:
+                raise SimulatorError(-2013, "Order does not exist.")
+            return dict(order)
+
+    def cancel_all(self, symbol: str) -> dict:
+        with self.__lock:
+            for order in list(self.__open_orders[symbol].values()):
+                self.__finish(order, "CANCELED")
+        return {"code": 200, "msg": "The operation of cancel all open order is done."}
+
+    def user_trades(self, symbol: str, order_id=None, start_time=None, end_time=None, limit: int = 500) -> list:
+        with self.__lock:
+            trades = self.__trades[symbol]
+            if order_id is not None:
+                trades = [trade for trade in trades if trade["orderId"] == int(order_id)]
+            if start_time is not None:
+                trades = [trade for trade in trades if trade["time"] >= int(start_time)]
+            if end_time is not None:
+                trades = [trade for trade in trades if trade["time"] <= int(end_time)]
+            return [dict(trade) for trade in trades[-int(limit):]]
+
+    def position_risk(self, symbol: str | None = None) -> list:
+        with self.__lock:
+            symbols = [symbol] if symbol is not None else list(self.__prices)
+            result = []
+            for name in symbols:
+                position = self.__positions[name]
+                price = self.__prices.get(name, Decimal(0))
+                result.append({
+                    "symbol": name,
+                    "positionAmt": str(position["amount"]),
+                    "entryPrice": str(position["entry_price"]),
+                    "markPrice": str(price),
+                    "unRealizedProfit": str((price - position["entry_price"]) * position["amount"]),
+                    "liquidationPrice": "0",
+                    "leverage": str(self.__leverage[name]),
+                    "maxNotionalValue": "1000000",
+                    "marginType": "cross" if self.__margin_type[name] == "CROSSED" else "isolated",
+                    "isolatedMargin": "0",
+                    "isAutoAddMargin": "false",
+                    "positionSide": "BOTH",
+                    "notional": str(price * position["amount"]),
+                    "isolatedWallet": "0",
+                    "updateTime": self.time
+                })
+            return result
+
+    @staticmethod
+    def __is_triggered(order: dict, price: Decimal) -> bool:
+        stop_price = Decimal(order["stopPrice"])
+        rising = (order["type"] == STOP_MARKET) == (order["side"] == "BUY")
+        return price >= stop_price if rising else price <= stop_price
+
+    def __with_slippage(self, price: Decimal, side: str) -> Decimal:
+        return price * (1 + self.slippage) if side == "BUY" else price * (1 - self.slippage)
+
+    def __trigger(self, order: dict, price: Decimal) -> None:
+        position = self.__positions[order["symbol"]]["amount"]
+        if order["closePosition"]:
+            closing = (position > 0 and order["side"] == "SELL") or (position < 0 and order["side"] == "BUY")
+            if not closing:
+                self.__finish(order, "EXPIRED")
+                return None
+            quantity = abs(position)
+        else:
+            quantity = Decimal(order["origQty"])
+        del self.__open_orders[order["symbol"]][order["orderId"]]
+        self.__fill(order, self.__with_slippage(price, order["side"]), quantity)
+
+    def __fill(self, order: dict, price: Decimal, quantity: Decimal) -> None:
+        symbol = order["symbol"]
+        position = self.__positions[symbol]
+        signed_quantity = quantity if order["side"] == "BUY" else -quantity
+        realized_pnl = Decimal(0)
+        if position["amount"] != 0 and (position["amount"] > 0) != (signed_quantity > 0):
+            closed = min(abs(signed_quantity), abs(position["amount"]))
+            direction = 1 if position["amount"] > 0 else -1
+            realized_pnl = closed * (price - position["entry_price"]) * direction
+        new_amount = position["amount"] + signed_quantity
+        if new_amount == 0:
+            position["entry_price"] = Decimal(0)
+        elif position["amount"] == 0 or (new_amount > 0) != (position["amount"] > 0):
+            position["entry_price"] = price
+        elif abs(new_amount) > abs(position["amount"]):
+            position["entry_price"] = ((position["entry_price"] * abs(position["amount"]) + price * quantity)
+                                       / abs(new_amount))
+        position["amount"] = new_amount
+        commission = price * quantity * self.fee_rate
+        trade = {
+            "buyer": order["side"] == "BUY",
+            "commission": str(commission),
+            "commissionAsset": "USDT",
+            "id": next(self.__trade_ids),
+            "maker": False,
+            "orderId": order["orderId"],
+            "price": str(price),
+            "qty": str(quantity),
+            "quoteQty": str(price * quantity),
+            "realizedPnl": str(realized_pnl),
+            "side": order["side"],
+            "positionSide": "BOTH",
+            "symbol": symbol,
+            "time": self.time
+        }
+        self.__trades[symbol].append(trade)
+        order.update({"status": "FILLED", "avgPrice": str(price), "executedQty": str(quantity),
+                      "origQty": str(quantity), "cumQuote": str(price * quantity), "updateTime": self.time})
+        self.__emit_order(order, "TRADE", "FILLED", trade)
+        self.__emit({
+            "e": "ACCOUNT_UPDATE",
+            "E": self.time,
+            "T": self.time,
+            "a": {
+                "m": "ORDER",
+                "B": [],
+                "P": [{"s": symbol, "pa": str(position["amount"]), "ep": str(position["entry_price"]),
+                       "cr": "0", "up": "0", "mt": "cross", "iw": "0", "ps": "BOTH"}]
+            }
+        })
+
+    def __finish(self, order: dict, status: str) -> None:
+        self.__open_orders[order["symbol"]].pop(order["orderId"], None)
+        order.update({"status": status, "updateTime": self.time})
+        self.__emit_order(order, status, status)
+
+    def __emit_order(self, order: dict, execution_type: str, status: str, trade: dict | None = None) -> None:
+        self.__emit({
+            "e": "ORDER_TRADE_UPDATE",
+            "E": self.time,
+            "T": self.time,
+            "o": {
+                "s": order["symbol"],
+                "c": order["clientOrderId"],
+                "S": order["side"],
+                "o": order["type"],
+                "f": "GTC",
+                "q": order["origQty"],
+                "p": "0",
+                "ap": order["avgPrice"],
+                "sp": order["stopPrice"],
+                "x": execution_type,
+                "X": status,
+                "i": order["orderId"],
+                "l": trade["qty"] if trade is not None else "0",
+                "z": order["executedQty"],
+                "L": trade["price"] if trade is not None else "0",
+                "N": "USDT",
+                "n": trade["commission"] if trade is not None else "0",
+                "T": self.time,
+                "t": trade["id"] if trade is not None else 0,
+                "b": "0",
+                "a": "0",
+                "m": False,
+                "R": order["reduceOnly"],
+                "wt": "CONTRACT_PRICE",
+                "ot": order["origType"],
+                "ps": "BOTH",
+                "cp": order["closePosition"],
+                "rp": trade["realizedPnl"] if trade is not None else "0",
+                "pP": False,
+                "si": 0,
+                "ss": 0
+            }
+        })
+
+    def __emit(self, event: dict) -> None:
+        for listener in self.__listeners:
+            listener(event)
@@ -0,0 +1,308 @@
+import hashlib
+import json
+import math
+import random
+import secrets
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import parse_qsl, urlsplit
+
+import general_logger
+from binance_rest import ENDPOINT_WEIGHTS
+from simulator.klines_replay import KlinesReplay
+from simulator.matching_engine import MatchingEngine, SimulatorError
+
+ORDER_ENDPOINTS = {("POST", "/fapi/v1/order"), ("POST", "/fapi/v1/batchOrders")}
+
+
+class UsageWindows:
+    """
+    Fixed window counters of the exchange limits: request weight per minute and orders per 10 seconds and minute
+    """
+
+    def __init__(self, weight_limit: int, orders_10s_limit: int, orders_1m_limit: int):
+        self.limits = {"weight_1m": (weight_limit, 60), "orders_10s": (orders_10s_limit, 10),
+                       "orders_1m": (orders_1m_limit, 60)}
+        self.__used = {name: (0, 0) for name in self.limits}
+        self.__lock = Lock()
+
+    def add(self, name: str, amount: int, now: float) -> tuple[int, float]:
+        """
+        :return: Used amount in the current window and seconds until the window ends
+        """
+        limit, interval = self.limits[name]
+        window = int(now // interval)
+        with self.__lock:
+            used_window, used = self.__used[name]
+            used = amount if used_window != window else used + amount
+            self.__used[name] = (window, used)
+        return used, (window + 1) * interval - now
+
+
+class ExchangeSimulator(ThreadingHTTPServer):
+    """
+    REST API of the Binance USDT-M futures endpoints used by the bot, with the spot klines and time endpoints,
+    backed by the matching engine and the klines replay. Latency, errors and rate-limit responses can be injected
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, engine: MatchingEngine, replay: KlinesReplay, listen_key: str | None = None,
+                 latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, weight_limit: int = 2400,
+                 orders_10s_limit: int = 300, orders_1m_limit: int = 1200, ban_after: int = 10,
+                 ban_seconds: int = 120):
+        """
+        :param latency_ms: Delay added to every response
+        :param jitter_ms: Upper bound of the random delay added to the latency
+        :param error_rate: Share of requests answered with 503 without being processed
+        :param ban_after: Number of requests over the weight limit in one window, after which the client is banned
+            with 418 responses
+        :param ban_seconds: Duration of the ban
+        """
+        super().__init__(address, RestHandler)
+        self.logger = general_logger.get_logger("Simulator REST", "simulator")
+        self.engine = engine
+        self.replay = replay
+        self.listen_key = listen_key if listen_key is not None else secrets.token_hex(32)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.usage = UsageWindows(weight_limit, orders_10s_limit, orders_1m_limit)
+        self.ban_after = ban_after
+        self.ban_seconds = ban_seconds
+        self.banned_until = 0.0
+        self.__rejected = (0, 0)
+        self.__rejected_lock = Lock()
+        self.__random = random.Random()
+        self.__exchange_info = None
+
+    def start(self) -> None:
+        Thread(target=self.serve_forever, name="SimulatorREST", daemon=True).start()
+
+    def delay(self) -> float:
+        return (self.latency_ms + self.__random.uniform(0, self.jitter_ms)) / 1000
+
+    def inject_error(self) -> bool:
+        return self.error_rate > 0 and self.__random.random() < self.error_rate
+
+    def reject(self, now: float) -> None:
+        """
+        Counts a request over the weight limit and bans the client after too many of them
+        """
+        window = int(now // 60)
+        with self.__rejected_lock:
+            rejected_window, rejected = self.__rejected
+            rejected = 1 if rejected_window != window else rejected + 1
+            self.__rejected = (window, rejected)
+        if rejected >= self.ban_after:
+            self.banned_until = now + self.ban_seconds
+            self.logger.warning(f"Client is banned for {self.ban_seconds} s")
+
+    def exchange_info(self) -> tuple[dict, str]:
+        """
+        :return: exchangeInfo with filters derived from the replayed prices and its ETag
+        """
+        if self.__exchange_info is None:
+            limits = self.usage.limits
+            symbols = []
+            for symbol in self.replay.symbols():
+                price = self.engine.price(symbol) or Decimal(1)
+                # Roughly as on the exchange: five significant digits of the price, a step worth 10-100 USDT
+                tick_size = format(Decimal(1).scaleb(math.floor(math.log10(price)) - 4), "f")
+                step_size = format(Decimal(1).scaleb(1 - math.floor(math.log10(price))), "f")
+                symbols.append({
+                    "symbol": symbol,
+                    "status": "TRADING",
+                    "baseAsset": symbol[:-4] if symbol.endswith("USDT") else symbol,
+                    "quoteAsset": "USDT",
+                    "marginAsset": "USDT",
+                    "triggerProtect": "0.0500",
+                    "filters": [
+                        {"filterType": "PRICE_FILTER", "minPrice": tick_size, "maxPrice": "10000000",
+                         "tickSize": tick_size},
+                        {"filterType": "LOT_SIZE", "minQty": step_size, "maxQty": "10000000",
+                         "stepSize": step_size},
+                        {"filterType": "MARKET_LOT_SIZE", "minQty": step_size, "maxQty": "10000000",
+                         "stepSize": step_size},
+                        {"filterType": "MIN_NOTIONAL", "notional": "5"}
+                    ]
+                })
+            exchange_info = {
+                "timezone": "UTC",
+                "serverTime": int(time.time() * 1000),
+                "rateLimits": [
+                    {"rateLimitType": "REQUEST_WEIGHT", "interval": "MINUTE", "intervalNum": 1,
+                     "limit": limits["weight_1m"][0]},
+                    {"rateLimitType": "ORDERS", "interval": "SECOND", "intervalNum": 10,
+                     "limit": limits["orders_10s"][0]},
+                    {"rateLimitType": "ORDERS", "interval": "MINUTE", "intervalNum": 1,
+                     "limit": limits["orders_1m"][0]}
+                ],
+                "symbols": symbols
+            }
+            body = json.dumps(exchange_info)
+            self.__exchange_info = (exchange_info, hashlib.md5(body.encode()).hexdigest())
+        return self.__exchange_info
+
+
+class RestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ExchangeSimulator
+
+    ROUTES = {
+        ("GET", "/fapi/v1/ping"): "ping",
+        ("GET", "/api/v3/ping"): "ping",
+        ("GET", "/fapi/v1/time"): "server_time",
+        ("GET", "/api/v3/time"): "server_time",
+        ("GET", "/fapi/v1/exchangeInfo"): "exchange_info",
+        ("GET", "/api/v3/klines"): "klines",
+        ("GET", "/fapi/v1/klines"): "klines",
+        ("POST", "/fapi/v1/leverage"): "leverage",
+        ("POST", "/fapi/v1/marginType"): "margin_type",
+        ("GET", "/fapi/v2/positionRisk"): "position_risk",
+        ("POST", "/fapi/v1/order"): "new_order",
+        ("GET", "/fapi/v1/order"): "query_order",
+        ("POST", "/fapi/v1/batchOrders"): "batch_orders",
+        ("DELETE", "/fapi/v1/allOpenOrders"): "cancel_all",
+        ("GET", "/fapi/v1/userTrades"): "user_trades",
+        ("POST", "/fapi/v1/listenKey"): "listen_key",
+        ("PUT", "/fapi/v1/listenKey"): "keep_alive",
+        ("DELETE", "/fapi/v1/listenKey"): "keep_alive"
+    }
+
+    def do_GET(self):
+        self.__dispatch("GET")
+
+    def do_POST(self):
+        self.__dispatch("POST")
+
+    def do_PUT(self):
+        self.__dispatch("PUT")
+
+    def do_DELETE(self):
+        self.__dispatch("DELETE")
+
+    def log_message(self, *args):
+        pass
+
+    def __dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode() if length else ""
+        # Signed requests send the parameters either in the query string or in the form body
+        params = dict(parse_qsl(url.query))
+        params.update(parse_qsl(body))
+        route = self.ROUTES.get((method, url.path))
+        delay = self.server.delay()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.time()
+        if now < self.server.banned_until:
+            self.__respond(418, {"code": -1003, "msg": f"Way too many requests; IP banned until "
+                                                       f"{int(self.server.banned_until * 1000)}."},
+                           {"Retry-After": str(math.ceil(self.server.banned_until - now))})
+            return None
+        weight = ENDPOINT_WEIGHTS.get((method, url.path), 1)
+        used_weight, weight_reset = self.server.usage.add("weight_1m", weight, now)
+        headers = {"X-MBX-USED-WEIGHT-1M": str(used_weight)}
+        if used_weight > self.server.usage.limits["weight_1m"][0]:
+            self.server.reject(now)
+            self.__respond(429, {"code": -1003, "msg": "Too many requests; current limit of IP is "
+                                                       f"{self.server.usage.limits['weight_1m'][0]} requests per "
+                                                       "minute."},
+                           dict(headers, **{"Retry-After": str(math.ceil(weight_reset))}))
+            return None
+        if (method, url.path) in ORDER_ENDPOINTS:
+            orders = len(json.loads(params.get("batchOrders", "[]"))) if url.path.endswith("batchOrders") else 1
+            for name in ("orders_10s", "orders_1m"):
+                used_orders, orders_reset = self.server.usage.add(name, orders, now)
+                headers[f"X-MBX-ORDER-COUNT-{name.split('_')[1].upper()}"] = str(used_orders)
+                if used_orders > self.server.usage.limits[name][0]:
+                    self.__respond(429, {"code": -1015, "msg": "Too many new orders."},
+                                   dict(headers, **{"Retry-After": str(math.ceil(orders_reset))}))
+                    return None
+        if route is None:
+            self.__respond(404, {"code": -5000, "msg": f"Path {url.path} not found"}, headers)
+            return None
+        if self.server.inject_error():
+            self.__respond(503, {"code": -1001, "msg": "Internal error; unable to process your request. "
+                                                       "Please try again."}, headers)
+            return None
+        try:
+            status, payload = getattr(self, route)(params)
+        except SimulatorError as simulator_error:
+            status, payload = simulator_error.status, simulator_error.to_dict()
+        except (KeyError, ValueError) as request_error:
+            status, payload = 400, {"code": -1102, "msg": f"Malformed parameter: {request_error}"}
+        if isinstance(payload, tuple):
+            payload, extra_headers = payload
+            headers.update(extra_headers)
+        self.__respond(status, payload, headers)
+
+    def __respond(self, status: int, payload, headers: dict) -> None:
+        body = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def ping(self, params: dict) -> tuple:
+        return 200, {}
+
+    def server_time(self, params: dict) -> tuple:
+        return 200, {"serverTime": int(time.time() * 1000)}
+
+    def exchange_info(self, params: dict) -> tuple:
+        exchange_info, etag = self.server.exchange_info()
+        if self.headers.get("If-None-Match") == etag:
+            return 304, (None, {"ETag": etag})
+        return 200, (exchange_info, {"ETag": etag})
+
+    def klines(self, params: dict) -> tuple:
+        return 200, self.server.replay.history(params["symbol"], params["interval"], params.get("startTime"),
+                                               params.get("endTime"), min(int(params.get("limit", 500)), 1500))
+
+    def leverage(self, params: dict) -> tuple:
+        return 200, self.server.engine.set_leverage(params["symbol"], int(params["leverage"]))
+
+    def margin_type(self, params: dict) -> tuple:
+        return 200, self.server.engine.set_margin_type(params["symbol"], params["marginType"].upper())
+
+    def position_risk(self, params: dict) -> tuple:
+        return 200, self.server.engine.position_risk(params.get("symbol"))
+
+    def new_order(self, params: dict) -> tuple:
+        return 200, self.server.engine.place_order(params)
+
+    def query_order(self, params: dict) -> tuple:
+        return 200, self.server.engine.get_order(params["symbol"], params.get("orderId"),
+                                                 params.get("origClientOrderId"))
+
+    def batch_orders(self, params: dict) -> tuple:
+        orders = json.loads(params["batchOrders"])
+        if len(orders) > 5:
+            raise SimulatorError(-4039, "Batch order size exceeds the limit 5.")
+        results = []
+        for order in orders:
+            try:
+                results.append(self.server.engine.place_order({key: str(value) for key, value in order.items()}))
+            except SimulatorError as simulator_error:
+                results.append(simulator_error.to_dict())
+        return 200, results
+
+    def cancel_all(self, params: dict) -> tuple:
+        return 200, self.server.engine.cancel_all(params["symbol"])
+
+    def user_trades(self, params: dict) -> tuple:
+        return 200, self.server.engine.user_trades(params["symbol"], params.get("orderId"), params.get("startTime"),
+                                                   params.get("endTime"), min(int(params.get("limit", 500)), 1000))
+
+    def listen_key(self, params: dict) -> tuple:
+        return 200, {"listenKey": self.server.listen_key}
+
+    def keep_alive(self, params: dict) -> tuple:
+        return 200, {}
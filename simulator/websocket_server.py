@@ -0,0 +1,164 @@
+import base64
+import hashlib
+import json
+import socketserver
+import struct
+from threading import Lock, Thread
+from urllib.parse import parse_qs, urlsplit
+
+import general_logger
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class StreamConnection:
+    """
+    Server side of one WebSocket connection. Paths follow the Binance streams: /ws with SUBSCRIBE requests,
+    /ws/<stream> for one raw stream and /stream?streams=<a>/<b> for the combined format
+    """
+
+    def __init__(self, connection, path: str):
+        self.__connection = connection
+        self.__send_lock = Lock()
+        url = urlsplit(path)
+        self.combined = url.path.startswith("/stream")
+        if self.combined:
+            streams = parse_qs(url.query).get("streams", [""])[0]
+            self.streams = {stream for stream in streams.split("/") if stream}
+        elif url.path.startswith("/ws/"):
+            self.streams = {url.path[len("/ws/"):]}
+        else:
+            self.streams = set()
+        self.closed = False
+
+    def send(self, stream: str, payload: dict) -> None:
+        message = {"stream": stream, "data": payload} if self.combined else payload
+        self.send_frame(OPCODE_TEXT, json.dumps(message).encode())
+
+    def send_frame(self, opcode: int, payload: bytes) -> None:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 2 ** 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        with self.__send_lock:
+            if self.closed:
+                return None
+            try:
+                self.__connection.sendall(header + payload)
+            except OSError:
+                self.closed = True
+
+    def read_frame(self, stream) -> tuple[int, bytes] | None:
+        header = stream.read(2)
+        if len(header) < 2:
+            return None
+        opcode = header[0] & 0x0F
+        masked = header[1] & 0x80
+        length = header[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", stream.read(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", stream.read(8))[0]
+        mask = stream.read(4) if masked else b"\x00\x00\x00\x00"
+        payload = bytearray(stream.read(length))
+        for index in range(len(payload)):
+            payload[index] ^= mask[index % 4]
+        return opcode, bytes(payload)
+
+
+class StreamHub(socketserver.ThreadingTCPServer):
+    """
+    WebSocket server of market and user data streams. Messages are published by stream name, every connection
+    subscribed to the stream receives it in its own format
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple):
+        super().__init__(address, StreamHandler)
+        self.logger = general_logger.get_logger("Simulator Streams", "simulator")
+        self.__connections = set()
+        self.__lock = Lock()
+
+    def start(self) -> None:
+        Thread(target=self.serve_forever, name="SimulatorStreams", daemon=True).start()
+
+    def add(self, connection: StreamConnection) -> None:
+        with self.__lock:
+            self.__connections.add(connection)
+
+    def remove(self, connection: StreamConnection) -> None:
+        with self.__lock:
+            self.__connections.discard(connection)
+
+    def subscribers(self, stream: str | None = None) -> int:
+        with self.__lock:
+            if stream is None:
+                return sum(len(connection.streams) for connection in self.__connections)
+            return sum(stream in connection.streams for connection in self.__connections)
+
+    def publish(self, stream: str, payload: dict) -> None:
+        with self.__lock:
+            connections = [connection for connection in self.__connections if stream in connection.streams]
+        for connection in connections:
+            connection.send(stream, payload)
+
+
+class StreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request_line = self.rfile.readline().decode("latin-1").strip()
+        headers = {}
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        parts = request_line.split(" ")
+        if len(parts) < 2 or "sec-websocket-key" not in headers:
+            self.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return None
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WEBSOCKET_GUID).encode()).digest())
+        self.wfile.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                         b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        self.wfile.flush()
+        connection = StreamConnection(self.request, parts[1])
+        self.server.add(connection)
+        try:
+            while not connection.closed:
+                frame = connection.read_frame(self.rfile)
+                if frame is None:
+                    break
+                opcode, payload = frame
+                if opcode == OPCODE_CLOSE:
+                    connection.send_frame(OPCODE_CLOSE, payload[:2])
+                    break
+                if opcode == OPCODE_PING:
+                    connection.send_frame(OPCODE_PONG, payload)
+                elif opcode == OPCODE_TEXT:
+                    self.__handle_request(connection, payload)
+        except OSError:
+            pass
+        finally:
+            connection.closed = True
+            self.server.remove(connection)
+
+    @staticmethod
+    def __handle_request(connection: StreamConnection, payload: bytes) -> None:
+        try:
+            request = json.loads(payload)
+        except ValueError:
+            return None
+        streams = set(request.get("params") or [])
+        if request.get("method") == "SUBSCRIBE":
+            connection.streams |= streams
+        elif request.get("method") == "UNSUBSCRIBE":
+            connection.streams -= streams
+        connection.send_frame(OPCODE_TEXT, json.dumps({"result": None, "id": request.get("id")}).encode())
@@ -0,0 +1,30 @@
+import json
+import os
+
+
+class FileCheckpointStore:
+    """
+    Keeps checkpoints as JSON files, one file per name. Files are replaced atomically, so a reader never sees
+    a partially written checkpoint
+    """
+
+    def __init__(self, directory: str = "cache/checkpoints"):
+        self.__directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def save_checkpoint(self, name: str, data: dict) -> None:
+        path = self.__path(name)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(data, checkpoint_file)
+        os.replace(temporary_path, path)
+
+    def load_checkpoint(self, name: str) -> dict | None:
+        try:
+            with open(self.__path(name), "r") as checkpoint_file:
+                return json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return None
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self.__directory, f"{name}.json")
@@ -0,0 +1,59 @@
+import json
+
+import click
+
+from backtest import load_klines, read_macd_config, to_timestamp
+from backtesting.sweep import ParameterSweep, parse_values
+
+
+@click.command()
+@click.argument("ticker")
+@click.option("--start", default=None, help="Start date, YYYY-MM-DD")
+@click.option("--finish", default=None, help="End date, YYYY-MM-DD")
+@click.option("--base-interval", default="1m", help="Interval of the klines stored in the database")
+@click.option("--durations", default="1h,2h,4h", help="Klines durations")
+@click.option("--fast", default="6:20:2", help="fast_ma values, list or start:stop:step")
+@click.option("--slow", default="20:40:2", help="slow_ma values, list or start:stop:step")
+@click.option("--signal", default="5:13:1", help="signal values, list or start:stop:step")
+@click.option("--take-profit", default="1:5:1", help="take_profit values, list or start:stop:step")
+@click.option("--stop-loss", default="0.5:3:0.5", help="stop_loss values, list or start:stop:step")
+@click.option("--samples", default=None, type=int, help="Random search over this number of MACD settings")
+@click.option("--workers", default=None, type=int, help="Number of worker processes")
+@click.option("--fee-rate", default=0.0004, help="Commission rate for every order")
+@click.option("--min-trades", default=10, help="Ignore combinations with fewer trades")
+@click.option("--sort-by", default="profit", help="Column used for ranking")
+@click.option("--top", default=20, help="Number of printed rows")
+@click.option("--output", default=None, help="CSV file for the whole ranked table")
+def run(ticker, start, finish, base_interval, durations, fast, slow, signal, take_profit, stop_loss, samples,
+        workers, fee_rate, min_trades, sort_by, top, output):
+    ticker = ticker.upper()
+    ticker_config = read_macd_config().get(ticker, {})
+    quantity = float(ticker_config.get("token_qty", 1))
+    klines = load_klines(ticker, to_timestamp(start), to_timestamp(finish), base_interval)
+    sweep = ParameterSweep(klines, base_interval, quantity, fee_rate)
+    results = sweep.run(durations.split(","), parse_values(fast), parse_values(slow), parse_values(signal),
+                        parse_values(take_profit, float), parse_values(stop_loss, float), samples, workers)
+    results = results[results["trades"] >= min_trades].sort_values(sort_by, ascending=False)
+    if output is not None:
+        results.to_csv(output, index=False)
+    if results.empty:
+        click.echo("There are no combinations with enough trades")
+        return None
+    click.echo(results.head(top).to_string(index=False))
+    best = results.iloc[0]
+    config_block = {
+        ticker: {
+            "fast_ma": int(best["fast_ma"]),
+            "slow_ma": int(best["slow_ma"]),
+            "signal": int(best["signal"]),
+            "token_qty": ticker_config.get("token_qty", 1),
+            "stop_loss": float(best["stop_loss"]),
+            "take_profit": float(best["take_profit"]),
+            "klines_duration": best["klines_duration"]
+        }
+    }
+    click.echo(json.dumps(config_block, indent=2))
+
+
+if __name__ == "__main__":
+    run()
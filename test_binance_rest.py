@@ -0,0 +1,82 @@
+import time
+from threading import Thread
+
+import pytest
+
+from binance_rest import HIGH_PRIORITY, LOW_PRIORITY, RequestScheduler, TokenBucket, request_cost
+
+ORDERS_20_PER_10S = [{"rateLimitType": "ORDERS", "interval": "SECOND", "intervalNum": 10, "limit": 20}]
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(10, 10)
+    bucket.take(10)
+    assert bucket.wait_time(3) == pytest.approx(3)
+    bucket.refill(bucket.updated + 2)
+    assert bucket.tokens == pytest.approx(2)
+    assert bucket.wait_time(2) == 0
+    bucket.refill(bucket.updated + 60)
+    assert bucket.tokens == 10
+
+
+def test_token_bucket_reserve_and_sync():
+    bucket = TokenBucket(10, 10)
+    bucket.take(2)
+    assert bucket.wait_time(6, reserve=2) == 0
+    assert bucket.wait_time(7, reserve=2) == pytest.approx(1)
+    # The reserve is cut so that a request as large as the bucket still fits into it
+    assert bucket.wait_time(10, reserve=2) == pytest.approx(2)
+    bucket.sync(7)
+    assert bucket.tokens == 3
+    bucket.sync(1)
+    assert bucket.tokens == 3
+
+
+def test_request_cost():
+    assert request_cost("POST", "/fapi/v1/order") == (1, 1, HIGH_PRIORITY)
+    assert request_cost("POST", "/fapi/v1/batchOrders", orders=2) == (5, 2, HIGH_PRIORITY)
+    assert request_cost("GET", "/fapi/v2/positionRisk") == (5, 0, LOW_PRIORITY)
+
+
+def test_informational_requests_leave_reserve_for_orders():
+    scheduler = RequestScheduler(weight_limit=100, low_priority_share=0.8)
+    assert scheduler.try_acquire(80) == 0
+    assert scheduler.try_acquire(1) > 0
+    assert scheduler.try_acquire(20, priority=HIGH_PRIORITY) == 0
+    assert scheduler.try_acquire(1, priority=HIGH_PRIORITY) > 0
+
+
+def test_usage_headers_and_bans():
+    scheduler = RequestScheduler(weight_limit=100)
+    scheduler.update({"x-mbx-used-weight-1m": "95"})
+    assert scheduler.metrics()["limits"]["weight_1m"]["used_reported"] == 95
+    assert scheduler.try_acquire(1, priority=HIGH_PRIORITY) == 0
+    assert scheduler.try_acquire(5, priority=HIGH_PRIORITY) > 0
+
+    scheduler = RequestScheduler()
+    scheduler.block(30)
+    assert scheduler.try_acquire(1, priority=HIGH_PRIORITY) == pytest.approx(30, abs=0.1)
+    assert scheduler.metrics()["bans"] == 1
+
+
+def test_waiting_order_holds_informational_requests():
+    scheduler = RequestScheduler()
+    scheduler.configure(ORDERS_20_PER_10S)
+    scheduler.acquire(1, orders=20, priority=HIGH_PRIORITY)
+    finished = []
+
+    def request(name: str, orders: int, priority: int) -> None:
+        scheduler.acquire(1, orders=orders, priority=priority)
+        finished.append(name)
+
+    order = Thread(target=request, args=("order", 1, HIGH_PRIORITY))
+    order.start()
+    # The order waits about 0.5 s for a token of the orders bucket
+    deadline = time.monotonic() + 0.4
+    while scheduler.try_acquire(1) != RequestScheduler.HELD_RETRY_DELAY:
+        assert time.monotonic() < deadline, "Order request hasn't started waiting"
+    informational = Thread(target=request, args=("informational", 0, LOW_PRIORITY))
+    informational.start()
+    order.join(5)
+    informational.join(5)
+    assert finished == ["order", "informational"]
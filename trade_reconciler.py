@@ -0,0 +1,158 @@
+import atexit
+import time
+from collections import defaultdict
+from decimal import Decimal
+from threading import Event, Lock, Thread
+
+import general_logger
+from binance_rest import LOW_PRIORITY
+from user_data_stream import OrderTradesTracker
+
+
+class TradeReconciler:
+    """
+    Calculates commissions and realized profit of closed positions after the fact. The values are taken from the
+    executions received via the User Data Stream, if the stream hasn't delivered both orders in time, the trades
+    are requested with one userTrades query per symbol and time window. The result updates the row of the trade
+    in the trading table through the journal
+    """
+    WINDOW_MARGIN = 60_000
+    MAX_WINDOW = 7 * 24 * 3_600_000
+
+    def __init__(self, rest_client, journal, trades: OrderTradesTracker, fallback_after: float = 10,
+                 check_interval: float = 1, max_attempts: int = 5):
+        self.logger = general_logger.get_logger("Trade Reconciler", "trade_reconciler")
+        self.__rest_client = rest_client
+        self.__journal = journal
+        self.__trades = trades
+        self.__fallback_after = fallback_after
+        self.__check_interval = check_interval
+        self.__max_attempts = max_attempts
+        self.__pending = {}
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__thread = None
+
+    @property
+    def pending(self) -> int:
+        return len(self.__pending)
+
+    def submit(self, ticker: str, open_order_id: int, open_time: int, close_order_id: int, close_time: int) -> None:
+        """
+        Schedules the reconciliation of a closed position and returns immediately
+        :param ticker: Ticker name
+        :param open_order_id: ID of the position opening order
+        :param open_time: Fill time of the opening order in ms
+        :param close_order_id: ID of the position closing order
+        :param close_time: Fill time of the closing order in ms
+        """
+        with self.__lock:
+            self.__pending[(ticker, close_order_id)] = {
+                "ticker": ticker,
+                "open_order_id": open_order_id,
+                "open_time": int(open_time),
+                "close_order_id": close_order_id,
+                "close_time": int(close_time),
+                "request_at": time.monotonic() + self.__fallback_after,
+                "attempts": 0
+            }
+            if self.__thread is None:
+                self.__stopped.clear()
+                self.__thread = Thread(target=self.__run, name="TradeReconciler", daemon=True)
+                self.__thread.start()
+                atexit.register(self.stop)
+
+    def stop(self) -> None:
+        if self.__thread is None:
+            return None
+        self.__stopped.set()
+        self.__thread.join()
+        self.__thread = None
+        if self.__pending:
+            self.logger.warning(f"{len(self.__pending)} trades haven't been reconciled")
+        atexit.unregister(self.stop)
+
+    def __run(self) -> None:
+        while not self.__stopped.wait(self.__check_interval):
+            try:
+                self.reconcile()
+            except Exception as reconcile_exception:
+                self.logger.error("Some error during reconciliation", exc_info=reconcile_exception)
+
+    def reconcile(self) -> None:
+        """
+        Completes the trades which have both orders in the stream and requests the overdue ones
+        """
+        with self.__lock:
+            pending = list(self.__pending.values())
+        overdue = defaultdict(list)
+        for trade in pending:
+            open_trades = self.__trades.get(trade["open_order_id"])
+            close_trades = self.__trades.get(trade["close_order_id"])
+            if open_trades is not None and close_trades is not None:
+                self.__complete(trade, open_trades, close_trades)
+            elif time.monotonic() >= trade["request_at"]:
+                overdue[trade["ticker"]].append(trade)
+        for ticker, trades in overdue.items():
+            self.__reconcile_by_request(ticker, trades)
+
+    def __reconcile_by_request(self, ticker: str, trades: list) -> None:
+        try:
+            executions = self.__request_trades(ticker, trades)
+        except Exception as binance_exception:
+            self.logger.error(f"Trades of {ticker} haven't been requested", exc_info=binance_exception)
+            executions = {}
+        for trade in trades:
+            open_trades = executions.get(trade["open_order_id"], self.__trades.get(trade["open_order_id"]))
+            close_trades = executions.get(trade["close_order_id"], self.__trades.get(trade["close_order_id"]))
+            if open_trades is not None and close_trades is not None:
+                self.__complete(trade, open_trades, close_trades)
+                continue
+            trade["attempts"] += 1
+            trade["request_at"] = time.monotonic() + self.__fallback_after * 2 ** trade["attempts"]
+            if trade["attempts"] >= self.__max_attempts:
+                self.logger.error(f"Trade {ticker} {trade['close_order_id']} hasn't been reconciled after "
+                                  f"{trade['attempts']} attempts. Fee and profit stay empty")
+                with self.__lock:
+                    self.__pending.pop((ticker, trade["close_order_id"]), None)
+
+    def __request_trades(self, ticker: str, trades: list) -> dict:
+        """
+        Requests executions around the fill times of the orders, overlapping windows are merged into one request
+        :return: Accumulated executions by order ID
+        """
+        times = sorted(time_ms for trade in trades for time_ms in (trade["open_time"], trade["close_time"]))
+        windows = []
+        for time_ms in times:
+            start, end = time_ms - self.WINDOW_MARGIN, time_ms + self.WINDOW_MARGIN
+            if windows and start <= windows[-1][1] and end - windows[-1][0] <= self.MAX_WINDOW:
+                windows[-1][1] = end
+            else:
+                windows.append([start, end])
+        executions = {}
+        for start, end in windows:
+            response = self.__rest_client.request("GET", "/fapi/v1/userTrades", {
+                "symbol": ticker,
+                "startTime": start,
+                "endTime": end,
+                "limit": 1000
+            }, priority=LOW_PRIORITY)
+            if response.status_code != 200:
+                raise ConnectionError(response.text)
+            for execution in response.json():
+                order_trades = executions.setdefault(execution["orderId"], {"commission": Decimal(0),
+                                                                            "realized_pnl": Decimal(0)})
+                order_trades["commission"] += Decimal(execution["commission"])
+                order_trades["realized_pnl"] += Decimal(execution["realizedPnl"])
+        return executions
+
+    def __complete(self, trade: dict, open_trades: dict, close_trades: dict) -> None:
+        fee = open_trades["commission"] + close_trades["commission"]
+        profit = close_trades["realized_pnl"] - fee
+        self.__journal.update(trade["ticker"], trade["close_order_id"], {"fee_amount": fee, "profit": profit})
+        with self.__lock:
+            self.__pending.pop((trade["ticker"], trade["close_order_id"]), None)
+        self.__trades.forget(trade["open_order_id"])
+        self.__trades.forget(trade["close_order_id"])
+        self.logger.info(f"Trade {trade['ticker']} {trade['close_order_id']} has been reconciled. "
+                         f"Fee: {fee}, profit: {profit}")
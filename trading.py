@@ -1,18 +1,27 @@
-import datetime
+import asyncio
 import json
 import os
+import time
 from configparser import ConfigParser
 from decimal import Decimal
 
 import certifi
 import click
 import numpy as np
-import requests
 from binance.websocket.spot.websocket_client import SpotWebsocketClient as spot_ws
 
 import general_logger
 from binance_connector import Binance
+from databases_connectors.klines_cache import KlinesCache
 from databases_connectors.klines_db import DatabaseConnector
+from databases_connectors.redis_connector import RedisClient
+import indicators.ema
+from indicators.macd_state import MACDState
+from klines_downloader import KlinesDownloader
+from latency_metrics import latency
+from objects.intervals import INTERVALS_MS
+from objects.kline_buffer import KlineBuffer
+from state_checkpoint import FileCheckpointStore
 
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
@@ -30,55 +39,207 @@ class Strategy:
         "12h": 12,
         "1d": 24
     }
-    __spot_client_ws = spot_ws(stream_url=__config['main']['wss_url_spot'])
-    __db = DatabaseConnector()
+    __spot_client_ws = None
+    __db = None
+    __klines_cache = None
+    __klines_downloader = None
+    __checkpoint_store = None
+    bot_class = Binance
+    MACD_CHECK_INTERVAL = 100
+    HISTORY_LENGTH = 1000
 
-    def __init__(self, ticker: str):
+    def __init__(self, ticker: str, bot=None):
+        """
+        :param ticker: Ticker name
+        :param bot: Exchange connector of the ticker, an instance of bot_class is created if None
+        """
         self.ticker = ticker
         self.logger = general_logger.get_logger("Strategy", self.ticker)
         self.macd_config = self.read_macd_config()
-        self.__bot = Binance(self.ticker)
-        self.__bot.get_pairs_info()
-        self.cache = self.get_start_data()
+        self._bot = bot if bot is not None else self.bot_class(self.ticker)
         self.filters_cache = {}
         self._slow_ma = int(self.macd_config[ticker]['slow_ma'])
         self._fast_ma = int(self.macd_config[ticker]['fast_ma'])
         self._signal = int(self.macd_config[ticker]['signal'])
         self._stop_loss = Decimal(self.macd_config[ticker]['stop_loss'])
         self._take_profit = Decimal(self.macd_config[ticker]['take_profit'])
+        self.macd_state = MACDState(self._fast_ma, self._slow_ma, self._signal)
+        self.__klines_since_check = 0
+        self._received_at = None
+        self.cache = None
+        checkpoint = self.load_checkpoint()
+        if checkpoint is None or not self.restore_macd_state(checkpoint):
+            self.cache = self.get_start_data()
+            self.seed_macd_state()
 
-    def macd_analyzer(self):
+    def seed_macd_state(self) -> None:
         """
-        Analyzes the current MACD value and opens a position if necessary
+        Seeds the streaming MACD state from the cached klines and checks it against the full recalculation
         """
-        macd_hist = self.macd(self.cache, fast_period=self._fast_ma, slow_period=self._slow_ma,
+        self.macd_state.seed(self.cache.close)
+        self.__klines_since_check = 0
+        self.check_macd_state()
+
+    @classmethod
+    def get_klines_db(cls) -> DatabaseConnector:
+        """
+        Returns the klines table connector shared by all strategies, created on first use
+        """
+        if cls.__db is None:
+            cls.__db = DatabaseConnector()
+        return cls.__db
+
+    @classmethod
+    def get_klines_cache(cls) -> KlinesCache:
+        if cls.__klines_cache is None:
+            cls.__klines_cache = KlinesCache(cls.get_klines_db())
+        return cls.__klines_cache
+
+    @classmethod
+    def get_klines_downloader(cls) -> KlinesDownloader:
+        if cls.__klines_downloader is None:
+            cls.__klines_downloader = KlinesDownloader()
+        return cls.__klines_downloader
+
+    @classmethod
+    def get_spot_client_ws(cls) -> spot_ws:
+        """
+        Returns the spot WebSockets client shared by all strategies, it connects on first use
+        """
+        if cls.__spot_client_ws is None:
+            cls.__spot_client_ws = spot_ws(stream_url=cls.__config['main']['wss_url_spot'])
+        return cls.__spot_client_ws
+
+    @classmethod
+    def get_checkpoint_store(cls):
+        """
+        Returns the store of indicator checkpoints selected by checkpoint_store option (redis or file)
+        """
+        if cls.__checkpoint_store is None:
+            if cls.__config['main'].get('checkpoint_store', "file") == "redis":
+                cls.__checkpoint_store = RedisClient()
+            else:
+                cls.__checkpoint_store = FileCheckpointStore()
+        return cls.__checkpoint_store
+
+    @property
+    def checkpoint_name(self) -> str:
+        return f"{self.ticker}_{self.macd_config[self.ticker]['klines_duration']}"
+
+    def make_checkpoint(self) -> dict:
+        """
+        :return: MACD state and the last processed kline, the values are copied
+        """
+        return {
+            "macd": self.macd_state.snapshot(),
+            "open_time": self.cache.last_open_time,
+            "close": float(self.cache.close[-1])
+        }
+
+    def save_checkpoint(self, checkpoint: dict | None = None) -> None:
+        """
+        Saves the MACD state and the last processed kline
+        :param checkpoint: Checkpoint of make_checkpoint, the current state if None
+        """
+        try:
+            self.get_checkpoint_store().save_checkpoint(self.checkpoint_name, checkpoint or self.make_checkpoint())
+        except Exception as checkpoint_exception:
+            self.logger.error("MACD state hasn't been saved", exc_info=checkpoint_exception)
+
+    def load_checkpoint(self) -> dict | None:
+        """
+        :return: Saved MACD state and its last kline or None if there is no checkpoint
+        """
+        try:
+            return self.get_checkpoint_store().load_checkpoint(self.checkpoint_name)
+        except Exception as checkpoint_exception:
+            self.logger.error("MACD state checkpoint hasn't been loaded", exc_info=checkpoint_exception)
+            return None
+
+    def restore_macd_state(self, checkpoint: dict) -> bool:
+        """
+        Restores the MACD state from the checkpoint and fills the cache without the synchronization with the klines
+        table. The kline of the checkpoint must be in the cache with the same closure value and the klines after it
+        must follow without gaps, they are applied to the restored state. The whole history is compared with the
+        state by the periodic check
+        :param checkpoint: Checkpoint of save_checkpoint
+        :return: True if the state has been restored
+        """
+        try:
+            buffer = self.get_checkpoint_data(checkpoint["open_time"])
+        except Exception as binance_exception:
+            self.logger.error("Klines after the checkpoint haven't been loaded", exc_info=binance_exception)
+            return False
+        position = int(np.searchsorted(buffer.open_time, checkpoint["open_time"]))
+        if position == len(buffer) or buffer.open_time[position] != checkpoint["open_time"] or \
+                not np.isclose(buffer.close[position], checkpoint["close"], rtol=1e-12, atol=0):
+            self.logger.warning(f"Checkpoint kline {checkpoint['open_time']} doesn't match the cache. "
+                                f"MACD state is calculated from the history")
+            return False
+        interval_ms = INTERVALS_MS[self.macd_config[self.ticker]['klines_duration']]
+        if np.any(np.diff(buffer.open_time[position:]) != interval_ms):
+            self.logger.warning("Klines after the checkpoint have gaps. MACD state is calculated from the history")
+            return False
+        try:
+            self.macd_state.restore(checkpoint["macd"])
+        except ValueError as checkpoint_exception:
+            self.logger.warning("MACD state checkpoint is for other settings", exc_info=checkpoint_exception)
+            return False
+        for close in buffer.close[position + 1:].tolist():
+            self.macd_state.update(close)
+        self.cache = buffer
+        self.__klines_since_check = 0
+        self.logger.info(f"MACD state has been restored from the checkpoint of {checkpoint['open_time']}, "
+                         f"{len(buffer) - position - 1} klines applied")
+        return True
+
+    def check_macd_state(self) -> bool:
+        """
+        Compares the streaming MACD state with the MACD calculated over the whole cache
+        :return: True if the values match within float tolerance
+        """
+        macd_hist = self.macd(self.cache.close, fast_period=self._fast_ma, slow_period=self._slow_ma,
                               signal_period=self._signal)
-        previous_value = macd_hist[-2]
-        value = macd_hist[-1]
+        if self.macd_state.matches(macd_hist):
+            return True
+        self.logger.warning(f"Streaming MACD state doesn't match the full recalculation: "
+                            f"{[self.macd_state.previous_hist, self.macd_state.hist]} != {macd_hist[-2:].tolist()}")
+        return False
+
+    def position_signal(self) -> str | None:
+        """
+        :return: LONG or SHORT if the MACD histogram has crossed zero on the last kline, otherwise None
+        """
+        previous_value = self.macd_state.previous_hist
+        value = self.macd_state.hist
         if previous_value < 0 <= value:
-            self.logger.info("Signal for LONG")
-            if self.__bot.open_position:
-                self.logger.warning("It have open position already. Change signal without closing position "
-                                    "by TP or SL activate close position by signal change")
-                self.__bot.close_position(Decimal(self.macd_config[self.ticker]['token_qty']))
-            if not self.__bot.open_position:
-                self.__bot.open_position(self.LONG, Decimal(self.macd_config[self.ticker]['token_qty']),
-                                         Decimal(self._take_profit), Decimal(self._stop_loss))
-                self.logger.info("Order have been placed")
-            else:
-                self.logger.info("Position isn't closed. Can't open new position.")
-        elif previous_value > 0 >= value:
-            self.logger.info("Signal for SHORT")
-            if self.__bot.open_position:
-                self.logger.warning("It have open position already. Change signal without closing position "
-                                    "by TP or SL activate close position by signal change")
-                self.__bot.close_position(Decimal(self.macd_config[self.ticker]['token_qty']))
-            if not self.__bot.open_position:
-                self.__bot.open_position(self.SHORT, Decimal(self.macd_config[self.ticker]['token_qty']),
-                                         Decimal(self._take_profit), Decimal(self._stop_loss))
+            return self.LONG
+        if previous_value > 0 >= value:
+            return self.SHORT
+        return None
+
+    def macd_analyzer(self):
+        """
+        Analyzes the current MACD value and opens a position if necessary
+        """
+        position = self.position_signal()
+        if position is None:
+            return None
+        latency.since(self.ticker, "signal", self._received_at)
+        self.logger.info(f"Signal for {position}")
+        if self._bot.has_position:
+            self.logger.warning("It have open position already. Change signal without closing position "
+                                "by TP or SL activate close position by signal change")
+            self._bot.close_position(Decimal(self.macd_config[self.ticker]['token_qty']))
+        if not self._bot.has_position:
+            opened = self._bot.open_position(position, Decimal(self.macd_config[self.ticker]['token_qty']),
+                                             Decimal(self._take_profit), Decimal(self._stop_loss),
+                                             reference_price=Decimal(str(self.cache.close[-1])))
+            if opened:
+                latency.since(self.ticker, "receipt_to_protected", self._received_at)
                 self.logger.info("Order have been placed")
-            else:
-                self.logger.info("Position isn't closed. Can't open new position.")
+        else:
+            self.logger.info("Position isn't closed. Can't open new position.")
 
     @staticmethod
     def ema(close: np.ndarray, period: int) -> np.ndarray:
@@ -88,12 +249,7 @@ class Strategy:
         :param period: EMA period
         :return: Array of calculated EMA values
         """
-        alpha = 2 / (period + 1)
-        ema_calc = np.zeros_like(close)
-        ema_calc[0] = float(close[0])
-        for i in range(1, close.shape[0]):
-            ema_calc[i] = alpha * float(close[i]) + (1 - alpha) * float(ema_calc[i - 1])
-        return ema_calc.astype(float)
+        return indicators.ema.ema(close, period)
 
     def macd(self, klines: np.ndarray, fast_period: int, slow_period: int, signal_period: int) -> np.ndarray:
         """
@@ -104,12 +260,7 @@ class Strategy:
         :param signal_period: Signal value for EMA
         :return: Array of calculated MACD values
         """
-        ema_fast = self.ema(klines, fast_period)
-        ema_slow = self.ema(klines, slow_period)
-        macd_calc = ema_fast - ema_slow
-        signal = self.ema(macd_calc, signal_period)
-        hist = macd_calc - signal
-        return hist
+        return indicators.ema.macd_histogram(klines, fast_period, slow_period, signal_period)
 
     def price_handler(self, message: dict) -> None:
         """
@@ -120,50 +271,203 @@ class Strategy:
             pass
         else:
             if message['k']['x']:
+                self._received_at = time.perf_counter()
+                latency.record(self.ticker, "close_to_receipt", max(time.time() - message['k']['T'] / 1000, 0))
                 kline = [message["k"]["t"], message["k"]["o"], message["k"]["c"], message["k"]["T"]]
-                result = np.append(self.cache, float(kline[2]))
-                result = np.delete(result, 0)
-                self.cache = result
-                self.macd_analyzer()
+                if not self.cache.append(int(kline[0]), float(kline[2]), int(kline[3])):
+                    self.logger.warning(f"Kline with open time {kline[0]} is a duplicate or out of order. Skipped")
+                    return None
+                self.macd_state.update(self.cache.close[-1])
+                latency.since(self.ticker, "indicator", self._received_at)
+                self.__klines_since_check += 1
+                if self.__klines_since_check >= self.MACD_CHECK_INTERVAL:
+                    self.__klines_since_check = 0
+                    if not self.check_macd_state():
+                        self.macd_state.seed(self.cache.close)
+                try:
+                    self.macd_analyzer()
+                finally:
+                    # Saved after the signal is handled, both writes may wait for the disk or the network
+                    self.persist(message['k'], self.make_checkpoint())
+
+    def persist(self, kline: dict, checkpoint: dict) -> None:
+        """
+        Saves the closed kline in the klines cache and the checkpoint of the state after it
+        :param kline: Kline of the stream message
+        :param checkpoint: Checkpoint of make_checkpoint
+        """
+        self.__append_to_klines_cache(kline)
+        started = time.perf_counter()
+        self.save_checkpoint(checkpoint)
+        latency.since(self.ticker, "checkpoint_save", started)
+
+    def __append_to_klines_cache(self, kline: dict) -> None:
+        try:
+            self.get_klines_cache().append(self.ticker, kline['i'], [{
+                "open_time": kline['t'],
+                "open": kline['o'],
+                "high": kline['h'],
+                "low": kline['l'],
+                "close": kline['c'],
+                "volume": kline['v'],
+                "close_time": kline['T']
+            }])
+        except OSError as cache_exception:
+            self.logger.error("Kline hasn't been saved in the klines cache", exc_info=cache_exception)
 
     def price_stream(self):
-        self.__spot_client_ws.start()
-        self.__spot_client_ws.kline(
+        spot_client_ws = self.get_spot_client_ws()
+        spot_client_ws.start()
+        spot_client_ws.kline(
             symbol=self.ticker,
             id=2,
             interval=self.macd_config[self.ticker]["klines_duration"],
             callback=self.price_handler
         )
 
+    @property
+    def stream_name(self) -> str:
+        return f"{self.ticker.lower()}@kline_{self.macd_config[self.ticker]['klines_duration']}"
+
+    @classmethod
+    def combined_price_stream(cls, streams: list, callback) -> None:
+        """
+        Subscribes to several streams over one combined-stream connection
+        :param streams: Names of the streams
+        :param callback: Callback function, receives messages wrapped as {"stream": ..., "data": ...}
+        """
+        spot_client_ws = cls.get_spot_client_ws()
+        spot_client_ws.start()
+        spot_client_ws.instant_subscribe(stream=streams, callback=callback)
+
     @staticmethod
     def read_macd_config():
         with open("configs/macd_config.json", "r") as config_file:
             macd_config = json.load(config_file)
         return macd_config
 
-    def get_start_data(self) -> np.ndarray:
+    def get_start_data(self) -> KlineBuffer:
+        """
+        Fills the buffer with the last klines of the ticker. The klines are read from the local cache file, which is
+        synchronized with the klines table, only the missing tail is downloaded from the exchange and written back
+        to the table and the cache
+        :return: Buffer filled with the klines
+        """
+        duration = self.macd_config[self.ticker]['klines_duration']
+        history_length = int(self.macd_config[self.ticker].get('history_length', self.HISTORY_LENGTH))
+        interval_ms = INTERVALS_MS[duration]
+        now = int(time.time() * 1000)
+        klines_cache = self.get_klines_cache()
+        klines_file = klines_cache.file(self.ticker, duration)
+        try:
+            klines_cache.sync(self.ticker, duration)
+            last_open_time = self.get_klines_db().select_last_open_time(self.ticker, duration)
+        except Exception as sql_exception:
+            self.logger.error("Klines haven't been read from the database", exc_info=sql_exception)
+            last_open_time = klines_file.last_open_time
+        window_start = now - (history_length + 1) * interval_ms
+        if last_open_time is not None and last_open_time + 1 >= window_start:
+            # Klines received from the stream exist only in the cache, they are downloaded again for the table
+            start_time = last_open_time + 1
+        else:
+            # Stored klines are too old to be continued
+            start_time = window_start
+        downloaded = self.get_klines_downloader().fetch(self.ticker, duration, start_time, now)
+        if downloaded:
+            try:
+                self.get_klines_db().upsert_data(self.ticker, downloaded, duration)
+            except Exception as sql_exception:
+                self.logger.error("Klines haven't been saved in the database", exc_info=sql_exception)
+            klines_file.append_rows(downloaded)
+
+        return self.__fill_buffer(klines_file, window_start, history_length, len(downloaded))
+
+    def get_checkpoint_data(self, checkpoint_open_time: int) -> KlineBuffer:
+        """
+        Fills the buffer with the last klines of the ticker from the local cache file, only the klines after the
+        checkpoint and the cached ones are downloaded from the exchange. They are written to the cache, the klines
+        table catches up on a start without a checkpoint or with ingest_klines.py
+        :param checkpoint_open_time: Open time of the last kline of the checkpoint
+        :return: Buffer filled with the klines
+        """
+        duration = self.macd_config[self.ticker]['klines_duration']
+        history_length = int(self.macd_config[self.ticker].get('history_length', self.HISTORY_LENGTH))
+        now = int(time.time() * 1000)
+        klines_file = self.get_klines_cache().file(self.ticker, duration)
+        last_open_time = max(checkpoint_open_time, klines_file.last_open_time or 0)
+        downloaded = self.get_klines_downloader().fetch(self.ticker, duration, last_open_time + 1, now)
+        if downloaded:
+            klines_file.append_rows(downloaded)
+        window_start = now - (history_length + 1) * INTERVALS_MS[duration]
+        return self.__fill_buffer(klines_file, window_start, history_length, len(downloaded))
+
+    def __fill_buffer(self, klines_file, window_start: int, history_length: int, downloaded: int) -> KlineBuffer:
+        klines = klines_file.slice(window_start)
+        self.logger.info(f"Start data: {len(klines['open_time'])} klines, {downloaded} from the exchange")
+        buffer = KlineBuffer(history_length)
+        buffer.extend(klines["open_time"], klines["close"], klines["close_time"])
+        return buffer
+
+
+class StrategyRunner:
+    """
+    Runs the strategies of several tickers in one process over one combined klines stream
+    """
+
+    def __init__(self, tickers: list, strategy_class=Strategy):
+        self.logger = general_logger.get_logger("Strategy Runner", "runner")
+        self.strategies = {}
+        for ticker in tickers:
+            strategy = strategy_class(ticker)
+            self.strategies[strategy.stream_name] = strategy
+        self.logger.info(f"Strategies have been started for {len(self.strategies)} tickers")
+
+    def message_handler(self, message: dict) -> None:
         """
-        Queries the exchange for the last 1000 values of klines for the desired ticker and converts them to NumpyArray
-        :return: Received value in the form of NumpyArray
+        Callback function for the combined WebSockets stream, dispatches messages to the strategy of the ticker
+        :param message: Message from the exchange
         """
-        required_ts = int(datetime.datetime.timestamp(
-            datetime.datetime.now() - datetime.timedelta(seconds=datetime.datetime.now().second))
-        ) * 1000
-        base_klines_url = f"https://api.binance.com/api/v3/klines?symbol={self.ticker}"
-        downloading_url = base_klines_url + f"&interval={self.macd_config[self.ticker]['klines_duration']}" \
-                                            f"&endTime={required_ts}" \
-                                            f"&limit=1000"
-        response = requests.get(downloading_url).json()
-        clear_klines = [[int(row[0]), row[1], row[4], int(row[6])] for row in response]
-        sorted_klines_list = sorted(clear_klines, key=lambda x: x[0])
-        return np.asarray([float(close[2]) for close in sorted_klines_list])
+        if "stream" not in message.keys():
+            return None
+        strategy = self.strategies.get(message["stream"])
+        if strategy is None:
+            self.logger.warning(f"Message from unknown stream {message['stream']}")
+            return None
+        try:
+            strategy.price_handler(message["data"])
+        except Exception as strategy_exception:
+            strategy.logger.error("Error during handling kline", exc_info=strategy_exception)
+
+    def price_stream(self) -> None:
+        Strategy.combined_price_stream(list(self.strategies.keys()), self.message_handler)
 
 
 @click.command()
-@click.argument("ticker")
-def run(ticker):
-    bot = Strategy(ticker.upper())
-    bot.price_stream()
+@click.argument("tickers", nargs=-1)
+@click.option("--all", "all_tickers", is_flag=True, help="Run every ticker from configs/macd_config.json")
+@click.option("--metrics-port", default=None, type=int, help="Port of the local latency metrics endpoint")
+@click.option("--metrics-interval", default=300, help="Interval of the latency summary log in seconds, 0 - off")
+@click.option("--async", "async_mode", is_flag=True, help="Run the strategies on one asyncio event loop")
+def run(tickers, all_tickers, metrics_port, metrics_interval, async_mode):
+    if all_tickers:
+        tickers = list(Strategy.read_macd_config().keys())
+    tickers = [ticker.upper() for ticker in tickers]
+    if len(tickers) == 0:
+        raise click.UsageError("Specify at least one ticker or --all")
+    if metrics_port is not None:
+        latency.serve(metrics_port)
+    if metrics_interval > 0:
+        latency.start_reporting(metrics_interval)
+    if async_mode:
+        # Imported here, the asyncio variant builds on this module
+        from async_trading import AsyncStrategyRunner
+        asyncio.run(AsyncStrategyRunner(tickers).run())
+    elif len(tickers) == 1:
+        bot = Strategy(tickers[0])
+        bot.price_stream()
+    else:
+        runner = StrategyRunner(tickers)
+        runner.price_stream()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,236 @@
+import asyncio
+import atexit
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+from decimal import Decimal
+from threading import Event, Lock, Thread
+
+import general_logger
+
+
+class OrderFillTracker:
+    """
+    Resolves per-order waiters from ORDER_TRADE_UPDATE events. Final updates of orders nobody waits for yet are kept
+    for a while, because the event may come before the REST response with the order ID
+    """
+    FINAL_STATUSES = ("FILLED", "CANCELED", "EXPIRED")
+
+    def __init__(self, keep_finished: int = 1000):
+        self.__keep_finished = keep_finished
+        self.__lock = Lock()
+        self.__waiters = {}
+        self.__finished = OrderedDict()
+
+    def update(self, order: dict) -> None:
+        """
+        Handles the order part of ORDER_TRADE_UPDATE event
+        :param order: Order info from the event ('o' key)
+        """
+        if order['X'] not in self.FINAL_STATUSES:
+            return None
+        result = {
+            "orderId": order['i'],
+            "status": order['X'],
+            "avgPrice": order['ap'],
+            "executedQty": order['z'],
+            "updateTime": order['T']
+        }
+        with self.__lock:
+            waiter = self.__waiters.get(order['i'])
+            if waiter is None:
+                self.__finished[order['i']] = result
+                while len(self.__finished) > self.__keep_finished:
+                    self.__finished.popitem(last=False)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(result)
+
+    def wait(self, order_id: int, timeout: float) -> dict | None:
+        """
+        Waits for the final update of the order
+        :param order_id: Order's ID
+        :param timeout: Maximal waiting time in seconds
+        :return: Order's info or None if there was no final update in time
+        """
+        finished, waiter = self.__waiter(order_id)
+        if finished is not None:
+            return finished
+        try:
+            return waiter.result(timeout)
+        except TimeoutError:
+            return None
+        finally:
+            self.__release(order_id, waiter)
+
+    async def wait_async(self, order_id: int, timeout: float) -> dict | None:
+        """
+        The same as wait for coroutines, the event loop isn't blocked while waiting
+        """
+        finished, waiter = self.__waiter(order_id)
+        if finished is not None:
+            return finished
+        try:
+            # The waiter stays pending after the timeout, the next wait receives the update
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.__release(order_id, waiter)
+
+    def __waiter(self, order_id: int) -> tuple[dict | None, Future | None]:
+        with self.__lock:
+            if order_id in self.__finished:
+                return self.__finished.pop(order_id), None
+            return None, self.__waiters.setdefault(order_id, Future())
+
+    def __release(self, order_id: int, waiter: Future) -> None:
+        with self.__lock:
+            if waiter.done():
+                self.__waiters.pop(order_id, None)
+
+    def forget(self, order_id: int) -> None:
+        with self.__lock:
+            self.__waiters.pop(order_id, None)
+            self.__finished.pop(order_id, None)
+
+
+class OrderTradesTracker:
+    """
+    Accumulates commissions and realized profit of order executions from ORDER_TRADE_UPDATE events
+    """
+
+    def __init__(self, keep_orders: int = 5000):
+        self.__keep_orders = keep_orders
+        self.__lock = Lock()
+        self.__orders = OrderedDict()
+
+    def update(self, order: dict) -> None:
+        """
+        Handles the order part of ORDER_TRADE_UPDATE event
+        :param order: Order info from the event ('o' key)
+        """
+        if order['x'] != "TRADE":
+            return None
+        with self.__lock:
+            trades = self.__orders.get(order['i'])
+            if trades is None:
+                trades = {"commission": Decimal(0), "realized_pnl": Decimal(0), "filled_qty": Decimal(0),
+                          "complete": False}
+                self.__orders[order['i']] = trades
+                while len(self.__orders) > self.__keep_orders:
+                    self.__orders.popitem(last=False)
+            trades["commission"] += Decimal(order.get('n', "0"))
+            trades["realized_pnl"] += Decimal(order['rp'])
+            trades["filled_qty"] += Decimal(order['l'])
+            trades["complete"] = order['X'] == "FILLED"
+
+    def get(self, order_id: int) -> dict | None:
+        """
+        :return: Accumulated trades of the order if the order is completely filled, otherwise None
+        """
+        with self.__lock:
+            trades = self.__orders.get(order_id)
+            if trades is None or not trades["complete"]:
+                return None
+            return dict(trades)
+
+    def forget(self, order_id: int) -> None:
+        with self.__lock:
+            self.__orders.pop(order_id, None)
+
+
+class UserDataStream:
+    """
+    Account-level user data stream. One listen key, one renewal thread and one WebSockets subscription are shared
+    by all connectors of the process, order events are routed to the connector of their symbol
+    """
+
+    def __init__(self, futures_client, futures_client_ws, renew_interval: int = 35 * 60):
+        self.logger = general_logger.get_logger("User Data Stream", "user_data_stream")
+        self.__futures_client = futures_client
+        self.__futures_client_ws = futures_client_ws
+        self.__renew_interval = renew_interval
+        self.__handlers = {}
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__renew_thread = None
+        self.listen_key = None
+        self.fills = OrderFillTracker()
+        self.trades = OrderTradesTracker()
+        self.__account_updates = general_logger.MessageSampler(self.logger)
+
+    def register(self, symbol: str, handler) -> None:
+        """
+        Routes order events of the symbol to the handler and starts the stream if it isn't started yet
+        :param symbol: Ticker name
+        :param handler: Callback function for ORDER_TRADE_UPDATE events of the symbol
+        """
+        with self.__lock:
+            self.__handlers[symbol] = handler
+            if self.listen_key is None:
+                self.start()
+
+    def unregister(self, symbol: str) -> None:
+        with self.__lock:
+            self.__handlers.pop(symbol, None)
+
+    def start(self) -> None:
+        self.listen_key = self.__futures_client.new_listen_key()['listenKey']
+        self.__stopped.clear()
+        self.__renew_thread = Thread(target=self.__renew_listen_key, name="ListenKeyRenewal", daemon=True)
+        self.__renew_thread.start()
+        self.__futures_client_ws.start()
+        self.__futures_client_ws.user_data(
+            listen_key=self.listen_key,
+            id=1,
+            callback=self.message_handler,
+        )
+        atexit.register(self.stop)
+        self.logger.info("User Data Stream have been started")
+
+    def stop(self) -> None:
+        """
+        Stops the renewal thread and closes the listen key
+        """
+        if self.listen_key is None:
+            return None
+        self.__stopped.set()
+        if self.__renew_thread is not None:
+            self.__renew_thread.join()
+        try:
+            self.__futures_client.close_listen_key(listenKey=self.listen_key)
+        except Exception as binance_exception:
+            self.logger.warning("Listen key hasn't been closed", exc_info=binance_exception)
+        self.listen_key = None
+        atexit.unregister(self.stop)
+        self.logger.info("User Data Stream have been stopped")
+
+    def message_handler(self, message: dict) -> None:
+        """
+        Callback function for WebSockets stream
+        :param message: Message from the exchange
+        """
+        if 'e' not in message.keys():
+            return None
+        if message['e'] == 'ORDER_TRADE_UPDATE':
+            self.fills.update(message['o'])
+            self.trades.update(message['o'])
+            handler = self.__handlers.get(message['o']['s'])
+            if handler is not None:
+                handler(message)
+        elif message['e'] == 'ACCOUNT_UPDATE':
+            self.__account_updates.log(message['e'], message)
+        elif message['e'] == 'listenKeyExpired':
+            self.logger.warning("Listen key has expired. Subscribing with a new one")
+            self.listen_key = self.__futures_client.new_listen_key()['listenKey']
+            self.__futures_client_ws.user_data(
+                listen_key=self.listen_key,
+                id=1,
+                callback=self.message_handler,
+            )
+
+    def __renew_listen_key(self) -> None:
+        while not self.__stopped.wait(self.__renew_interval):
+            try:
+                self.__futures_client.renew_listen_key(listenKey=self.listen_key)
+            except Exception as binance_exception:
+                self.logger.error("Listen key hasn't been renewed", exc_info=binance_exception)